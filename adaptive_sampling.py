@@ -0,0 +1,109 @@
+import logging
+import numpy as np
+
+# Inférence adaptative: Holistic n'est lancé sur une piste que si sa boîte a assez bougé depuis la
+# dernière image inférée, ou si l'écart avec celle-ci atteint max_stride images. Les images sautées
+# sont reconstituées par interpolation linéaire des positions entre les deux images inférées qui
+# les encadrent, et marquées comme interpolées.
+
+INFER, SKIP, PROBE = 'infer', 'skip', 'probe'
+
+def box_motion(box, ref_box):
+    """Déplacement maximal d'un coin de la boîte, relatif à la diagonale de la boîte de référence."""
+    box, ref_box = np.asarray(box, dtype=np.float64), np.asarray(ref_box, dtype=np.float64)
+    diagonal = np.hypot(ref_box[2] - ref_box[0], ref_box[3] - ref_box[1])
+    return np.abs(box - ref_box).max() / max(diagonal, 1.0)
+
+class AdaptiveSampler:
+    """
+    Décide pour chaque (piste, image) s'il faut lancer l'inférence.
+    probe_every > 0: une image sautée sur probe_every est quand même inférée ("sonde") pour mesurer
+    l'erreur d'interpolation, sans que son résultat serve d'image clé.
+    """
+
+    def __init__(self, motion_threshold=0.02, max_stride=5, probe_every=0):
+        self.motion_threshold = motion_threshold
+        self.max_stride = max(1, max_stride)
+        self.probe_every = probe_every
+        self.last_keyframe = {}  # piste -> (image, boîte) de la dernière inférence réussie
+        self.decisions = {INFER: 0, SKIP: 0, PROBE: 0}
+
+    def decide(self, track_id, frame_num, box):
+        last = self.last_keyframe.get(track_id)
+        decision = INFER
+        if last is not None and frame_num - last[0] < self.max_stride and box_motion(box, last[1]) <= self.motion_threshold:
+            decision = SKIP
+            if self.probe_every and (self.decisions[SKIP] + self.decisions[PROBE] + 1) % self.probe_every == 0:
+                decision = PROBE
+        self.decisions[decision] += 1
+        return decision
+
+    def keyframe_done(self, track_id, frame_num, box):
+        """À appeler quand l'inférence d'une image clé a trouvé une pose."""
+        self.last_keyframe[track_id] = (frame_num, box)
+
+    def __str__(self):
+        total = sum(self.decisions.values())
+        run = self.decisions[INFER] + self.decisions[PROBE]
+        ratio = total / run if run else 0.0
+        return (f"Inférence adaptative: {run}/{total} crops inférés ({ratio:.1f}x moins d'appels), "
+                f"{self.decisions[SKIP]} interpolés, {self.decisions[PROBE]} sondes")
+
+class KeyframeInterpolator:
+    """
+    Reçoit dans l'ordre les images clés et les images sautées de chaque piste, et transmet à
+    emit(track_id, frames, landmarks, boxes, inferred, times) des images complètes, en interpolant les
+    images sautées (selon leur horodatage) dès que l'image clé suivante est connue. Les images sautées après la dernière
+    image clé d'une piste reprennent sa valeur. Les sondes mesurent l'erreur d'interpolation.
+    """
+
+    def __init__(self, emit, error_slice=slice(None)):
+        self.emit = emit
+        self.error_slice = error_slice   # Landmarks utilisés pour la mesure d'erreur (ex: pose)
+        self.last_key = {}                # piste -> (horodatage, landmarks)
+        self.pending = {}                 # piste -> [(image, horodatage, boîte, landmarks de la sonde ou None)]
+        self.errors = []
+
+    def keyframe(self, track_id, frame_num, time_ms, box, landmarks):
+        pending = self.pending.pop(track_id, [])
+        if pending:
+            start = self.last_key.get(track_id, (time_ms, landmarks))
+            self._emit_interpolated(track_id, pending, start, (time_ms, landmarks))
+        self.emit(track_id, [frame_num], landmarks[None], np.asarray(box, dtype=np.float32)[None], np.ones(1, dtype=np.uint8), [time_ms])
+        self.last_key[track_id] = (time_ms, landmarks)
+
+    def skipped(self, track_id, frame_num, time_ms, box, probe_landmarks=None):
+        if track_id not in self.last_key: return
+        self.pending.setdefault(track_id, []).append((frame_num, time_ms, box, probe_landmarks))
+
+    def _emit_interpolated(self, track_id, pending, start, end):
+        frames = np.array([p[0] for p in pending])
+        times = np.array([p[1] for p in pending], dtype=np.float64)
+        (t0, lm0), (t1, lm1) = start, end
+        weights = (times - t0) / (t1 - t0) if t1 != t0 else np.zeros(len(frames))
+        landmarks = ((1.0 - weights)[:, None, None] * lm0 + weights[:, None, None] * lm1).astype(np.float32)
+        for (_, _, _, probe), interpolated in zip(pending, landmarks):
+            if probe is not None:
+                diff = probe[self.error_slice, :3] - interpolated[self.error_slice, :3]
+                self.errors.extend(np.linalg.norm(diff, axis=-1)[~np.isnan(diff).any(axis=-1)].tolist())
+        boxes = np.array([p[2] for p in pending], dtype=np.float32)
+        self.emit(track_id, frames, landmarks, boxes, np.zeros(len(frames), dtype=np.uint8), times)
+
+    def get_state(self):
+        """État à sauvegarder dans un checkpoint (images clés et images sautées en attente)."""
+        return {'last_key': self.last_key, 'pending': self.pending, 'errors': self.errors}
+
+    def set_state(self, state):
+        self.last_key, self.pending, self.errors = state['last_key'], state['pending'], state['errors']
+
+    def finish(self):
+        for track_id, pending in self.pending.items():
+            last = self.last_key[track_id]
+            self._emit_interpolated(track_id, pending, last, last)
+        self.pending = {}
+
+    def log_errors(self):
+        if not self.errors: return
+        errors = np.asarray(self.errors)
+        logging.info(f"Erreur d'interpolation mesurée sur {len(errors)} points sondés: moyenne {errors.mean():.4f}, "
+                     f"p95 {np.percentile(errors, 95):.4f}, max {errors.max():.4f}")
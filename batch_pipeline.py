@@ -0,0 +1,240 @@
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from concurrent.futures.process import BrokenProcessPool
+
+# Traitement d'un lot de vidéos sur un pool de processus. Chaque processus charge ses modèles
+# (YOLO, MediaPipe) une seule fois, à son démarrage, et les garde pour toutes les vidéos qu'il traite.
+# Une vidéo en échec est relancée (au plus --retries fois) sans arrêter les autres.
+
+VIDEO_EXTENSIONS = ('.mp4', '.mov', '.avi', '.mkv', '.webm', '.m4v')
+
+# Réglages d'une vidéo, modifiables vidéo par vidéo dans le manifeste
+# (gating: dict d'options de filtrage des pistes, voir track_gating.GATING_DEFAULTS;
+#  detector: dict d'options du détecteur, voir detectors.DETECTOR_DEFAULTS)
+JOB_DEFAULTS = {'start_time': None, 'end_time': None, 'conf': 0.5, 'profile': 'pose', 'model_complexity': 2, 'detect_every': 1, 'sample_fps': None,
+                'gating': None, 'detector': None, 'mincutoff': 1.0, 'beta': 0.0, 'key_tolerance': None, 'export_animation': []}
+
+_MODELS = None # Modèles résidents du processus de travail
+
+def setup_logging():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s', datefmt='%Y-%m-%d %H:%M:%S')
+
+def load_jobs(source, defaults):
+    """
+    Liste des vidéos à traiter: toutes les vidéos d'un dossier, ou un manifeste JSON, liste d'entrées
+    {"video": chemin, ...réglages de JOB_DEFAULTS} (ou simples chemins). Les chemins relatifs du manifeste
+    sont relatifs à son dossier. Chaque vidéo reçoit un nom unique, préfixe de ses fichiers de sortie.
+    """
+    if os.path.isdir(source):
+        entries = [{'video': os.path.join(source, name)} for name in sorted(os.listdir(source))
+                   if name.lower().endswith(VIDEO_EXTENSIONS)]
+    else:
+        with open(source, 'r') as f: entries = json.load(f)
+        base_dir = os.path.dirname(os.path.abspath(source))
+        entries = [{'video': entry} if isinstance(entry, str) else dict(entry) for entry in entries]
+        for entry in entries: entry['video'] = os.path.join(base_dir, entry['video'])
+    jobs, names = [], set()
+    for entry in entries:
+        unknown = set(entry) - set(JOB_DEFAULTS) - {'video', 'name'}
+        if unknown: raise ValueError(f"Réglages inconnus pour {entry['video']}: {sorted(unknown)}")
+        job = dict(defaults, **entry)
+        name = job.get('name') or os.path.splitext(os.path.basename(job['video']))[0]
+        unique, index = name, 1
+        while unique in names:
+            index += 1
+            unique = f"{name}_{index}"
+        names.add(unique)
+        job['name'] = unique
+        jobs.append(job)
+    return jobs
+
+def _init_worker(n_threads, detector=None):
+    """Initialisation d'un processus de travail: threads limités, modèles chargés une fois pour toutes (detector: options du détecteur préchargé)."""
+    global _MODELS
+    import cv2
+    cv2.setNumThreads(1)
+    setup_logging()
+    from extract_motion import ResidentModels
+    # Les threads d'inférence passent par les options du détecteur: torch n'est importé que par le backend ultralytics
+    _MODELS = ResidentModels(threads=n_threads)
+    _MODELS.detector(detector)
+
+def process_video(job, output_dir):
+    """
+    Extraction, lissage et rotations d'une vidéo avec les modèles résidents du processus.
+    Sauvegarde les fichiers .motion de chaque étape (et les exports demandés) et retourne un résumé.
+    """
+    from extract_motion import extract_tracks
+    from smoother import smooth_tracks
+    from calculate_rotations import compute_rotations
+    from motion_io import save_motion
+    t0 = time.perf_counter()
+    paths = {stage: os.path.join(output_dir, f"{job['name']}_{stage}.motion") for stage in ('raw', 'smoothed', 'rotations')}
+    result = extract_tracks(job['video'], job['start_time'], job['end_time'], conf=job['conf'], output_path=paths['raw'],
+                            profile=job['profile'], model_complexity=job['model_complexity'], detect_every=job['detect_every'],
+                            sample_fps=job['sample_fps'], gating=job['gating'], detector=job['detector'], models=_MODELS)
+    if result is None: raise RuntimeError(f"Extraction impossible: {job['video']}")
+    smoothed = smooth_tracks(*result, mincutoff=job['mincutoff'], beta=job['beta'])
+    save_motion(paths['smoothed'], *smoothed)
+    rotations = compute_rotations(*smoothed, key_tolerance=job['key_tolerance'])
+    save_motion(paths['rotations'], *rotations)
+    outputs = list(paths.values())
+    if job['export_animation']:
+        from export_animation import export_tracks
+        for fmt in job['export_animation']:
+            outputs += export_tracks(*rotations, os.path.join(output_dir, f"{job['name']}_animation.{fmt}"))
+    tracks = result[0]
+    return {'frames': sum(len(track['frames']) for track in tracks.values()), 'tracks': len(tracks),
+            'seconds': time.perf_counter() - t0, 'outputs': outputs}
+
+class BatchProgress:
+    """Avancement du lot: vidéos terminées, en échec, images traitées et débit depuis le début."""
+
+    def __init__(self, total):
+        self.total = total
+        self.done = 0
+        self.failed = 0
+        self.frames = 0
+        self.start = time.perf_counter()
+
+    def add(self, summary=None):
+        if summary is None:
+            self.failed += 1
+        else:
+            self.done += 1
+            self.frames += summary['frames']
+
+    def __str__(self):
+        elapsed = time.perf_counter() - self.start
+        finished = self.done + self.failed
+        rate = finished / elapsed * 60 if elapsed > 0 else 0.0
+        eta = (self.total - finished) / finished * elapsed if finished else float('nan')
+        return (f"Lot: {finished}/{self.total} vidéos ({self.done} réussies, {self.failed} en échec) en {elapsed:.0f}s, "
+                f"{rate:.1f} vidéos/min, {self.frames / elapsed if elapsed > 0 else 0.0:.1f} images/s, reste ~{eta:.0f}s")
+
+def run_batch(jobs, output_dir, workers=None, retries=1, detector=None):
+    """
+    Traite les vidéos sur un pool de workers processus, qui préchargent le détecteur décrit par detector. Une vidéo
+    en échec (exception, ou processus de travail mort) est resoumise jusqu'à retries fois.
+    Retourne le rapport {nom: statut, tentatives, résumé ou erreur}.
+    """
+    workers = workers or max(1, (os.cpu_count() or 1) // 2)
+    n_threads = max(1, (os.cpu_count() or 1) // workers)
+    os.makedirs(output_dir, exist_ok=True)
+    report = {job['name']: {'video': job['video'], 'status': 'pending', 'attempts': 0} for job in jobs}
+    progress = BatchProgress(len(jobs))
+    pending = list(jobs)
+    logging.info(f"Lot de {len(jobs)} vidéos sur {workers} processus ({n_threads} threads chacun).")
+
+    # spawn: chaque processus charge proprement ses propres modèles (torch ne supporte pas bien fork)
+    context = multiprocessing.get_context('spawn')
+    # Un processus de travail mort casse tout le pool, et toutes les vidéos en cours reçoivent BrokenProcessPool:
+    # on ne sait pas laquelle l'a tué. Ces vidéos ne sont pas comptées comme une tentative; elles sont relancées
+    # une par une, seules dans un pool d'un processus (isolated), où un nouveau plantage est imputable à la vidéo.
+    # Pour que seules les vidéos réellement en cours soient isolées, il n'y a jamais plus d'une vidéo soumise par processus.
+    isolated = []
+    while pending or isolated:
+        alone = not pending # Vidéo isolée: seule dans le pool
+        if alone: batch = [isolated.pop(0)]
+        else: batch, pending = pending, []
+        pool_size = 1 if alone else workers
+        with ProcessPoolExecutor(max_workers=pool_size, mp_context=context, initializer=_init_worker,
+                                 initargs=(n_threads, detector)) as executor:
+            running = {}
+            def submit(job):
+                try:
+                    running[executor.submit(process_video, job, output_dir)] = job
+                    report[job['name']]['attempts'] += 1
+                except BrokenProcessPool:
+                    pending.append(job) # Pas encore lancée: rien à imputer
+            def fill():
+                while batch and len(running) < pool_size: submit(batch.pop(0))
+            fill()
+            while running:
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    job = running.pop(future)
+                    entry = report[job['name']]
+                    try:
+                        entry.update(future.result(), status='done')
+                        entry.pop('error', None)
+                        progress.add(entry)
+                        logging.info(f"Terminé: {job['name']} ({entry['frames']} images, {entry['tracks']} pistes, {entry['seconds']:.1f}s)")
+                    except BrokenProcessPool as e:
+                        entry['error'] = f"Processus de travail arrêté: {e}"
+                        if not alone:
+                            entry['attempts'] -= 1
+                            isolated.append(job)
+                            logging.warning(f"{job['name']} interrompue par l'arrêt d'un processus de travail: relancée seule.")
+                            continue
+                        if entry['attempts'] <= retries:
+                            logging.warning(f"Échec de {job['name']} (tentative {entry['attempts']}): processus de travail arrêté. Nouvelle tentative.")
+                            isolated.append(job)
+                            continue
+                        entry['status'] = 'failed'
+                        progress.add()
+                        logging.error(f"Échec définitif de {job['name']} après {entry['attempts']} tentatives: {entry['error']}")
+                    except Exception as e:
+                        entry['error'] = str(e)
+                        if entry['attempts'] <= retries:
+                            logging.warning(f"Échec de {job['name']} (tentative {entry['attempts']}): {e}. Nouvelle tentative.")
+                            batch.insert(0, job)
+                            fill()
+                            continue
+                        entry['status'] = 'failed'
+                        progress.add()
+                        logging.error(f"Échec définitif de {job['name']} après {entry['attempts']} tentatives: {e}")
+                    logging.info(str(progress))
+                fill()
+
+    logging.info(str(progress))
+    return report
+
+def main():
+    from track_gating import add_gating_arguments, gating_options
+    from detectors import add_detector_arguments, detector_options
+    parser = argparse.ArgumentParser(description="Traite un lot de vidéos (extraction, lissage, rotations) sur un pool de processus aux modèles résidents.")
+    parser.add_argument("--input", required=True, help="Dossier de vidéos, ou manifeste JSON (liste de chemins ou d'objets {\"video\", réglages...}).")
+    parser.add_argument("--output_dir", default="output", help="Dossier de sortie.")
+    parser.add_argument("--workers", type=int, default=None, help="Processus de travail (par défaut: la moitié des cœurs).")
+    parser.add_argument("--retries", type=int, default=1, help="Nouvelles tentatives pour une vidéo en échec.")
+    parser.add_argument("--report", default=None, help="Rapport du lot (par défaut: <output_dir>/batch_report.json).")
+    # Réglages par défaut de chaque vidéo (le manifeste peut les remplacer)
+    parser.add_argument("--start_time", help="Début (MM:SS).")
+    parser.add_argument("--end_time", help="Fin (MM:SS).")
+    parser.add_argument("--conf", type=float, default=JOB_DEFAULTS['conf'], help="Seuil de confiance YOLO.")
+    parser.add_argument("--profile", default=JOB_DEFAULTS['profile'], choices=["pose", "pose_hands", "holistic"], help="Profil d'extraction.")
+    parser.add_argument("--model_complexity", type=int, default=JOB_DEFAULTS['model_complexity'], choices=[0, 1, 2], help="Complexité du modèle MediaPipe.")
+    parser.add_argument("--detect_every", type=int, default=JOB_DEFAULTS['detect_every'], help="Lance le détecteur YOLO une image sur N.")
+    parser.add_argument("--sample_fps", type=float, default=JOB_DEFAULTS['sample_fps'], help="Cadence d'analyse (images/s; par défaut: toutes les images).")
+    add_gating_arguments(parser)
+    add_detector_arguments(parser)
+    parser.add_argument("--mincutoff", type=float, default=JOB_DEFAULTS['mincutoff'], help="Lissage: fréquence de coupure minimale.")
+    parser.add_argument("--beta", type=float, default=JOB_DEFAULTS['beta'], help="Lissage: paramètre beta du filtre.")
+    parser.add_argument("--key_tolerance", type=float, default=JOB_DEFAULTS['key_tolerance'], help="Réduit les rotations aux images clés (erreur maximale en degrés).")
+    parser.add_argument("--export_animation", nargs="+", default=[], choices=["bvh", "gltf", "glb"], help="Exporte aussi l'animation (sans Blender).")
+    args = parser.parse_args()
+    setup_logging()
+
+    args.gating = gating_options(args)
+    args.detector = detector_options(args)
+    defaults = {key: getattr(args, key) for key in JOB_DEFAULTS}
+    jobs = load_jobs(args.input, defaults)
+    if not jobs:
+        logging.error(f"Aucune vidéo trouvée dans: {args.input}")
+        raise SystemExit(1)
+    report = run_batch(jobs, args.output_dir, args.workers, args.retries, args.detector)
+
+    report_path = args.report or os.path.join(args.output_dir, "batch_report.json")
+    with open(report_path, 'w') as f: json.dump(report, f, indent=4)
+    logging.info(f"Rapport du lot sauvegardé dans: {report_path}")
+    if any(entry['status'] != 'done' for entry in report.values()):
+        raise SystemExit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,208 @@
+import os
+import sys
+import json
+import time
+import shutil
+import logging
+import argparse
+import tempfile
+import tracemalloc
+import numpy as np
+from motion_io import LANDMARK_GROUPS, landmarks_meta, load_motion, save_motion
+
+# Benchmark des étapes de post-traitement (lissage, rotations) et de la sérialisation des données,
+# sur des pistes synthétiques. Chaque mesure est le meilleur temps sur plusieurs répétitions; le pic
+# mémoire est mesuré dans une exécution séparée (tracemalloc ralentit le code mesuré). Les résultats
+# peuvent être sauvegardés comme référence, puis comparés pour détecter une régression.
+
+def setup_logging():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s', datefmt='%Y-%m-%d %H:%M:%S')
+
+# Pose de repos approximative (landmarks "world" de MediaPipe Pose: mètres, origine au bassin, y vers le bas)
+POSE_REST = np.array([
+    [0.00, -0.62, -0.05], [0.01, -0.65, -0.06], [0.03, -0.65, -0.06], [0.04, -0.65, -0.05],  # nez, œil gauche
+    [-0.01, -0.65, -0.06], [-0.03, -0.65, -0.06], [-0.04, -0.65, -0.05],                      # œil droit
+    [0.07, -0.63, 0.00], [-0.07, -0.63, 0.00], [0.02, -0.58, -0.05], [-0.02, -0.58, -0.05],   # oreilles, bouche
+    [0.18, -0.45, 0.00], [-0.18, -0.45, 0.00], [0.22, -0.20, 0.02], [-0.22, -0.20, 0.02],     # épaules, coudes
+    [0.24, 0.02, 0.00], [-0.24, 0.02, 0.00], [0.25, 0.08, 0.00], [-0.25, 0.08, 0.00],         # poignets, auriculaires
+    [0.24, 0.09, -0.01], [-0.24, 0.09, -0.01], [0.22, 0.06, -0.02], [-0.22, 0.06, -0.02],     # index, pouces
+    [0.10, 0.00, 0.00], [-0.10, 0.00, 0.00], [0.11, 0.42, 0.00], [-0.11, 0.42, 0.00],         # hanches, genoux
+    [0.11, 0.82, 0.03], [-0.11, 0.82, 0.03], [0.11, 0.86, 0.06], [-0.11, 0.86, 0.06],         # chevilles, talons
+    [0.11, 0.88, -0.10], [-0.11, 0.88, -0.10],                                                # pointes des pieds
+])
+# Membres animés par un balancement de marche: (articulation pivot, points entraînés, signe de la phase)
+SWINGS = [(11, [13, 15, 17, 19, 21], -1.0), (12, [14, 16, 18, 20, 22], 1.0),
+          (23, [25, 27, 29, 31], 1.0), (24, [26, 28, 30, 32], -1.0)]
+
+def _face_rest(rng):
+    """468 points sur une demi-ellipsoïde (coordonnées normalisées dans le crop)."""
+    theta, phi = rng.uniform(-1.3, 1.3, 468), rng.uniform(-1.2, 1.2, 468)
+    return np.stack([0.5 + 0.12 * np.sin(theta), 0.25 + 0.16 * np.sin(phi), -0.05 * np.cos(theta) * np.cos(phi)], axis=1)
+
+def _hand_rest():
+    """Poignet puis 5 doigts de 4 articulations, en éventail (coordonnées normalisées)."""
+    points = [[0.0, 0.0, 0.0]]
+    for finger in range(5):
+        angle = np.radians(-40 + 20 * finger)
+        for joint in range(1, 5):
+            points.append([0.03 * joint * np.sin(angle), -0.03 * joint * np.cos(angle), -0.005 * joint])
+    return np.array(points)
+
+def synthetic_tracks(n_people, n_frames, fps=30.0, seed=0, dropout=0.05):
+    """
+    Génère (tracks, meta) au format de l'extraction: N personnes suivies sur M images, avec des
+    landmarks Holistic (33 pose, 468 visage, 21 par main) animés par un cycle de marche bruité.
+    Le visage et les mains disparaissent par intervalles (NaN), comme quand MediaPipe les perd.
+    """
+    rng = np.random.default_rng(seed)
+    meta = landmarks_meta(LANDMARK_GROUPS, fps=fps, columns=['boxes', 'inferred'], source="synthetic")
+    n_landmarks = meta['arrays']['landmarks']['shape'][0]
+    face_rest, hand_rest = _face_rest(rng), _hand_rest()
+    tracks = {}
+    for person in range(n_people):
+        t = np.arange(n_frames) / fps
+        phase = 2 * np.pi * rng.uniform(0.8, 1.2) * t + rng.uniform(0, 2 * np.pi)
+
+        pose = np.repeat(POSE_REST[None], n_frames, axis=0)
+        for pivot, joints, sign in SWINGS:
+            # Rotation autour de l'axe x du pivot (balancement avant / arrière)
+            angle = sign * 0.4 * np.sin(phase)
+            offsets = pose[:, joints] - POSE_REST[pivot]
+            cos, sin = np.cos(angle)[:, None], np.sin(angle)[:, None]
+            y, z = offsets[..., 1], offsets[..., 2]
+            pose[:, joints, 1] = POSE_REST[pivot, 1] + cos * y - sin * z
+            pose[:, joints, 2] = POSE_REST[pivot, 2] + sin * y + cos * z
+        pose[:, :, 0] += 0.02 * np.sin(phase / 2)[:, None]
+        pose += rng.normal(0, 0.005, pose.shape)
+
+        face = face_rest[None] + 0.01 * np.sin(phase)[:, None, None] + rng.normal(0, 0.002, (n_frames, 468, 3))
+        hands = [hand_rest[None] + np.array([0.3 + 0.4 * side, 0.6, 0.0]) + 0.02 * np.sin(phase + side)[:, None, None]
+                 + rng.normal(0, 0.002, (n_frames, 21, 3)) for side in (0, 1)]
+
+        landmarks = np.empty((n_frames, n_landmarks, 4), dtype=np.float32)
+        landmarks[:, :, :3] = np.concatenate([pose, face] + hands, axis=1)
+        landmarks[:, :, 3] = rng.uniform(0.5, 1.0, (n_frames, n_landmarks))
+        start = 0
+        for name, count in LANDMARK_GROUPS:
+            if name != 'pose':
+                # Intervalles de perte de 5 à 30 images
+                lost = np.zeros(n_frames, dtype=bool)
+                for begin in np.flatnonzero(rng.random(n_frames) < dropout / 15):
+                    lost[begin:begin + rng.integers(5, 30)] = True
+                landmarks[lost, start:start + count] = np.nan
+            start += count
+
+        center = np.array([300 + 200 * person, 400]) + 20 * np.stack([np.sin(phase / 4), np.cos(phase / 4)], axis=1)
+        boxes = np.concatenate([center - [80, 220], center + [80, 220]], axis=1).astype(np.float32)
+        tracks[str(person + 1)] = {
+            'frames': np.arange(1, n_frames + 1, dtype=np.int32) + 10 * person,
+            'landmarks': landmarks, 'boxes': boxes, 'inferred': np.ones(n_frames, dtype=np.uint8),
+        }
+    return tracks, meta
+
+def _read_all(result):
+    """Force la lecture de toutes les colonnes (les memmaps ne lisent le disque qu'à l'accès)."""
+    tracks, _ = result
+    return sum(float(np.nansum(column)) for track in tracks.values() for column in track.values())
+
+def benchmark_cases(tracks, meta, work_dir, with_json=True):
+    """Étapes mesurées: {nom: fonction sans argument}. Les entrées sont préparées hors mesure."""
+    from smoother import smooth_tracks
+    from calculate_rotations import compute_rotations
+    smoothed = smooth_tracks(tracks, meta)
+    motion_path = os.path.join(work_dir, "bench.motion")
+    json_path = os.path.join(work_dir, "bench.json")
+    save_motion(motion_path, *smoothed)
+    cases = {
+        'smoothing': lambda: smooth_tracks(tracks, meta),
+        'rotations': lambda: compute_rotations(*smoothed),
+        'motion_write': lambda: save_motion(os.path.join(work_dir, "out.motion"), *smoothed),
+        'motion_read': lambda: _read_all(load_motion(motion_path)),
+    }
+    if with_json:
+        save_motion(json_path, *smoothed)
+        cases['json_write'] = lambda: save_motion(os.path.join(work_dir, "out.json"), *smoothed)
+        cases['json_read'] = lambda: _read_all(load_motion(json_path))
+    return cases
+
+def measure(func, repeat):
+    """Meilleur temps sur `repeat` exécutions, puis pic mémoire (Mo) d'une exécution sous tracemalloc."""
+    best = float('inf')
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - t0)
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return best, peak / 1e6
+
+def run_benchmarks(people, frames_list, repeat=3, json_max_frames=1000, seed=0):
+    """
+    Mesure chaque étape pour chaque taille. Retourne {"étape@<personnes>x<images>": résultats}.
+    Le JSON, plusieurs ordres de grandeur plus lent, n'est mesuré que jusqu'à json_max_frames images.
+    """
+    results = {}
+    work_dir = tempfile.mkdtemp(prefix="motion_bench_")
+    logging.disable(logging.INFO)  # Les étapes journalisent chaque piste
+    try:
+        for n_frames in frames_list:
+            tracks, meta = synthetic_tracks(people, n_frames, seed=seed)
+            total_frames = people * n_frames
+            for stage, func in benchmark_cases(tracks, meta, work_dir, n_frames <= json_max_frames).items():
+                seconds, peak_mb = measure(func, repeat)
+                results[f"{stage}@{people}x{n_frames}"] = {
+                    'seconds': seconds, 'frames_per_second': total_frames / seconds if seconds > 0 else float('inf'), 'peak_mb': peak_mb,
+                }
+    finally:
+        logging.disable(logging.NOTSET)
+        shutil.rmtree(work_dir, ignore_errors=True)
+    return results
+
+def log_results(results):
+    logging.info(f"{'Étape':<28}{'Temps (s)':>12}{'Images/s':>14}{'Pic (Mo)':>12}")
+    for name, r in results.items():
+        logging.info(f"{name:<28}{r['seconds']:>12.4f}{r['frames_per_second']:>14.0f}{r['peak_mb']:>12.1f}")
+
+def compare(results, baseline, max_regression):
+    """Compare les temps à la référence. Retourne la liste des étapes plus lentes de plus de max_regression %."""
+    regressions = []
+    for name, r in results.items():
+        ref = baseline['results'].get(name)
+        if ref is None:
+            logging.info(f"{name}: absent de la référence.")
+            continue
+        change = (r['seconds'] / ref['seconds'] - 1.0) * 100 if ref['seconds'] > 0 else 0.0
+        status = "RÉGRESSION" if change > max_regression else "ok"
+        logging.info(f"{name:<28}{ref['seconds']:>10.4f}s -> {r['seconds']:>8.4f}s ({change:+6.1f}%) {status}")
+        if change > max_regression: regressions.append(name)
+    return regressions
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark du lissage, des rotations et de la sérialisation sur des pistes synthétiques.")
+    parser.add_argument("--people", type=int, default=2, help="Nombre de personnes suivies.")
+    parser.add_argument("--frames", type=int, nargs='+', default=[300, 3000], help="Nombres d'images par piste (une mesure par valeur).")
+    parser.add_argument("--repeat", type=int, default=3, help="Répétitions par étape (le meilleur temps est gardé).")
+    parser.add_argument("--json_max_frames", type=int, default=1000, help="Mesure la sérialisation JSON jusqu'à ce nombre d'images (0: jamais).")
+    parser.add_argument("--save_baseline", default=None, help="Sauvegarde les résultats comme référence (.json).")
+    parser.add_argument("--compare", default=None, help="Compare les résultats à une référence sauvegardée (.json).")
+    parser.add_argument("--max_regression", type=float, default=10.0, help="Ralentissement toléré en mode comparaison, en %%.")
+    args = parser.parse_args()
+    setup_logging()
+
+    results = run_benchmarks(args.people, args.frames, args.repeat, args.json_max_frames)
+    log_results(results)
+
+    if args.save_baseline:
+        config = {'people': args.people, 'frames': args.frames, 'repeat': args.repeat}
+        with open(args.save_baseline, 'w') as f: json.dump({'config': config, 'results': results}, f, indent=4)
+        logging.info(f"Référence sauvegardée dans: {args.save_baseline}")
+
+    if args.compare:
+        with open(args.compare, 'r') as f: baseline = json.load(f)
+        regressions = compare(results, baseline, args.max_regression)
+        if regressions:
+            logging.error(f"{len(regressions)} étape(s) en régression de plus de {args.max_regression}%: {', '.join(regressions)}")
+            sys.exit(1)
+        logging.info("Aucune régression.")
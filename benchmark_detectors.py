@@ -0,0 +1,120 @@
+import json
+import time
+import logging
+import argparse
+import numpy as np
+from detectors import DETECTOR_DEFAULTS, DEFAULT_MODELS, create_detector, describe, iou_matrix
+
+# Benchmark des backends du détecteur de personnes, côte à côte sur les mêmes images d'une vidéo
+# (décodées une fois, avant les mesures). Pour chaque backend: débit de détection (images/s) et latence
+# par image; puis écart de précision par rapport au backend de référence (le premier, ultralytics par
+# défaut): les boîtes de chaque image sont appariées aux boîtes de référence (IoU >= iou_match), ce qui
+# donne le rappel, la précision, l'IoU moyen des paires et l'écart moyen des scores.
+
+def setup_logging():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s', datefmt='%Y-%m-%d %H:%M:%S')
+
+def read_frames(video_path, count=200, start_frame=0, step=1):
+    """count images de la vidéo (BGR), une sur step à partir de start_frame."""
+    import cv2
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened(): raise ValueError(f"Impossible d'ouvrir la vidéo: {video_path}")
+    if start_frame: cap.set(cv2.CAP_PROP_POS_FRAMES, start_frame)
+    frames, index = [], 0
+    while len(frames) < count:
+        ok, frame = cap.read()
+        if not ok: break
+        if index % step == 0: frames.append(frame)
+        index += 1
+    cap.release()
+    return frames
+
+def run_detector(detector, frames, conf, warmup=5):
+    """Détections de chaque image et latences (s) mesurées après warmup images d'échauffement (non comptées)."""
+    for frame in frames[:warmup]: detector.detect(frame, conf)
+    detections, latencies = [], []
+    for frame in frames:
+        t0 = time.perf_counter()
+        detections.append(detector.detect(frame, conf))
+        latencies.append(time.perf_counter() - t0)
+    return detections, np.array(latencies)
+
+def match_detections(boxes, scores, ref_boxes, ref_scores, iou_match=0.5):
+    """Appariement optimal (IoU maximal) des boîtes d'une image avec celles de référence. Retourne (IoU des paires, écarts de score)."""
+    from scipy.optimize import linear_sum_assignment
+    if len(boxes) == 0 or len(ref_boxes) == 0: return np.empty(0), np.empty(0)
+    iou = iou_matrix(boxes, ref_boxes)
+    rows, cols = linear_sum_assignment(-iou)
+    matched = iou[rows, cols] >= iou_match
+    rows, cols = rows[matched], cols[matched]
+    return iou[rows, cols], np.abs(np.asarray(scores)[rows] - np.asarray(ref_scores)[cols])
+
+def accuracy_delta(detections, reference, iou_match=0.5):
+    """Écart aux détections de référence, sur toutes les images: rappel, précision, IoU moyen et écart moyen des scores."""
+    ious, score_deltas, n_boxes, n_ref = [], [], 0, 0
+    for (boxes, scores), (ref_boxes, ref_scores) in zip(detections, reference):
+        pair_iou, delta = match_detections(boxes, scores, ref_boxes, ref_scores, iou_match)
+        ious.append(pair_iou)
+        score_deltas.append(delta)
+        n_boxes += len(boxes)
+        n_ref += len(ref_boxes)
+    ious, score_deltas = np.concatenate(ious), np.concatenate(score_deltas)
+    return {'recall': len(ious) / n_ref if n_ref else 1.0, 'precision': len(ious) / n_boxes if n_boxes else 1.0,
+            'mean_iou': float(ious.mean()) if len(ious) else 0.0, 'mean_score_delta': float(score_deltas.mean()) if len(score_deltas) else 0.0,
+            'boxes': n_boxes, 'reference_boxes': n_ref}
+
+def run_benchmarks(frames, configurations, conf=0.4, warmup=5, iou_match=0.5):
+    """
+    Mesure chaque configuration (dict d'options du détecteur) sur les mêmes images. La première sert de référence
+    pour la précision. Retourne {description: résultats}.
+    """
+    results, reference = {}, None
+    for options in configurations:
+        name = describe(options)
+        detector = create_detector(options)
+        detections, latencies = run_detector(detector, frames, conf, warmup)
+        if reference is None: reference = detections
+        total = latencies.sum()
+        results[name] = dict(options, frames_per_second=len(frames) / total if total > 0 else float('inf'),
+                             p50_ms=float(np.percentile(latencies, 50) * 1e3), p95_ms=float(np.percentile(latencies, 95) * 1e3),
+                             **accuracy_delta(detections, reference, iou_match))
+        del detector
+    return results
+
+def log_results(results):
+    reference = next(iter(results.values()))
+    logging.info(f"{'Détecteur':<44}{'Images/s':>10}{'p50 (ms)':>10}{'p95 (ms)':>10}{'Accél.':>8}{'Rappel':>8}{'Précision':>11}{'IoU':>7}{'Δ score':>9}")
+    for name, r in results.items():
+        speedup = r['frames_per_second'] / reference['frames_per_second'] if reference['frames_per_second'] else 0.0
+        logging.info(f"{name:<44}{r['frames_per_second']:>10.1f}{r['p50_ms']:>10.1f}{r['p95_ms']:>10.1f}{speedup:>7.2f}x"
+                     f"{r['recall']:>8.1%}{r['precision']:>11.1%}{r['mean_iou']:>7.3f}{r['mean_score_delta']:>9.3f}")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Compare les backends du détecteur (débit et écart de précision) sur les images d'une vidéo.")
+    parser.add_argument("--video", required=True, help="Vidéo dont les images sont détectées.")
+    parser.add_argument("--frames", type=int, default=200, help="Nombre d'images mesurées.")
+    parser.add_argument("--start_frame", type=int, default=0, help="Première image lue.")
+    parser.add_argument("--step", type=int, default=1, help="Ne garde qu'une image sur N (images plus variées).")
+    parser.add_argument("--weights", default=DEFAULT_MODELS['ultralytics'], help="Poids du backend ultralytics (référence).")
+    parser.add_argument("--onnx_models", nargs="+", default=[DEFAULT_MODELS['onnx']], help="Modèles ONNX comparés (ex: yolov8n.onnx yolov8n_int8.onnx).")
+    parser.add_argument("--threads", type=int, nargs="+", default=[DETECTOR_DEFAULTS['threads']],
+                        help="Nombres de threads d'inférence essayés pour chaque backend (0: valeur par défaut).")
+    parser.add_argument("--conf", type=float, default=0.4, help="Seuil de confiance des détections.")
+    parser.add_argument("--warmup", type=int, default=5, help="Images d'échauffement par backend, non mesurées.")
+    parser.add_argument("--iou_match", type=float, default=0.5, help="IoU minimal pour apparier une boîte à une boîte de référence.")
+    parser.add_argument("--output", default=None, help="Sauvegarde les résultats (.json).")
+    args = parser.parse_args()
+    setup_logging()
+
+    frames = read_frames(args.video, args.frames, args.start_frame, args.step)
+    if not frames: raise SystemExit(f"Aucune image lue dans: {args.video}")
+    logging.info(f"{len(frames)} images de {args.video} ({frames[0].shape[1]}x{frames[0].shape[0]}).")
+    configurations = [{'backend': 'ultralytics', 'model': args.weights, 'threads': threads} for threads in args.threads]
+    configurations += [{'backend': 'onnx', 'model': model, 'threads': threads} for model in args.onnx_models for threads in args.threads]
+    results = run_benchmarks(frames, configurations, args.conf, args.warmup, args.iou_match)
+    log_results(results)
+
+    if args.output:
+        config = {'video': args.video, 'frames': len(frames), 'conf': args.conf, 'iou_match': args.iou_match, 'reference': describe(configurations[0])}
+        with open(args.output, 'w') as f: json.dump({'config': config, 'results': results}, f, indent=4)
+        logging.info(f"Résultats sauvegardés dans: {args.output}")
@@ -1,8 +1,8 @@
-import json
 import argparse
 import logging
 import numpy as np
-from scipy.spatial.transform import Rotation as R
+from motion_io import load_motion, save_motion, group_slices, rotations_meta
+from track_pool import map_tracks
 
 def setup_logging():
     logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s', datefmt='%Y-%m-%d %H:%M:%S')
@@ -26,85 +26,139 @@ SKELETON_BONES = {
     'right_lower_leg': (26, 28),
 }
 
-def get_vector(landmarks, start_idx, end_idx):
-    """Calcule un vecteur normalisé à partir de deux points landmarks."""
-    start = np.array([landmarks[start_idx][c] for c in 'xyz'])
-    end = np.array([landmarks[end_idx][c] for c in 'xyz'])
-    vec = end - start
-    norm = np.linalg.norm(vec)
-    return vec / norm if norm > 0 else np.array([0, 0, 0])
-
-def calculate_bone_rotations(input_path, output_path):
+def t_pose_vector(bone_name):
+    """Direction de l'os en T-pose (Y-up). Ex: un bras pointe vers X+ en T-pose, une jambe vers Y-."""
+    if 'leg' in bone_name: return np.array([0., -1., 0.])
+    if 'arm' in bone_name: return np.array([1., 0., 0.] if 'left' in bone_name else [-1., 0., 0.])
+    return np.array([0., 1., 0.]) # Spine, neck
+
+def normalize(vectors):
+    """Normalise des vecteurs (..., 3). Les vecteurs de longueur nulle restent nuls."""
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return np.divide(vectors, norms, out=np.zeros_like(vectors), where=norms > 0)
+
+def get_vectors(landmarks, start_idx, end_idx):
+    """Calcule les vecteurs normalisés entre deux landmarks pour toutes les images (images, 33, 3)."""
+    return normalize(landmarks[:, end_idx] - landmarks[:, start_idx])
+
+def shortest_arc_quats(from_vecs, to_vecs):
+    """
+    Quaternions [x, y, z, w] de la plus petite rotation amenant from_vecs sur to_vecs (vecteurs unitaires).
+    Même résultat que R.align_vectors([to], [from]) pour une seule paire de vecteurs.
+    """
+    quats = np.concatenate([np.cross(from_vecs, to_vecs), 1.0 + np.sum(from_vecs * to_vecs, axis=-1, keepdims=True)], axis=-1)
+    norms = np.linalg.norm(quats, axis=-1, keepdims=True)
+    # Vecteurs opposés: demi-tour autour d'un axe orthogonal à from_vecs
+    least_aligned = np.eye(3)[np.argmin(np.abs(from_vecs), axis=-1)]
+    half_turn = np.concatenate([normalize(np.cross(from_vecs, least_aligned)), np.zeros(norms.shape)], axis=-1)
+    return np.where(norms > 1e-8, quats / np.maximum(norms, 1e-8), half_turn)
+
+def compute_track_rotations(frames, landmarks, pose_slice, bones):
+    """
+    Calcule en une passe les rotations globales des os d'une piste.
+    Retourne (frames, rotations) où rotations a la forme (images, os, 4); les images sans pose sont
+    ignorées et les os dégénérés (vecteur nul) valent NaN.
+    """
+    from scipy.spatial.transform import Rotation as R # Import lent: évité tant que la CLI peut passer par le démon
+    pose = np.asarray(landmarks[:, pose_slice, :3], dtype=np.float64)
+    valid = ~np.isnan(pose).any(axis=(1, 2))
+    frames, pose = np.asarray(frames)[valid], pose[valid]
+    rotations = np.full((len(frames), len(bones), 4), np.nan)
+
+    # --- Calcul de l'orientation de la racine (Hips) ---
+    hip_right_vec = get_vectors(pose, *SKELETON_BONES['hips'])
+    spine_vec = get_vectors(pose, 24, 12) # Pelvis to shoulder center
+
+    # Assurer l'orthogonalité
+    hip_forward_vec = np.cross(spine_vec, hip_right_vec)
+    root_ok = np.linalg.norm(hip_forward_vec, axis=-1) > 0
+    hip_forward_vec = normalize(hip_forward_vec)
+    hip_up_vec = np.cross(hip_right_vec, hip_forward_vec)
+
+    # Matrices de rotation de la racine, converties en un seul objet Rotation
+    root_matrices = np.stack([hip_right_vec, hip_up_vec, -hip_forward_vec], axis=-1)
+    if root_ok.any():
+        rotations[root_ok, bones.index('hips')] = R.from_matrix(root_matrices[root_ok]).as_quat() # [x, y, z, w]
+
+    # --- Calcul des rotations des autres os ---
+    # Simplification: nous calculons les rotations globales de chaque os.
+    # Un vrai retargeting dans un moteur de jeu calculera les rotations locales.
+    for bone_index, bone_name in enumerate(bones):
+        if bone_name == 'hips': continue
+        bone_vecs = get_vectors(pose, *SKELETON_BONES[bone_name])
+        quats = shortest_arc_quats(np.broadcast_to(t_pose_vector(bone_name), bone_vecs.shape), bone_vecs)
+        rotations[:, bone_index] = np.where(np.any(bone_vecs != 0, axis=-1, keepdims=True), quats, np.nan)
+
+    return frames, rotations
+
+def _track_rotations(inputs, outputs, pose_slice, bones):
+    """Rotations d'une piste dans outputs (tâche de map_tracks). Retourne le nombre d'images avec une pose."""
+    rows, rotations = compute_track_rotations(np.arange(len(inputs['frames'])), inputs['landmarks'], pose_slice, bones)
+    outputs['rotations'][:len(rows)] = rotations
+    for column in outputs.keys() - {'rotations'}: # Numéros d'image et horodatages des images gardées
+        outputs[column][:len(rows)] = inputs[column][rows]
+    return len(rows)
+
+def compute_rotations(smoothed_tracks, meta, key_tolerance=None, workers=1):
+    """
+    Calcule les rotations des os pour toutes les pistes en mémoire. Retourne (animation_tracks, meta).
+    key_tolerance (degrés) réduit les courbes aux images clés nécessaires (voir keyframe_reduction.py).
+    Les pistes sont réparties sur workers processus.
+    """
+    pose_slice = group_slices(meta['groups']).get('pose')
+    if pose_slice is None:
+        raise ValueError("Les données ne contiennent pas de landmarks 'pose'.")
+
+    bones = list(SKELETON_BONES)
+    logging.info(f"Calcul des rotations pour les personnes ID: {', '.join(smoothed_tracks)}")
+    columns = ['times'] if 'times' in meta['arrays'] else []
+    # Taille maximale (toutes les images ont une pose); les images sans pose sont retirées ensuite
+    output_specs = lambda track: dict({'frames': (track['frames'].shape, np.int32), 'rotations': ((len(track['frames']), len(bones), 4), np.float32)},
+                                      **{column: (track[column].shape, track[column].dtype) for column in columns})
+    results = map_tracks(_track_rotations, smoothed_tracks, ['frames', 'landmarks'] + columns, output_specs, workers, pose_slice=pose_slice, bones=bones)
+    animation_tracks = {person_id: {c: values[:count] for c, values in outputs.items()} for person_id, (outputs, count) in results.items()}
+    out_meta = rotations_meta(bones, fps=meta.get('fps'), columns=columns, source=meta.get('source'), sample_fps=meta.get('sample_fps'))
+    if key_tolerance is not None:
+        from keyframe_reduction import reduce_rotations
+        return reduce_rotations(animation_tracks, out_meta, key_tolerance, workers)
+    return animation_tracks, out_meta
+
+def calculate_bone_rotations(input_path, output_path, export_json=None, key_tolerance=None, workers=1):
+    """Calcule et sauvegarde les rotations d'un fichier lissé. Retourne output_path, ou None en cas d'erreur."""
     setup_logging()
     logging.info(f"Chargement des données lissées depuis: {input_path}")
     try:
-        with open(input_path, 'r') as f:
-            smoothed_data = json.load(f)
+        smoothed_tracks, meta = load_motion(input_path)
+        animation_tracks, out_meta = compute_rotations(smoothed_tracks, meta, key_tolerance, workers)
     except Exception as e:
-        logging.error(f"Erreur de chargement du JSON: {e}")
-        return
-
-    animation_data = {}
-    for person_id, track_data in smoothed_data.items():
-        logging.info(f"Calcul des rotations pour la personne ID: {person_id}")
-        person_anim = []
-        for frame_data in track_data:
-            if not frame_data['landmarks'] or 'pose' not in frame_data['landmarks']:
-                continue
-
-            landmarks = frame_data['landmarks']['pose']
-            if not landmarks or len(landmarks) < 33:
-                continue
-
-            frame_rotations = {'frame': frame_data['frame'], 'rotations': {}}
-
-            # --- Calcul de l'orientation de la racine (Hips) ---
-            hip_right_vec = get_vector(landmarks, SKELETON_BONES['hips'][0], SKELETON_BONES['hips'][1])
-            spine_vec = get_vector(landmarks, 24, 12) # Pelvis to shoulder center
-            
-            # Assurer l'orthogonalité
-            hip_forward_vec = np.cross(spine_vec, hip_right_vec)
-            hip_forward_vec /= np.linalg.norm(hip_forward_vec)
-            hip_up_vec = np.cross(hip_right_vec, hip_forward_vec)
-
-            # Matrice de rotation pour la racine
-            root_matrix = np.array([hip_right_vec, hip_up_vec, -hip_forward_vec]).T
-            root_rotation = R.from_matrix(root_matrix)
-            frame_rotations['rotations']['hips'] = root_rotation.as_quat().tolist() # [x, y, z, w]
-
-            # --- Calcul des rotations des autres os ---
-            # Simplification: nous calculons les rotations globales de chaque os.
-            # Un vrai retargeting dans un moteur de jeu calculera les rotations locales.
-            for bone_name, (start_idx, end_idx) in SKELETON_BONES.items():
-                if bone_name == 'hips': continue
-                
-                bone_vec = get_vector(landmarks, start_idx, end_idx)
-                if np.all(bone_vec == 0): continue
-
-                # La rotation est calculée par rapport à la pose de base (Y-up)
-                # Ex: un bras pointe vers X+ en T-pose, une jambe vers Y-
-                if 'leg' in bone_name: t_pose_vec = np.array([0, -1, 0])
-                elif 'arm' in bone_name: t_pose_vec = np.array([1, 0, 0] if 'left' in bone_name else [-1, 0, 0])
-                else: t_pose_vec = np.array([0, 1, 0]) # Spine, neck
-
-                # align_vectors retourne la rotation pour passer du premier vecteur au second
-                rot, _ = R.align_vectors([bone_vec], [t_pose_vec])
-                frame_rotations['rotations'][bone_name] = rot.as_quat().tolist()
-
-            person_anim.append(frame_rotations)
-        animation_data[person_id] = person_anim
+        logging.error(f"Erreur de chargement des données: {e}")
+        return None
 
     logging.info(f"Sauvegarde des données de rotation dans: {output_path}")
-    with open(output_path, 'w') as f:
-        json.dump(animation_data, f, indent=4)
+    save_motion(output_path, animation_tracks, out_meta)
+    if export_json:
+        save_motion(export_json, animation_tracks, out_meta)
+        logging.info(f"Export JSON: {export_json}")
     logging.info("Calcul des rotations terminé.")
+    return output_path
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(description="Calcule les rotations (quaternions) des os à partir de données de landmarks lissées.")
-    parser.add_argument("--input_json", required=True, help="Fichier JSON d'entrée (données lissées).")
-    parser.add_argument("--output_json", required=True, help="Fichier JSON de sortie pour les rotations.")
+    parser.add_argument("--input", "--input_json", dest="input", required=True, help="Fichier d'entrée (données lissées, .motion ou .json).")
+    parser.add_argument("--output", "--output_json", dest="output", required=True, help="Fichier de sortie pour les rotations (.motion ou .json).")
+    parser.add_argument("--export_json", default=None, help="Exporte aussi les rotations au format JSON.")
+    parser.add_argument("--key_tolerance", type=float, default=None,
+                        help="Ne garde que les images clés nécessaires pour reconstituer chaque os par SLERP à N degrés près.")
+    parser.add_argument("--workers", type=int, default=1, help="Processus de calcul (les pistes sont réparties entre eux; 0: un par cœur).")
+    parser.add_argument("--no_daemon", action="store_true", help="N'utilise pas le démon (pipeline_daemon.py) même s'il tourne.")
     args = parser.parse_args()
-    calculate_bone_rotations(args.input_json, args.output_json)
+    kwargs = dict(input_path=args.input, output_path=args.output, export_json=args.export_json, key_tolerance=args.key_tolerance, workers=args.workers)
+    if not args.no_daemon:
+        from pipeline_daemon import submit
+        ok = submit('rotations', **kwargs)
+        if ok is not None: raise SystemExit(0 if ok else 1)
+    if calculate_bone_rotations(**kwargs) is None:
+        raise SystemExit(1)
 
 # Exemple:
-# python calculate_rotations.py --input_json holistic_motion_smoothed.json --output_json animation_rotations.json
+# python calculate_rotations.py --input holistic_motion_smoothed.motion --output animation_rotations.motion
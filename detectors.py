@@ -0,0 +1,311 @@
+import argparse
+import logging
+import os
+import pickle
+import shutil
+import numpy as np
+
+# Détecteurs de personnes interchangeables pour l'extraction. Chaque backend détecte les personnes d'une
+# image (detect) et les suit avec le tracker ultralytics (track: ByteTrack par défaut); son état (pistes
+# actives, compteur d'identifiants) est sérialisable pour les checkpoints.
+#  - ultralytics: le modèle YOLO PyTorch (yolov8n.pt), backend par défaut;
+#  - onnx: un modèle YOLOv8 exporté en ONNX (éventuellement quantifié en int8), exécuté par ONNX Runtime
+#    sur CPU avec un nombre de threads réglable. Les détections passent par le même tracker ultralytics.
+# Les options sont un dict JSON (démon, cache), comme celles du filtrage des pistes (track_gating.py).
+
+DETECTOR_DEFAULTS = {
+    'backend': 'ultralytics', # 'ultralytics' ou 'onnx'
+    'model': None,            # Poids (.pt) ou modèle ONNX (.onnx); par défaut yolov8n.pt / yolov8n.onnx
+    'threads': 0,             # Threads d'inférence (0: valeur par défaut du runtime)
+}
+DEFAULT_MODELS = {'ultralytics': 'yolov8n.pt', 'onnx': 'yolov8n.onnx'}
+PERSON_CLASS = 0
+LETTERBOX_COLOR = 114
+
+def setup_logging():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s', datefmt='%Y-%m-%d %H:%M:%S')
+
+def _empty_tracks():
+    return np.empty(0, dtype=int), np.empty((0, 4), dtype=int)
+
+def iou_matrix(boxes_a, boxes_b):
+    """IoU de chaque boîte de boxes_a (n, 4) avec chaque boîte de boxes_b (m, 4), en x1, y1, x2, y2: tableau (n, m)."""
+    boxes_a, boxes_b = np.asarray(boxes_a, dtype=np.float64).reshape(-1, 4), np.asarray(boxes_b, dtype=np.float64).reshape(-1, 4)
+    top_left = np.maximum(boxes_a[:, None, :2], boxes_b[None, :, :2])
+    bottom_right = np.minimum(boxes_a[:, None, 2:], boxes_b[None, :, 2:])
+    inter = np.prod(np.clip(bottom_right - top_left, 0, None), axis=2)
+    area_a = np.prod(np.clip(boxes_a[:, 2:] - boxes_a[:, :2], 0, None), axis=1)
+    area_b = np.prod(np.clip(boxes_b[:, 2:] - boxes_b[:, :2], 0, None), axis=1)
+    union = area_a[:, None] + area_b[None, :] - inter
+    return np.divide(inter, union, out=np.zeros_like(inter), where=union > 0)
+
+def non_max_suppression(boxes, scores, iou_threshold):
+    """Indices des boîtes gardées par la suppression des non-maxima, par score décroissant."""
+    order = np.argsort(-scores, kind='stable')
+    keep = []
+    while len(order):
+        best, order = order[0], order[1:]
+        keep.append(best)
+        order = order[iou_matrix(boxes[best], boxes[order])[0] <= iou_threshold]
+    return np.array(keep, dtype=int)
+
+def letterbox(frame, size):
+    """
+    Redimensionne l'image (BGR) dans size (hauteur, largeur) en gardant ses proportions, centrée sur un fond gris
+    (comme ultralytics). Retourne (image, échelle, (décalage x, décalage y)).
+    """
+    import cv2
+    frame_h, frame_w = frame.shape[:2]
+    scale = min(size[0] / frame_h, size[1] / frame_w)
+    new_h, new_w = round(frame_h * scale), round(frame_w * scale)
+    top, left = (size[0] - new_h) // 2, (size[1] - new_w) // 2
+    canvas = np.full((size[0], size[1], 3), LETTERBOX_COLOR, dtype=np.uint8)
+    canvas[top:top + new_h, left:left + new_w] = cv2.resize(frame, (new_w, new_h), interpolation=cv2.INTER_LINEAR)
+    return canvas, scale, (left, top)
+
+def preprocess(frame, size, dtype=np.float32):
+    """Entrée du modèle ONNX pour une image BGR: tableau (1, 3, h, w) RGB dans [0, 1]. Retourne (entrée, échelle, décalage)."""
+    canvas, scale, offset = letterbox(frame, size)
+    blob = np.ascontiguousarray(canvas[:, :, ::-1].transpose(2, 0, 1)[None], dtype=dtype)
+    blob /= 255.0
+    return blob, scale, offset
+
+def decode_yolov8(output, conf, iou_threshold, max_det=300):
+    """
+    Boîtes de personnes (x1, y1, x2, y2 dans l'entrée du modèle) et scores d'une sortie YOLOv8 (1, 4 + classes, ancres).
+    Comme ultralytics avec classes=0: une ancre n'est gardée que si sa meilleure classe est la personne.
+    """
+    pred = np.asarray(output[0], dtype=np.float32)
+    class_scores = pred[4:]
+    scores = class_scores[PERSON_CLASS]
+    candidates = (scores >= conf) & (class_scores.argmax(axis=0) == PERSON_CLASS)
+    cx, cy, w, h = pred[:4, candidates]
+    boxes = np.stack([cx - w / 2, cy - h / 2, cx + w / 2, cy + h / 2], axis=1)
+    scores = scores[candidates]
+    keep = non_max_suppression(boxes, scores, iou_threshold)[:max_det]
+    return boxes[keep], scores[keep]
+
+def create_tracker(tracker_config, frame_rate=30):
+    """Tracker ultralytics (ByteTrack ou BoT-SORT) décrit par un fichier de configuration (ex: bytetrack.yaml)."""
+    from ultralytics.trackers.track import TRACKER_MAP
+    from ultralytics.utils import IterableSimpleNamespace, yaml_load
+    from ultralytics.utils.checks import check_yaml
+    cfg = IterableSimpleNamespace(**yaml_load(check_yaml(tracker_config)))
+    if cfg.tracker_type not in TRACKER_MAP:
+        raise ValueError(f"Tracker inconnu: {cfg.tracker_type} (attendu: {', '.join(TRACKER_MAP)})")
+    return TRACKER_MAP[cfg.tracker_type](args=cfg, frame_rate=frame_rate)
+
+class UltralyticsDetector:
+    """YOLO exécuté par ultralytics (PyTorch), avec son tracker intégré (persist=True)."""
+    name = 'ultralytics'
+
+    def __init__(self, model=None, threads=0):
+        from ultralytics import YOLO
+        if threads:
+            import torch
+            torch.set_num_threads(threads)
+        self.model = YOLO(model or DEFAULT_MODELS['ultralytics'])
+
+    def detect(self, frame, conf):
+        """Détections sans suivi: (boîtes (n, 4) en pixels, scores (n,))."""
+        boxes = self.model.predict(source=frame, classes=PERSON_CLASS, conf=conf, verbose=False)[0].boxes
+        return boxes.xyxy.cpu().numpy(), boxes.conf.cpu().numpy()
+
+    def track(self, frame, conf, tracker):
+        """Pistes de l'image: (identifiants (n,), boîtes (n, 4) entières en pixels)."""
+        boxes = self.model.track(source=frame, tracker=tracker, classes=PERSON_CLASS, conf=conf, persist=True, verbose=False)[0].boxes
+        if boxes.id is None: return _empty_tracks()
+        return boxes.id.cpu().numpy().astype(int), boxes.xyxy.cpu().numpy().astype(int)
+
+    def get_state(self):
+        from track_store import get_tracker_state
+        return get_tracker_state(self.model)
+
+    def set_state(self, state, frame_shape, tracker):
+        """Restaure l'état de get_state. frame_shape (hauteur, largeur): taille des images de la vidéo."""
+        if state is None: return False
+        from track_store import set_tracker_state
+        # Le predictor ultralytics n'existe qu'après un premier appel: image noire, puis état restauré
+        self.model.track(source=np.zeros(tuple(frame_shape) + (3,), np.uint8), tracker=tracker, classes=PERSON_CLASS, persist=True, verbose=False)
+        return set_tracker_state(self.model, state)
+
+    def reset(self):
+        from track_store import reset_tracker
+        reset_tracker(self.model)
+
+class OnnxDetector:
+    """YOLOv8 exporté en ONNX (float ou int8), exécuté par ONNX Runtime sur CPU, suivi par le tracker ultralytics."""
+    name = 'onnx'
+
+    def __init__(self, model=None, threads=0, iou=0.7, default_size=640):
+        import onnxruntime as ort
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+        if threads:
+            options.intra_op_num_threads = threads
+            options.inter_op_num_threads = 1
+        self.model_path = model or DEFAULT_MODELS['onnx']
+        self.session = ort.InferenceSession(self.model_path, options, providers=['CPUExecutionProvider'])
+        model_input = self.session.get_inputs()[0]
+        self.input_name = model_input.name
+        self.input_dtype = np.float16 if model_input.type == 'tensor(float16)' else np.float32
+        # Dimensions dynamiques (noms symboliques): taille d'export par défaut d'ultralytics
+        self.input_size = tuple(dim if isinstance(dim, int) else default_size for dim in model_input.shape[2:4])
+        self.iou = iou
+        self.tracker = None
+
+    def detect(self, frame, conf):
+        """Détections sans suivi: (boîtes (n, 4) en pixels, scores (n,))."""
+        blob, scale, (left, top) = preprocess(frame, self.input_size, self.input_dtype)
+        output = self.session.run(None, {self.input_name: blob})[0]
+        boxes, scores = decode_yolov8(output, conf, self.iou)
+        frame_h, frame_w = frame.shape[:2]
+        boxes = (boxes - [left, top, left, top]) / scale
+        boxes = np.clip(boxes, 0, [frame_w, frame_h, frame_w, frame_h])
+        return boxes, scores
+
+    def track(self, frame, conf, tracker):
+        """Pistes de l'image: (identifiants (n,), boîtes (n, 4) entières en pixels)."""
+        from ultralytics.engine.results import Boxes
+        boxes, scores = self.detect(frame, conf)
+        if self.tracker is None: self.tracker = create_tracker(tracker)
+        detections = np.column_stack([boxes, scores, np.full(len(scores), PERSON_CLASS)]).astype(np.float32)
+        tracks = self.tracker.update(Boxes(detections, frame.shape[:2]), frame)
+        if len(tracks) == 0: return _empty_tracks()
+        # Lignes [x1, y1, x2, y2, id, score, classe, indice]; boîtes prédites bornées à l'image, comme ultralytics
+        frame_h, frame_w = frame.shape[:2]
+        track_boxes = np.clip(tracks[:, :4], 0, [frame_w, frame_h, frame_w, frame_h])
+        return tracks[:, 4].astype(int), track_boxes.astype(int)
+
+    def get_state(self):
+        if self.tracker is None: return None
+        from ultralytics.trackers.basetrack import BaseTrack
+        try:
+            return pickle.dumps({'tracker': self.tracker, 'next_id': BaseTrack._count})
+        except Exception as e:
+            logging.warning(f"État du tracker non sauvegardable: {e}")
+            return None
+
+    def set_state(self, state, frame_shape, tracker):
+        if state is None: return False
+        from ultralytics.trackers.basetrack import BaseTrack
+        saved = pickle.loads(state)
+        self.tracker = saved['tracker']
+        BaseTrack._count = saved['next_id']
+        return True
+
+    def reset(self):
+        from ultralytics.trackers.basetrack import BaseTrack
+        self.tracker = None
+        BaseTrack.reset_id()
+
+BACKENDS = {'ultralytics': UltralyticsDetector, 'onnx': OnnxDetector}
+
+def create_detector(options=None, default_threads=0):
+    """Détecteur décrit par un dict d'options (voir DETECTOR_DEFAULTS); default_threads remplace threads=0."""
+    options = dict(DETECTOR_DEFAULTS, **(options or {}))
+    if options['backend'] not in BACKENDS:
+        raise ValueError(f"Détecteur inconnu: {options['backend']} (attendu: {', '.join(BACKENDS)})")
+    detector = BACKENDS[options['backend']](options['model'], options['threads'] or default_threads)
+    logging.info(f"Détecteur: {describe(options)}.")
+    return detector
+
+def describe(options=None):
+    options = dict(DETECTOR_DEFAULTS, **(options or {}))
+    model = options['model'] or DEFAULT_MODELS[options['backend']]
+    return f"{options['backend']} ({model}" + (f", {options['threads']} threads)" if options['threads'] else ")")
+
+def add_detector_arguments(parser):
+    """Options du détecteur de personnes, communes aux CLI d'extraction."""
+    parser.add_argument("--detector", default=DETECTOR_DEFAULTS['backend'], choices=list(BACKENDS),
+                        help="Backend du détecteur: ultralytics (PyTorch) ou onnx (ONNX Runtime sur CPU, modèle exporté par detectors.py).")
+    parser.add_argument("--detector_model", default=DETECTOR_DEFAULTS['model'],
+                        help="Poids du détecteur (.pt pour ultralytics, .onnx pour onnx). Par défaut: yolov8n.pt / yolov8n.onnx.")
+    parser.add_argument("--detector_threads", type=int, default=DETECTOR_DEFAULTS['threads'], help="Threads d'inférence du détecteur (0: valeur par défaut).")
+
+def detector_options(args):
+    """Dict d'options du détecteur (voir DETECTOR_DEFAULTS) à partir des arguments de add_detector_arguments."""
+    return {'backend': args.detector, 'model': args.detector_model, 'threads': args.detector_threads}
+
+DETECTOR_FLAGS = {'backend': "--detector", 'model': "--detector_model", 'threads': "--detector_threads"}
+
+def detector_command_args(options):
+    """Arguments de ligne de commande reproduisant un dict d'options (seulement celles qui diffèrent des valeurs par défaut)."""
+    args = []
+    for key, value in (options or {}).items():
+        if value != DETECTOR_DEFAULTS[key]: args += [DETECTOR_FLAGS[key], str(value)]
+    return args
+
+class VideoCalibrationReader:
+    """Images d'une vidéo, réparties uniformément, fournies à la calibration de quantize_static (interface CalibrationDataReader)."""
+
+    def __init__(self, video_path, input_name, size, count=100):
+        import cv2
+        cap = cv2.VideoCapture(video_path)
+        if not cap.isOpened(): raise ValueError(f"Impossible d'ouvrir la vidéo de calibration: {video_path}")
+        total = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        self.blobs = []
+        for frame_num in np.unique(np.linspace(0, max(total - 1, 0), count).astype(int)):
+            cap.set(cv2.CAP_PROP_POS_FRAMES, int(frame_num))
+            ok, frame = cap.read()
+            if ok: self.blobs.append(preprocess(frame, size)[0])
+        cap.release()
+        if not self.blobs: raise ValueError(f"Aucune image lue dans la vidéo de calibration: {video_path}")
+        self.input_name = input_name
+        self.rewind()
+
+    def get_next(self):
+        return next(self._iter, None)
+
+    def rewind(self):
+        self._iter = ({self.input_name: blob} for blob in self.blobs)
+
+def quantize_onnx(model_path, output_path, calibration_video=None, calibration_frames=100, size=(640, 640)):
+    """
+    Quantifie un modèle ONNX en int8. Avec une vidéo de calibration: quantification statique (poids et activations,
+    format QDQ, poids par canal), la plus rapide sur CPU; sinon quantification dynamique (poids seulement).
+    """
+    from onnxruntime.quantization import QuantFormat, QuantType, quantize_dynamic, quantize_static
+    if calibration_video is None:
+        logging.info("Quantification dynamique int8 (poids seulement; --calibration_video pour une quantification statique).")
+        quantize_dynamic(model_path, output_path, weight_type=QuantType.QUInt8)
+        return output_path
+    import onnxruntime as ort
+    from onnxruntime.quantization.shape_inference import quant_pre_process
+    input_name = ort.InferenceSession(model_path, providers=['CPUExecutionProvider']).get_inputs()[0].name
+    prepared = output_path + ".prep.onnx"
+    quant_pre_process(model_path, prepared)
+    try:
+        reader = VideoCalibrationReader(calibration_video, input_name, size, calibration_frames)
+        logging.info(f"Quantification statique int8, calibrée sur {len(reader.blobs)} images de {calibration_video}.")
+        quantize_static(prepared, output_path, reader, quant_format=QuantFormat.QDQ, per_channel=True,
+                        activation_type=QuantType.QUInt8, weight_type=QuantType.QInt8)
+    finally:
+        if os.path.exists(prepared): os.remove(prepared)
+    return output_path
+
+def export_onnx(weights=None, output_path=None, imgsz=640, int8=False, calibration_video=None, calibration_frames=100):
+    """Exporte des poids YOLO en ONNX (taille d'entrée fixe imgsz), puis les quantifie en int8 si demandé. Retourne le chemin du modèle."""
+    from ultralytics import YOLO
+    weights = weights or DEFAULT_MODELS['ultralytics']
+    exported = YOLO(weights).export(format='onnx', imgsz=imgsz, dynamic=False, simplify=True)
+    output_path = output_path or os.path.splitext(weights)[0] + ("_int8.onnx" if int8 else ".onnx")
+    if int8:
+        quantize_onnx(exported, output_path, calibration_video, calibration_frames, (imgsz, imgsz))
+    elif os.path.abspath(exported) != os.path.abspath(output_path):
+        shutil.move(exported, output_path)
+    logging.info(f"Modèle ONNX sauvegardé dans: {output_path}")
+    return output_path
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Exporte le détecteur YOLO en ONNX (éventuellement quantifié en int8) pour le backend --detector onnx.")
+    parser.add_argument("--weights", default=DEFAULT_MODELS['ultralytics'], help="Poids YOLO à exporter (.pt).")
+    parser.add_argument("--output", default=None, help="Modèle ONNX de sortie (par défaut: <poids>.onnx, ou <poids>_int8.onnx).")
+    parser.add_argument("--imgsz", type=int, default=640, help="Taille d'entrée du modèle exporté (ex: 640, 480 ou 320 pour plus de vitesse).")
+    parser.add_argument("--int8", action="store_true", help="Quantifie le modèle en int8.")
+    parser.add_argument("--calibration_video", default=None, help="Vidéo de calibration pour une quantification statique (recommandée).")
+    parser.add_argument("--calibration_frames", type=int, default=100, help="Nombre d'images de calibration.")
+    args = parser.parse_args()
+    setup_logging()
+    export_onnx(args.weights, args.output, args.imgsz, args.int8, args.calibration_video, args.calibration_frames)
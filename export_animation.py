@@ -0,0 +1,306 @@
+import argparse
+import json
+import logging
+import os
+import struct
+import numpy as np
+from motion_io import load_motion, track_seconds
+from skeleton import BONE_HIERARCHY, BONE_T_POSE_HEADS, BONE_T_POSE_TAILS, bone_offset, children, local_rotations, effective_keys
+from keyframe_reduction import slerp
+
+# Export d'animation sans Blender: BVH (un fichier par piste) et glTF / GLB (toutes les pistes dans une scène).
+# Les rotations sont converties et écrites par blocs d'images, la mémoire reste bornée quelle que soit la durée.
+CHUNK_FRAMES = 2048
+DEFAULT_FPS = 30.0
+FORMATS = ('bvh', 'gltf', 'glb')
+
+# Constantes glTF 2.0
+GLB_MAGIC, GLB_VERSION = 0x46546C67, 2
+GLB_JSON_CHUNK, GLB_BIN_CHUNK = 0x4E4F534A, 0x004E4942
+FLOAT = 5126
+
+def setup_logging():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s', datefmt='%Y-%m-%d %H:%M:%S')
+
+def _skeleton_columns(bones):
+    """Colonne des données pour chaque os de BONE_HIERARCHY (None si l'os est absent des données)."""
+    return [bones.index(bone) if bone in bones else None for bone in BONE_HIERARCHY]
+
+def _skeleton_globals(quats, columns):
+    """Rotations globales (n, os de BONE_HIERARCHY, 4); un os absent des données vaut NaN (il reste en T-pose)."""
+    global_quats = np.full((len(quats), len(columns), 4), np.nan)
+    for i, column in enumerate(columns):
+        if column is not None: global_quats[:, i] = quats[:, column]
+    return global_quats
+
+def _local_keys(track, columns, start, stop):
+    """
+    Clés des rotations locales des lignes [start, stop) d'une piste réduite (None si la piste n'est pas réduite).
+    La première et la dernière ligne sont des clés de tous les os, y compris ceux absents des données.
+    """
+    if 'keys' not in track: return None
+    keys = np.asarray(track['keys'][start:stop], dtype=bool)
+    skeleton_keys = np.zeros((len(keys), len(columns)), dtype=bool)
+    for i, column in enumerate(columns):
+        if column is not None: skeleton_keys[:, i] = keys[:, column]
+    if start == 0: skeleton_keys[0] = True
+    if stop >= len(track['frames']): skeleton_keys[-1] = True
+    return effective_keys(list(BONE_HIERARCHY), skeleton_keys)
+
+def iter_local_chunks(track, bones, fps, chunk_frames=CHUNK_FRAMES):
+    """
+    Génère (start, temps en secondes, rotations locales, clés) par blocs d'images d'une piste. Les rotations locales
+    ont la forme (n, os, 4), os dans l'ordre de BONE_HIERARCHY; un os absent des données reste en T-pose. Les clés
+    (n, os) ne sont fournies (sinon None) que pour une piste réduite (voir keyframe_reduction.py).
+    """
+    out_bones, columns = list(BONE_HIERARCHY), _skeleton_columns(bones)
+    for start in range(0, len(track['frames']), chunk_frames):
+        stop = min(start + chunk_frames, len(track['frames']))
+        global_quats = _skeleton_globals(np.asarray(track['rotations'][start:stop], dtype=np.float64), columns)
+        yield (start, track_seconds(track, fps, start, stop), local_rotations(out_bones, global_quats),
+               _local_keys(track, columns, start, stop))
+
+def dense_count(times, fps):
+    """Nombre d'images à la cadence fps entre la première et la dernière ligne (temps en secondes)."""
+    return int(np.floor((times[-1] - times[0]) * fps + 1e-6)) + 1
+
+def iter_dense_globals(track, bones, times, fps, chunk_frames=CHUNK_FRAMES):
+    """
+    Génère (temps, rotations globales) à la cadence fixe fps depuis le premier instant de la piste (times, en secondes,
+    un par ligne), par blocs d'au plus chunk_frames images. Les instants sans ligne (trous, images non analysées ou
+    retirées par la réduction des clés) sont interpolés par SLERP entre les lignes qui les encadrent.
+    """
+    columns, n_rows = _skeleton_columns(bones), dense_count(times, fps)
+    for block_start in range(0, n_rows, chunk_frames):
+        target = times[0] + np.arange(block_start, min(block_start + chunk_frames, n_rows)) / fps
+        # Lignes stockées qui encadrent le bloc
+        lo = max(int(np.searchsorted(times, target[0], side='right')) - 1, 0)
+        hi = int(np.searchsorted(times, target[-1], side='left')) + 1
+        known_times = times[lo:hi]
+        known = _skeleton_globals(np.asarray(track['rotations'][lo:hi], dtype=np.float64), columns)
+        right = np.clip(np.searchsorted(known_times, target, side='left'), 0, len(known_times) - 1)
+        # Instant d'une ligne stockée (à la microseconde près): sa valeur, même si la ligne précédente n'a pas cet os
+        exact = np.abs(known_times[right] - target) < 1e-6
+        left = np.where(exact, right, np.maximum(right - 1, 0))
+        span = known_times[right] - known_times[left]
+        t = np.divide(target - known_times[left], span, out=np.zeros(len(target)), where=span > 0)
+        yield target, slerp(known[left], known[right], np.broadcast_to(t[:, None], known[left].shape[:2]))
+
+# --- BVH ---
+
+def _bvh_joint_lines(bone_name, depth):
+    indent = '\t' * depth
+    x, y, z = bone_offset(bone_name)
+    is_root = BONE_HIERARCHY[bone_name] is None
+    lines = [f"{indent}{'ROOT' if is_root else 'JOINT'} {bone_name}", f"{indent}{{",
+             f"{indent}\tOFFSET {x:.6f} {y:.6f} {z:.6f}"]
+    if is_root:
+        lines.append(f"{indent}\tCHANNELS 6 Xposition Yposition Zposition Zrotation Xrotation Yrotation")
+    else:
+        lines.append(f"{indent}\tCHANNELS 3 Zrotation Xrotation Yrotation")
+    bone_children = children(bone_name)
+    for child in bone_children:
+        lines.extend(_bvh_joint_lines(child, depth + 1))
+    if not bone_children:
+        tx, ty, tz = np.subtract(BONE_T_POSE_TAILS[bone_name], BONE_T_POSE_HEADS[bone_name])
+        lines += [f"{indent}\tEnd Site", f"{indent}\t{{", f"{indent}\t\tOFFSET {tx:.6f} {ty:.6f} {tz:.6f}", f"{indent}\t}}"]
+    lines.append(f"{indent}}}")
+    return lines
+
+def bvh_channel_order():
+    """Os dans l'ordre des canaux d'une ligne de mouvement BVH (parcours en profondeur de la hiérarchie)."""
+    order = []
+    def visit(bone_name):
+        order.append(bone_name)
+        for child in children(bone_name): visit(child)
+    for root in children(None): visit(root)
+    return order
+
+def write_bvh(path, track, bones, source_fps, fps):
+    """
+    Écrit une piste en BVH, à la cadence fixe fps. Les instants sans rotations (trous de la piste, images non
+    analysées ou retirées par la réduction des clés) sont interpolés par SLERP. source_fps convertit les numéros
+    d'image en temps quand la piste n'a pas d'horodatages.
+    """
+    from scipy.spatial.transform import Rotation as R
+    times = track_seconds(track, source_fps)
+    n_rows = dense_count(times, fps)
+    order = bvh_channel_order()
+    columns = [list(BONE_HIERARCHY).index(bone) for bone in order]
+    root_position = np.asarray(BONE_T_POSE_HEADS[order[0]], dtype=np.float64)
+    with open(path, 'w') as f:
+        f.write("HIERARCHY\n")
+        f.write("\n".join(_bvh_joint_lines(order[0], 0)) + "\n")
+        f.write(f"MOTION\nFrames: {n_rows}\nFrame Time: {1.0 / fps:.6f}\n")
+        for _, global_quats in iter_dense_globals(track, bones, times, fps):
+            local = local_rotations(list(BONE_HIERARCHY), global_quats)
+            # 'ZXY' intrinsèque: R = Rz * Rx * Ry, comme l'ordre des canaux
+            euler = R.from_quat(local[:, columns].reshape(-1, 4)).as_euler('ZXY', degrees=True).reshape(len(local), -1)
+            rows = np.concatenate([np.broadcast_to(root_position, (len(local), 3)), euler], axis=1)
+            f.writelines(" ".join(f"{v:.4f}" for v in row) + "\n" for row in rows.tolist())
+    logging.info(f"BVH: {n_rows} images écrites dans: {path}")
+
+# --- glTF / GLB ---
+
+def _gltf_layout(tracks, bones, fps):
+    """
+    Construit le document glTF (nœuds, accesseurs, animation) et la position de chaque bloc dans le buffer binaire:
+    pour chaque piste, les temps puis les rotations de chaque os, chacun contigu. Retourne (document, blocs, taille).
+    """
+    out_bones = list(BONE_HIERARCHY)
+    doc = {'asset': {'version': "2.0", 'generator': "motion_extract"}, 'scene': 0, 'scenes': [{'nodes': []}],
+           'nodes': [], 'buffers': [], 'bufferViews': [], 'accessors': [], 'animations': []}
+    animation = {'name': "motion", 'samplers': [], 'channels': []}
+    blocks, offset = {}, 0
+
+    def add_block(length, element_type, n_components, **bounds):
+        nonlocal offset
+        doc['bufferViews'].append({'buffer': 0, 'byteOffset': offset, 'byteLength': length * n_components * 4})
+        doc['accessors'].append({'bufferView': len(doc['bufferViews']) - 1, 'componentType': FLOAT, 'count': length, 'type': element_type, **bounds})
+        offset += length * n_components * 4
+        return len(doc['accessors']) - 1, doc['bufferViews'][-1]['byteOffset']
+
+    for track_id, track in tracks.items():
+        length = len(track['frames'])
+        if length == 0: continue
+        # Un nœud racine par piste, puis un nœud par os (translation = position de la tête par rapport au parent)
+        root = len(doc['nodes'])
+        doc['nodes'].append({'name': f"track_{track_id}", 'children': []})
+        doc['scenes'][0]['nodes'].append(root)
+        nodes = {}
+        for bone_name in out_bones:
+            nodes[bone_name] = len(doc['nodes'])
+            doc['nodes'].append({'name': f"{track_id}_{bone_name}", 'translation': bone_offset(bone_name).tolist()})
+            parent = BONE_HIERARCHY[bone_name]
+            parent_node = doc['nodes'][nodes[parent] if parent else root]
+            parent_node.setdefault('children', []).append(nodes[bone_name])
+
+        # Bornes des temps, en float32 comme les valeurs écrites (la première et la dernière ligne sont des clés de tous les os)
+        times = track_seconds(track, fps, 0, 1).tolist() + track_seconds(track, fps, length - 1, length).tolist()
+        times = np.float32(times).tolist()
+        counts, shared_time_offset = _key_counts(track, bones), None
+        if counts is None: # Piste complète: un seul accesseur de temps partagé par tous les os
+            time_accessor, shared_time_offset = add_block(length, 'SCALAR', 1, min=times[:1], max=times[1:])
+        bone_blocks = []
+        for b, bone_name in enumerate(out_bones):
+            time_offset = None
+            if counts is not None: # Piste réduite: chaque os a ses propres temps de clés
+                time_accessor, time_offset = add_block(int(counts[b]), 'SCALAR', 1, min=times[:1], max=times[1:])
+            accessor, rotation_offset = add_block(length if counts is None else int(counts[b]), 'VEC4', 4)
+            bone_blocks.append((time_offset, rotation_offset))
+            animation['samplers'].append({'input': time_accessor, 'output': accessor, 'interpolation': 'LINEAR'})
+            animation['channels'].append({'sampler': len(animation['samplers']) - 1, 'target': {'node': nodes[bone_name], 'path': 'rotation'}})
+        blocks[track_id] = (shared_time_offset, bone_blocks)
+
+    if animation['channels']: doc['animations'].append(animation)
+    doc['buffers'].append({'byteLength': offset})
+    # Le glTF n'admet pas de tableaux vides (aucune piste exportée)
+    return {key: value for key, value in doc.items() if value != []}, blocks, offset
+
+def _key_counts(track, bones):
+    """Nombre de clés de chaque os de BONE_HIERARCHY d'une piste réduite (None si la piste n'est pas réduite)."""
+    if 'keys' not in track: return None
+    columns, counts = _skeleton_columns(bones), np.zeros(len(BONE_HIERARCHY), dtype=np.int64)
+    for start in range(0, len(track['frames']), CHUNK_FRAMES):
+        counts += _local_keys(track, columns, start, min(start + CHUNK_FRAMES, len(track['frames']))).sum(axis=0)
+    return counts
+
+def _write_gltf_buffer(f, base, tracks, bones, fps, blocks):
+    """
+    Écrit les blocs binaires à leur position (f.seek), bloc d'images par bloc d'images. Pour une piste réduite,
+    chaque os n'écrit que ses lignes clés, à la suite des précédentes.
+    """
+    for track_id, (shared_time_offset, bone_blocks) in blocks.items():
+        written = np.zeros(len(bone_blocks), dtype=np.int64)
+        for start, chunk_times, local, keys in iter_local_chunks(tracks[track_id], bones, fps):
+            times = chunk_times.astype('<f4')
+            if shared_time_offset is not None:
+                f.seek(base + shared_time_offset + start * 4)
+                f.write(times.tobytes())
+            for bone_index, (time_offset, rotation_offset) in enumerate(bone_blocks):
+                rows = slice(None) if keys is None else keys[:, bone_index]
+                if time_offset is not None:
+                    f.seek(base + time_offset + written[bone_index] * 4)
+                    f.write(times[rows].tobytes())
+                f.seek(base + rotation_offset + written[bone_index] * 16)
+                f.write(np.ascontiguousarray(local[rows, bone_index], dtype='<f4').tobytes())
+                written[bone_index] += len(local) if keys is None else int(keys[:, bone_index].sum())
+
+def write_gltf(path, tracks, bones, fps):
+    """Écrit toutes les pistes dans un fichier .glb, ou .gltf accompagné d'un .bin."""
+    doc, blocks, buffer_length = _gltf_layout(tracks, bones, fps)
+    binary = path.lower().endswith('.glb')
+    if binary:
+        json_bytes = json.dumps(doc, separators=(',', ':')).encode('utf-8')
+        json_bytes += b' ' * (-len(json_bytes) % 4)
+        bin_length = buffer_length + (-buffer_length % 4)
+        bin_base = 12 + 8 + len(json_bytes) + 8
+        with open(path, 'wb') as f:
+            f.write(struct.pack('<III', GLB_MAGIC, GLB_VERSION, bin_base + bin_length))
+            f.write(struct.pack('<II', len(json_bytes), GLB_JSON_CHUNK) + json_bytes)
+            f.write(struct.pack('<II', bin_length, GLB_BIN_CHUNK))
+            f.truncate(bin_base + bin_length) # Zéros de remplissage compris
+            _write_gltf_buffer(f, bin_base, tracks, bones, fps, blocks)
+    else:
+        bin_path = os.path.splitext(path)[0] + '.bin'
+        doc['buffers'][0]['uri'] = os.path.basename(bin_path)
+        with open(bin_path, 'wb') as f:
+            f.truncate(buffer_length)
+            _write_gltf_buffer(f, 0, tracks, bones, fps, blocks)
+        with open(path, 'w') as f: json.dump(doc, f, indent=4)
+    logging.info(f"glTF: {len(blocks)} pistes écrites dans: {path}")
+
+def bvh_path_for(path, track_id, n_tracks):
+    """Un fichier BVH ne contient qu'un squelette: avec plusieurs pistes, l'id de la piste est ajouté au nom."""
+    if n_tracks == 1: return path
+    base, ext = os.path.splitext(path)
+    return f"{base}_{track_id}{ext}"
+
+def export_tracks(tracks, meta, output_path, fps=None):
+    """
+    Exporte toutes les pistes de rotations; le format est déduit de l'extension. Retourne les fichiers écrits.
+    Les temps sont les horodatages réels des images (sinon numéro d'image / cadence de la vidéo); fps est la
+    cadence du BVH (par défaut, celle à laquelle la vidéo a été analysée).
+    """
+    fmt = os.path.splitext(output_path)[1].lower().lstrip('.')
+    if fmt not in FORMATS:
+        raise ValueError(f"Format d'export inconnu: '{fmt}' (attendu: {', '.join(FORMATS)}).")
+    source_fps = meta.get('fps') or DEFAULT_FPS
+    tracks = {track_id: track for track_id, track in tracks.items() if len(track['frames'])}
+    if fmt != 'bvh':
+        write_gltf(output_path, tracks, meta['bones'], source_fps)
+        return [output_path]
+    fps = fps or meta.get('sample_fps') or source_fps
+    paths = []
+    for track_id, track in tracks.items():
+        paths.append(bvh_path_for(output_path, track_id, len(tracks)))
+        write_bvh(paths[-1], track, meta['bones'], source_fps, fps)
+    return paths
+
+def export_animation(input_path, output_path, fps=None):
+    setup_logging()
+    logging.info(f"Chargement des rotations depuis: {input_path}")
+    try:
+        tracks, meta = load_motion(input_path)
+        return export_tracks(tracks, meta, output_path, fps)
+    except Exception as e:
+        logging.error(f"Erreur pendant l'export: {e}")
+        return None
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Exporte les rotations en animation BVH ou glTF/GLB, sans Blender.")
+    parser.add_argument("--input", required=True, help="Fichier de rotations (.motion ou .json).")
+    parser.add_argument("--output", required=True, help="Fichier de sortie (.bvh, .gltf ou .glb).")
+    parser.add_argument("--fps", type=float, default=None, help=f"Cadence du BVH (par défaut: celle de l'analyse de la vidéo, ou {DEFAULT_FPS:g}). Le glTF garde les temps réels des images.")
+    parser.add_argument("--no_daemon", action="store_true", help="N'utilise pas le démon (pipeline_daemon.py) même s'il tourne.")
+    args = parser.parse_args()
+    kwargs = dict(input_path=args.input, output_path=args.output, fps=args.fps)
+    if not args.no_daemon:
+        from pipeline_daemon import submit
+        ok = submit('export', **kwargs)
+        if ok is not None: raise SystemExit(0 if ok else 1)
+    if export_animation(**kwargs) is None:
+        raise SystemExit(1)
+
+# Exemple:
+# python export_animation.py --input animation_rotations.motion --output animation.glb
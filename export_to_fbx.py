@@ -1,56 +1,17 @@
 import bpy
-import json
 import sys
 import os
 import argparse
+import math
 from mathutils import Quaternion
 
-# Définition du squelette - Doit correspondre à calculate_rotations.py
-BONE_HIERARCHY = {
-    'hips': None, # Racine
-    'spine': 'hips',
-    'neck': 'spine',
-    'head': 'neck',
-    'left_upper_arm': 'spine',
-    'left_lower_arm': 'left_upper_arm',
-    'right_upper_arm': 'spine',
-    'right_lower_arm': 'right_upper_arm',
-    'left_upper_leg': 'hips',
-    'left_lower_leg': 'left_upper_leg',
-    'right_upper_leg': 'hips',
-    'right_lower_leg': 'right_upper_leg',
-}
-
-# Positions approximatives en T-Pose (en mètres)
-BONE_T_POSE_HEADS = {
-    'hips': (0, 0.9, 0),
-    'spine': (0, 1.0, 0),
-    'neck': (0, 1.4, 0),
-    'head': (0, 1.55, 0),
-    'left_upper_arm': (0.05, 1.4, 0),
-    'left_lower_arm': (0.4, 1.4, 0),
-    'right_upper_arm': (-0.05, 1.4, 0),
-    'right_lower_arm': (-0.4, 1.4, 0),
-    'left_upper_leg': (0.1, 0.9, 0),
-    'left_lower_leg': (0.1, 0.5, 0),
-    'right_upper_leg': (-0.1, 0.9, 0),
-    'right_lower_leg': (-0.1, 0.5, 0),
-}
-
-BONE_T_POSE_TAILS = {
-    'hips': (0, 1.0, 0), # Va vers la colonne
-    'spine': (0, 1.4, 0),
-    'neck': (0, 1.55, 0),
-    'head': (0, 1.7, 0),
-    'left_upper_arm': (0.4, 1.4, 0),
-    'left_lower_arm': (0.7, 1.4, 0),
-    'right_upper_arm': (-0.4, 1.4, 0),
-    'right_lower_arm': (-0.7, 1.4, 0),
-    'left_upper_leg': (0.1, 0.5, 0),
-    'left_lower_leg': (0.1, 0.1, 0),
-    'right_upper_leg': (-0.1, 0.5, 0),
-    'right_lower_leg': (-0.1, 0.1, 0),
-}
+# Blender n'ajoute pas le dossier du script au chemin d'import
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from motion_io import load_motion, iter_rotation_frames
+from skeleton import BONE_HIERARCHY, BONE_T_POSE_HEADS, BONE_T_POSE_TAILS
+
+DEFAULT_FPS = 30.0 # Anciens fichiers JSON sans cadence enregistrée
+
 
 def create_armature(name="MotionArmature"):
     bpy.ops.object.add(type='ARMATURE', enter_editmode=True, location=(0, 0, 0))
@@ -73,13 +34,24 @@ def create_armature(name="MotionArmature"):
     bpy.ops.object.mode_set(mode='OBJECT')
     return armature_obj
 
-def apply_animation(armature_obj, animation_data):
+def apply_animation(armature_obj, animation_data, fps=DEFAULT_FPS):
+    """
+    Insère les clés de rotation à la cadence fps de la scène. Chaque clé est placée à l'horodatage réel
+    de son image ('time_ms', image 1 à l'instant 0), sinon à son numéro d'image.
+    """
+    scene = bpy.context.scene
+    # render.fps est entier: fps_base porte le reste (ex: 29.97 images/s)
+    scene.render.fps = max(1, round(fps))
+    scene.render.fps_base = scene.render.fps / fps
     bpy.context.view_layer.objects.active = armature_obj
     bpy.ops.object.mode_set(mode='POSE')
 
+    first_frame = last_frame = None
     for frame_info in animation_data:
-        frame_num = frame_info['frame']
-        bpy.context.scene.frame_set(frame_num)
+        frame_num = frame_info['time_ms'] / 1000.0 * fps + 1 if 'time_ms' in frame_info else frame_info['frame']
+        scene.frame_set(int(frame_num), subframe=frame_num % 1)
+        if first_frame is None: first_frame = frame_num
+        last_frame = frame_num
 
         for bone_name, quat_xyzw in frame_info['rotations'].items():
             if bone_name in armature_obj.pose.bones:
@@ -91,13 +63,23 @@ def apply_animation(armature_obj, animation_data):
                 pose_bone.keyframe_insert(data_path="rotation_quaternion", frame=frame_num)
 
     bpy.ops.object.mode_set(mode='OBJECT')
+    # Entre deux clés (piste réduite), interpolation linéaire des quaternions, proche du SLERP de la réduction.
+    # Réglée sur les clés insérées, sans toucher aux préférences de Blender.
+    if armature_obj.animation_data and armature_obj.animation_data.action:
+        for fcurve in armature_obj.animation_data.action.fcurves:
+            for kp in fcurve.keyframe_points: kp.interpolation = 'LINEAR'
+    # L'export FBX échantillonne la plage de la scène: elle doit couvrir toute l'animation
+    if first_frame is not None:
+        scene.frame_start, scene.frame_end = math.floor(first_frame), math.ceil(last_frame)
 
 def export_fbx(armature_obj, output_path):
     bpy.ops.object.select_all(action='DESELECT')
     armature_obj.select_set(True)
     bpy.context.view_layer.objects.active = armature_obj
 
-    # Paramètres d'export pour Unreal Engine
+    # Paramètres d'export pour Unreal Engine. L'exporteur FBX ré-échantillonne toujours l'animation (bake):
+    # chaque image de la plage est écrite, sans simplification, pour reproduire exactement les courbes de
+    # Blender. Le fichier FBX n'est donc pas réduit par --key_tolerance, seule l'insertion des clés l'est.
     bpy.ops.export_scene.fbx(
         filepath=output_path,
         use_selection=True,
@@ -106,6 +88,8 @@ def export_fbx(armature_obj, output_path):
         object_types={'ARMATURE'},
         add_leaf_bones=False,
         bake_anim=True,
+        bake_anim_step=1.0,
+        bake_anim_simplify_factor=0.0,
         bake_anim_use_nla_strips=False, # Simplifie l'export d'animation
         bake_anim_use_all_actions=False,
         bake_anim_force_startend_keying=False,
@@ -120,25 +104,27 @@ def main():
         argv = []
 
     parser = argparse.ArgumentParser(description="Script Blender pour exporter une animation en FBX.")
-    parser.add_argument("--input_json", required=True, help="Fichier JSON d'entrée (rotations).")
+    parser.add_argument("--input", "--input_json", dest="input", required=True, help="Fichier d'entrée (rotations, .motion ou .json).")
     parser.add_argument("--output_fbx", required=True, help="Fichier FBX de sortie.")
     args = parser.parse_args(argv)
 
     # --- Exécution ---
-    print(f"[Blender] Chargement de: {args.input_json}")
-    with open(args.input_json, 'r') as f:
-        animation_data = json.load(f)
+    print(f"[Blender] Chargement de: {args.input}")
+    animation_tracks, meta = load_motion(args.input)
     
     # On ne traite que la première personne
-    person_id = next(iter(animation_data))
-    person_anim_data = animation_data[person_id]
+    person_id = next(iter(animation_tracks))
+    # Piste réduite: seules les clés de chaque os sont insérées, Blender interpole entre elles
+    person_anim_data = iter_rotation_frames(animation_tracks[person_id], meta['bones'], keys_only=True)
 
     # Nettoyer la scène
     bpy.ops.object.select_all(action='SELECT')
     bpy.ops.object.delete()
 
+    # Cadence de l'analyse (--sample_fps), comme le BVH; les clés gardent les horodatages réels
+    fps = meta.get('sample_fps') or meta.get('fps') or DEFAULT_FPS
     armature = create_armature()
-    apply_animation(armature, person_anim_data)
+    apply_animation(armature, person_anim_data, fps)
     export_fbx(armature, args.output_fbx)
 
     print(f"[Blender] Exportation terminée vers: {args.output_fbx}")
@@ -1,12 +1,27 @@
 
 import cv2
-import mediapipe as mp
-import json
 import argparse
 import os
 import logging
-from ultralytics import YOLO
-from mediapipe.framework.formats import landmark_pb2
+import time
+import pickle
+import json
+import numpy as np
+from motion_io import LANDMARK_GROUPS, PROFILES, profile_groups, landmarks_meta, save_motion, is_json_path, load_motion
+from frame_pipeline import FrameDecoder, ResultWriter, StageStats, log_throughput, seek_to_frame
+from holistic_pool import HolisticPool, RecyclingFactory
+from adaptive_sampling import AdaptiveSampler, KeyframeInterpolator, INFER, SKIP
+from roi_tracking import DetectionScheduler
+from track_gating import TrackGate, add_gating_arguments, gating_options
+from track_store import TrackStore
+from detectors import create_detector, add_detector_arguments, detector_options
+from metrics import Metrics
+from preview_overlay import DETAIL_LEVELS, PreviewOverlay, PreviewWindow, AnnotatedVideoWriter
+
+CHECKPOINT = 'checkpoint'
+
+# ultralytics (torch), onnxruntime et mediapipe sont lents à importer: ils ne le sont que dans les fonctions qui
+# chargent les modèles, pour que les modules qui n'utilisent que les utilitaires de ce fichier démarrent vite.
 
 def setup_logging():
     logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s', datefmt='%Y-%m-%d %H:%M:%S')
@@ -18,125 +33,371 @@ def parse_time_to_seconds(time_str):
     if len(parts) == 3: return parts[0] * 3600 + parts[1] * 60 + parts[2]
     return 0
 
-def landmarks_to_dict(landmark_list):
-    """Convertit une liste de landmarks MediaPipe en liste de dictionnaires."""
-    if not landmark_list: return None
-    return [{'x': lm.x, 'y': lm.y, 'z': lm.z, 'visibility': lm.visibility} for lm in landmark_list.landmark]
-
-def translate_landmarks_for_drawing(landmarks, crop_w, crop_h, x_offset, y_offset, frame_w, frame_h):
-    """Traduit les coordonnées normalisées d'un crop vers l'image complète."""
-    translated_landmarks = landmark_pb2.NormalizedLandmarkList()
-    for lm in landmarks.landmark:
-        new_lm = translated_landmarks.landmark.add()
-        new_lm.x = (lm.x * crop_w + x_offset) / frame_w
-        new_lm.y = (lm.y * crop_h + y_offset) / frame_h
-        new_lm.z = lm.z
-        new_lm.visibility = lm.visibility
-    return translated_landmarks
-
-def extract_holistic_motion(video_path, output_path, start_time_str=None, end_time_str=None, preview=False, conf=0.4, tracker="bytetrack.yaml"):
-    setup_logging()
-    logging.info(f"Initialisation des modèles. Tracker: {tracker}, Confiance: {conf}.")
-    yolo_model = YOLO('yolov8n.pt')
-    mp_holistic = mp.solutions.holistic
-    mp_drawing = mp.solutions.drawing_utils
-    holistic = mp_holistic.Holistic(
-        static_image_mode=False, model_complexity=2, # Upping complexity for better results
-        min_detection_confidence=0.5, min_tracking_confidence=0.5
-    )
-    logging.info("Modèles chargés.")
+def landmarks_to_array(landmark_list, count):
+    """Convertit une liste de landmarks MediaPipe en tableau (count, 4) de x, y, z, visibility (NaN si absente)."""
+    if not landmark_list: return np.full((count, 4), np.nan, dtype=np.float32)
+    return np.array([(lm.x, lm.y, lm.z, lm.visibility) for lm in landmark_list.landmark], dtype=np.float32)
+
+def crop_person(image, box, padding=10):
+    """Découpe la boîte (x1, y1, x2, y2) agrandie de padding pixels. Retourne (crop, x1 du crop, y1 du crop)."""
+    frame_h, frame_w = image.shape[:2]
+    x1, y1, x2, y2 = box
+    y1_pad, y2_pad = max(0, y1 - padding), min(frame_h, y2 + padding)
+    x1_pad, x2_pad = max(0, x1 - padding), min(frame_w, x2 + padding)
+    return image[y1_pad:y2_pad, x1_pad:x2_pad], x1_pad, y1_pad
 
+def frame_range(cap, start_time_str=None, end_time_str=None):
+    """Convertit les temps de début/fin (MM:SS) en positions d'image [début, fin) pour une vidéo ouverte."""
+    fps, total_frames = cap.get(cv2.CAP_PROP_FPS), cap.get(cv2.CAP_PROP_FRAME_COUNT)
+    start_frame = int(parse_time_to_seconds(start_time_str) * fps) if start_time_str else 0
+    end_frame = int(parse_time_to_seconds(end_time_str) * fps) if end_time_str else int(total_frames)
+    return start_frame, end_frame
+
+def extract_tracks_sharded(video_path, start_time_str=None, end_time_str=None, conf=0.4, tracker="bytetrack.yaml", workers=None, overlap=30, **options):
+    """Extraction découpée en segments temporels traités en parallèle (voir parallel_extract.py)."""
+    from parallel_extract import extract_tracks_parallel
+    setup_logging()
     cap = cv2.VideoCapture(video_path)
     if not cap.isOpened():
         logging.error(f"Impossible d'ouvrir la vidéo: {video_path}")
-        return
+        return None
+    start_frame, end_frame = frame_range(cap, start_time_str, end_time_str)
+    cap.release()
+    return extract_tracks_parallel(video_path, start_frame, end_frame, conf, tracker, workers, overlap, **options)
 
-    fps, total_frames, frame_h, frame_w = (cap.get(p) for p in [cv2.CAP_PROP_FPS, cv2.CAP_PROP_FRAME_COUNT, cv2.CAP_PROP_FRAME_HEIGHT, cv2.CAP_PROP_FRAME_WIDTH])
-    frame_h, frame_w = int(frame_h), int(frame_w)
+# Attribut des résultats MediaPipe pour chaque groupe (la pose en coordonnées "world", en mètres)
+RESULT_FIELDS = {'pose': 'pose_world_landmarks', 'face': 'face_landmarks', 'left_hand': 'left_hand_landmarks', 'right_hand': 'right_hand_landmarks'}
 
-    start_frame = int(parse_time_to_seconds(start_time_str) * fps) if start_time_str else 0
-    end_frame = int(parse_time_to_seconds(end_time_str) * fps) if end_time_str else total_frames
-    if start_frame > 0: cap.set(cv2.CAP_PROP_POS_FRAMES, start_frame)
-    logging.info(f"Traitement de l'image {start_frame} à {end_frame}.")
-
-    tracked_skeletons = {}
-    frame_count = start_frame
-
-    while cap.isOpened():
-        if frame_count >= end_frame: break
-        success, frame = cap.read()
-        if not success: break
-        frame_count += 1
-
-        annotated_frame = frame.copy() if preview else None
-        yolo_results = yolo_model.track(source=frame, tracker=tracker, classes=0, conf=conf, verbose=False)
-        
-        if yolo_results[0].boxes.id is not None:
-            tracked_boxes = yolo_results[0].boxes.xyxy.cpu().numpy().astype(int)
-            track_ids = yolo_results[0].boxes.id.cpu().numpy().astype(int)
-            image_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-
-            for box, track_id in zip(tracked_boxes, track_ids):
-                x1, y1, x2, y2 = box
-                padding = 10
-                y1_pad, y2_pad = max(0, y1 - padding), min(frame_h, y2 + padding)
-                x1_pad, x2_pad = max(0, x1 - padding), min(frame_w, x2 + padding)
-                
-                person_crop = image_rgb[y1_pad:y2_pad, x1_pad:x2_pad]
-                if person_crop.size == 0: continue
-
-                results = holistic.process(person_crop)
-
-                if results.pose_world_landmarks:
-                    all_landmarks = {
-                        'pose': landmarks_to_dict(results.pose_world_landmarks),
-                        'face': landmarks_to_dict(results.face_landmarks),
-                        'left_hand': landmarks_to_dict(results.left_hand_landmarks),
-                        'right_hand': landmarks_to_dict(results.right_hand_landmarks)
-                    }
-                    if track_id not in tracked_skeletons: tracked_skeletons[track_id] = []
-                    tracked_skeletons[track_id].append({'frame': frame_count, 'landmarks': all_landmarks})
-
-                if preview:
-                    cv2.rectangle(annotated_frame, (x1, y1), (x2, y2), (0, 255, 0), 2)
-                    cv2.putText(annotated_frame, f"ID: {track_id}", (x1, y1 - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 255, 0), 2)
-                    crop_h, crop_w, _ = person_crop.shape
-                    
-                    # Dessin du squelette complet
-                    for landmark_type, connections, color in [
-                        (results.pose_landmarks, mp_holistic.POSE_CONNECTIONS, (255,0,0)),
-                        (results.face_landmarks, mp_holistic.FACEMESH_TESSELATION, (80,110,10)),
-                        (results.left_hand_landmarks, mp_holistic.HAND_CONNECTIONS, (80,22,10)),
-                        (results.right_hand_landmarks, mp_holistic.HAND_CONNECTIONS, (80,44,121))]:
-                        
-                        if landmark_type:
-                            translated_lm = translate_landmarks_for_drawing(landmark_type, crop_w, crop_h, x1_pad, y1_pad, frame_w, frame_h)
-                            mp_drawing.draw_landmarks(annotated_frame, translated_lm, connections, 
-                                                    mp_drawing.DrawingSpec(color=color, thickness=1, circle_radius=1),
-                                                    mp_drawing.DrawingSpec(color=color, thickness=1))
-
-            if preview:
-                cv2.imshow("MotionExtract Preview", annotated_frame)
-                if cv2.waitKey(1) & 0xFF == ord('q'): break
-
-        if frame_count % 30 == 0: logging.info(f"Image traitée: {frame_count}/{int(end_frame)}")
+def landmark_model_factory(profile, model_complexity=2):
+    """Fonction créant une instance du modèle MediaPipe du profil (mode vidéo)."""
+    import mediapipe as mp
+    options = dict(static_image_mode=False, model_complexity=model_complexity, min_detection_confidence=0.5, min_tracking_confidence=0.5)
+    if PROFILES[profile]['model'] == 'pose': return lambda: mp.solutions.pose.Pose(**options)
+    return lambda: mp.solutions.holistic.Holistic(**options)
 
-    cap.release()
-    holistic.close()
-    if preview: cv2.destroyAllWindows()
-    logging.info("Ressources libérées.")
+class ResidentModels:
+    """
+    Modèles chargés une seule fois et gardés d'une extraction à l'autre (mode batch): les détecteurs
+    (un par jeu d'options), dont le tracker est remis à zéro à chaque vidéo, et les instances MediaPipe
+    libérées, recyclées par profil et complexité. threads: threads d'un détecteur dont les options n'en fixent pas.
+    """
+
+    def __init__(self, max_idle=8, threads=0):
+        self.max_idle = max_idle
+        self.threads = threads
+        self.detectors = {}
+        self.factories = {}
+
+    def detector(self, options=None):
+        key = json.dumps(options or {}, sort_keys=True)
+        if key not in self.detectors: self.detectors[key] = create_detector(options, self.threads)
+        else: self.detectors[key].reset()
+        return self.detectors[key]
+
+    def landmark_factory(self, profile, model_complexity=2):
+        key = (PROFILES[profile]['model'], model_complexity)
+        if key not in self.factories:
+            self.factories[key] = RecyclingFactory(landmark_model_factory(profile, model_complexity), self.max_idle)
+        return self.factories[key]
+
+    def close(self):
+        for factory in self.factories.values(): factory.close()
+
+def holistic_results_to_array(results, groups=LANDMARK_GROUPS):
+    """Concatène les landmarks des groupes demandés (Holistic ou Pose): tableau (points, 4), NaN si absents."""
+    return np.concatenate([landmarks_to_array(getattr(results, RESULT_FIELDS[name], None), count) for name, count in groups])
+
+def extract_tracks(video_path, start_time_str=None, end_time_str=None, preview=False, conf=0.4, tracker="bytetrack.yaml", queue_depth=8,
+                   start_frame=None, end_frame=None, max_holistic=8, adaptive_threshold=None, max_stride=5, probe_every=0,
+                   output_path=None, resume=False, checkpoint_every=300, metrics=None, profile='holistic', model_complexity=2, models=None,
+                   detect_every=1, roi_min_visibility=0.5, sample_fps=None, gating=None, detector=None, preview_detail='contours', preview_output=None):
+    """
+    Extrait les landmarks de toutes les personnes suivies. Retourne (tracks, meta), ou None en cas d'erreur.
+    Le décodage et la conversion/stockage des résultats tournent dans leurs propres threads, avec des files
+    de queue_depth éléments, pour que l'inférence (YOLO + Holistic) ne les attende jamais.
+    start_frame/end_frame, s'ils sont fournis, remplacent les temps de début et de fin.
+    Chaque piste a sa propre instance Holistic (au plus max_holistic, 0 pour une instance partagée).
+    adaptive_threshold active l'inférence adaptative (voir adaptive_sampling.py): Holistic n'est relancé que si
+    la boîte a bougé de plus de cette fraction de sa diagonale, ou toutes les max_stride images.
+    Avec output_path (.motion), les images sont écrites sur disque toutes les checkpoint_every images avec
+    un checkpoint (mémoire constante), et resume=True reprend une extraction interrompue à son dernier checkpoint.
+    Les latences de chaque sous-étape sont enregistrées dans metrics (un Metrics, créé si absent).
+    profile choisit le modèle MediaPipe et les groupes de landmarks stockés (voir PROFILES).
+    models (ResidentModels) fournit des modèles déjà chargés, réutilisés au lieu d'être rechargés.
+    detect_every > 1 ne lance YOLO + ByteTrack qu'une image sur detect_every (voir roi_tracking.py): entre deux,
+    le crop de chaque piste suit ses landmarks de pose, et une visibilité moyenne sous roi_min_visibility relance la détection.
+    sample_fps (inférieur à la cadence de la vidéo) ne traite qu'environ sample_fps images par seconde: les autres sont lues
+    sans être converties. Chaque image stockée porte son horodatage réel (colonne 'times', en ms).
+    gating (dict d'options, voir track_gating.GATING_DEFAULTS) écarte de l'inférence les pistes trop petites, trop
+    récentes, au-delà des K premières ou hors d'une liste d'identifiants.
+    detector (dict d'options, voir detectors.DETECTOR_DEFAULTS) choisit le backend du détecteur de personnes.
+    preview affiche les images annotées (boîtes et landmarks, niveau de détail preview_detail, voir preview_overlay.DETAIL_LEVELS);
+    preview_output les écrit dans une vidéo, depuis un thread d'écriture, sans fenêtre.
+    """
+    setup_logging()
+    metrics = metrics or Metrics()
+    logging.info(f"Initialisation des modèles. Tracker: {tracker}, Confiance: {conf}, Profil: {profile} (complexité {model_complexity}).")
+    person_detector = models.detector(detector) if models else create_detector(detector)
+    groups = profile_groups(profile)
+    factory = models.landmark_factory(profile, model_complexity) if models else landmark_model_factory(profile, model_complexity)
+    holistic_pool = HolisticPool(factory, max_instances=max_holistic)
+    logging.info("Modèles chargés.")
+
+    cap = cv2.VideoCapture(video_path)
+    window = PreviewWindow() if preview else None
+    # La vidéo, les instances MediaPipe et la fenêtre sont libérées quelle que soit la sortie (erreur, reprise, 'q')
+    try:
+        if not cap.isOpened():
+            logging.error(f"Impossible d'ouvrir la vidéo: {video_path}")
+            return None
+
+        fps, frame_h, frame_w = (cap.get(p) for p in [cv2.CAP_PROP_FPS, cv2.CAP_PROP_FRAME_HEIGHT, cv2.CAP_PROP_FRAME_WIDTH])
+        frame_h, frame_w = int(frame_h), int(frame_w)
+
+        time_range = frame_range(cap, start_time_str, end_time_str)
+        if start_frame is None: start_frame = time_range[0]
+        if end_frame is None: end_frame = time_range[1]
+        if sample_fps and sample_fps >= fps: sample_fps = None # Rien à sauter
+        meta = landmarks_meta(groups, fps=float(fps), columns=['boxes', 'inferred', 'times'], source=os.path.abspath(video_path), profile=profile,
+                              frame_range=[int(start_frame), int(end_frame)], sample_fps=sample_fps)
+
+        # L'échantillonnage adaptatif et la détection espacée comptent en images de la vidéo: écart entre deux images traitées
+        stride = max(1, round(fps / sample_fps)) if sample_fps else 1
+        sampler = AdaptiveSampler(adaptive_threshold, max_stride * stride, probe_every) if adaptive_threshold is not None else None
+        scheduler = DetectionScheduler(detect_every * stride, roi_min_visibility) if detect_every > 1 else None
+        gate = TrackGate.from_options(gating)
+        store, resume_state = TrackStore(list(meta['arrays'])), None
+        if output_path:
+            resumed = TrackStore.resume(output_path) if resume else None
+            if resumed and resumed[1] is None:
+                logging.info(f"Extraction déjà terminée: {output_path}")
+                return load_motion(output_path)
+            if resumed:
+                store, checkpoint, resume_state = resumed
+                if store.writer.meta['groups'] != meta['groups'] or store.writer.meta['arrays'] != meta['arrays']:
+                    logging.error(f"Le fichier à reprendre a été extrait avec un autre profil ({store.writer.meta.get('profile')}) ou une autre version.")
+                    return None
+                if any(store.writer.meta.get(key) != meta[key] for key in ('source', 'frame_range', 'sample_fps')):
+                    logging.warning("Le checkpoint a été créé avec une autre vidéo, une autre plage d'images ou une autre cadence.")
+                start_frame = checkpoint['frame']
+                logging.info(f"Reprise de l'extraction après l'image {start_frame}.")
+            else:
+                if resume: logging.info("Aucun checkpoint à reprendre, extraction complète.")
+                store = TrackStore.create(output_path, meta)
+
+        seek_to_frame(cap, start_frame)
+        logging.info(f"Traitement de l'image {start_frame} à {end_frame}" + (f", {sample_fps:g} images/s sur {fps:g}." if sample_fps else "."))
+
+        interpolator = KeyframeInterpolator(store.append, error_slice=slice(0, 33))
+        if resume_state:
+            interpolator.set_state(resume_state['interpolator'])
+            if resume_state['sampler'] is not None: sampler = pickle.loads(resume_state['sampler'])
+            if scheduler and resume_state.get('scheduler') is not None: scheduler = pickle.loads(resume_state['scheduler'])
+            if gate and resume_state.get('gate') is not None: gate = pickle.loads(resume_state['gate'])
+            if resume_state.get('detector', 'ultralytics') != person_detector.name:
+                logging.warning(f"Le checkpoint a été créé avec le détecteur {resume_state.get('detector', 'ultralytics')}: les pistes repartent de zéro.")
+            elif resume_state['tracker'] is not None:
+                person_detector.set_state(resume_state['tracker'], (frame_h, frame_w), tracker)
+
+        def store_results(item):
+            decision, frame_num, time_ms, track_id, box, results = item
+            if decision == CHECKPOINT:
+                with metrics.timer('checkpoint'):
+                    store.checkpoint(frame_num, dict(results, interpolator=interpolator.get_state()))
+                return
+            landmarks = None
+            if results is not None and results.pose_world_landmarks:
+                with metrics.timer('landmark_conversion'):
+                    landmarks = holistic_results_to_array(results, groups)
+            with metrics.timer('write'):
+                if decision == INFER: interpolator.keyframe(track_id, frame_num, time_ms, box, landmarks)
+                else: interpolator.skipped(track_id, frame_num, time_ms, box, landmarks)
+
+        # Ouverte avant tout thread: un chemin ou un codec invalide échoue sans rien démarrer (le finally libère le reste)
+        video_writer = AnnotatedVideoWriter(preview_output, sample_fps or fps, (frame_w, frame_h), queue_depth) if preview_output else None
+        decoder = FrameDecoder(cap, start_frame, end_frame, queue_depth, metrics, sample_fps)
+        writer = ResultWriter(store_results, queue_depth)
+        inference_stats = StageStats("Inférence")
+        overlay = PreviewOverlay(preview_detail) if preview or preview_output else None
+        decoder.start()
+        writer.start()
+
+        processed = 0
+        try:
+            for frame_count, frame, time_ms in decoder:
+                t0 = time.perf_counter()
+                processed += 1
+                # Le tracker du détecteur garde son état (pistes ByteTrack) d'une image à l'autre
+                if scheduler is None or scheduler.should_detect(frame_count):
+                    t_yolo = time.perf_counter()
+                    track_ids, tracked_boxes = person_detector.track(frame, conf, tracker)
+                    n_tracks = len(track_ids)
+                    metrics.record('yolo_track', time.perf_counter() - t_yolo, n_tracks)
+                    if scheduler: scheduler.detected(frame_count, track_ids, tracked_boxes)
+                else:
+                    # Pas de détection: boîtes déduites des landmarks de l'image précédente
+                    track_ids, tracked_boxes = scheduler.propagated()
+                    n_tracks = len(track_ids)
+
+                if gate and n_tracks:
+                    keep = gate.select(track_ids, tracked_boxes, (frame_w, frame_h))
+                    track_ids, tracked_boxes = track_ids[keep], tracked_boxes[keep]
+                    n_tracks = len(track_ids)
+
+                if n_tracks:
+                    with metrics.timer('color_conversion', n_tracks):
+                        image_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+
+                    for box, track_id in zip(tracked_boxes, track_ids):
+                        t_crop = time.perf_counter()
+                        person_crop, x1_pad, y1_pad = crop_person(image_rgb, box)
+                        metrics.record('crop', time.perf_counter() - t_crop, n_tracks)
+                        if person_crop.size == 0: continue
+
+                        decision = sampler.decide(track_id, frame_count, box) if sampler else INFER
+                        results = None
+                        if decision != SKIP:
+                            with metrics.timer('holistic', n_tracks):
+                                results = holistic_pool.process(track_id, person_crop, frame_count)
+                            if scheduler:
+                                crop_h, crop_w = person_crop.shape[:2]
+                                scheduler.update(track_id, results.pose_landmarks, (x1_pad, y1_pad), (crop_w, crop_h), (frame_w, frame_h))
+
+                        # La conversion des landmarks (et l'interpolation) se fait dans le thread d'écriture
+                        if decision == INFER and results.pose_world_landmarks:
+                            writer.submit((INFER, frame_count, time_ms, track_id, box, results))
+                            if sampler: sampler.keyframe_done(track_id, frame_count, box)
+                        elif decision != INFER:
+                            writer.submit((decision, frame_count, time_ms, track_id, box, results))
+
+                        if overlay: overlay.add(track_id, box, results, (x1_pad, y1_pad), person_crop.shape[1::-1])
+
+                if overlay:
+                    # Les crops viennent de image_rgb: l'image décodée peut être annotée sur place, sans copie
+                    with metrics.timer('preview'):
+                        overlay.draw(frame)
+                    if video_writer: video_writer.write(frame)
+                    if window and not window.show(frame, time.perf_counter()): break
+                holistic_pool.evict_idle(frame_count)
+                inference_stats.add(time.perf_counter() - t0)
+                metrics.record('frame', time.perf_counter() - t0, n_tracks)
+
+                # Compté en images traitées: avec sample_fps, les numéros d'image ne sont pas consécutifs
+                if store.writer is not None and processed % checkpoint_every == 0:
+                    # Instantané de l'état du thread principal; le thread d'écriture y ajoute le sien
+                    main_state = {'detector': person_detector.name, 'tracker': person_detector.get_state(), 'sampler': pickle.dumps(sampler) if sampler else None,
+                                  'scheduler': pickle.dumps(scheduler) if scheduler else None, 'gate': pickle.dumps(gate) if gate else None}
+                    writer.submit((CHECKPOINT, frame_count, time_ms, None, None, main_state))
+
+                if processed % 30 == 0:
+                    logging.info(f"Image traitée: {frame_count}/{int(end_frame)}")
+                    log_throughput(decoder.stats, inference_stats, writer.stats,
+                                   queues={'décodage': decoder.qsize(), 'écriture': writer.qsize()})
+                    holistic_pool.log_stats()
+                    if scheduler: scheduler.log_stats()
+                    if gate: gate.log_stats()
+        finally:
+            decoder.stop()
+            writer.finish()
+            if video_writer: video_writer.close()
+        interpolator.finish()
+        log_throughput(decoder.stats, inference_stats, writer.stats, *([video_writer.stats] if video_writer else []))
+        if sample_fps: logging.info(f"Échantillonnage à {sample_fps:g} images/s: {decoder.stats.count} images converties, {decoder.grabbed_only} lues sans conversion.")
+        holistic_pool.log_stats()
+        if scheduler: scheduler.log_stats()
+        if gate: gate.log_stats()
+        if sampler:
+            logging.info(str(sampler))
+            interpolator.log_errors()
+        metrics.log_summary()
+        return store.finish(meta)
+    finally:
+        cap.release()
+        holistic_pool.close()
+        if window: window.close()
+        logging.info("Ressources libérées.")
 
-    with open(output_path, 'w') as f: json.dump({str(k): v for k, v in tracked_skeletons.items()}, f, indent=4)
-    logging.info(f"Données pour {len(tracked_skeletons)} pistes sauvegardées dans: {output_path}")
+def extract_holistic_motion(video_path, output_path, start_time_str=None, end_time_str=None, preview=False, conf=0.4, tracker="bytetrack.yaml", export_json=None, queue_depth=8,
+                            workers=1, overlap=30, max_holistic=8, adaptive_threshold=None, max_stride=5, probe_every=0,
+                            resume=False, checkpoint_every=300, metrics_path=None, profile='holistic', model_complexity=2, models=None,
+                            detect_every=1, roi_min_visibility=0.5, sample_fps=None, gating=None, detector=None, preview_detail='contours', preview_output=None):
+    """Extrait les pistes d'une vidéo et les sauvegarde dans output_path. Retourne output_path, ou None en cas d'erreur."""
+    # Sortie .motion en une passe: écriture au fil de l'eau, avec checkpoints
+    streamed = workers <= 1 and not is_json_path(output_path)
+    metrics = Metrics()
+    with metrics.stage('extraction'):
+        if workers > 1:
+            if preview or preview_output: logging.warning("La prévisualisation n'est pas disponible en extraction parallèle.")
+            # Les pistes des segments reviennent au processus principal: ni écriture au fil de l'eau, ni checkpoints
+            if resume: logging.warning("La reprise (--resume) n'est pas disponible en extraction parallèle: la vidéo est extraite en entier.")
+            if not is_json_path(output_path): logging.info("Extraction parallèle: les pistes sont gardées en mémoire et écrites à la fin, sans checkpoints.")
+            # Les sous-étapes des segments sont mesurées dans leurs processus: seule l'étape complète l'est ici
+            result = extract_tracks_sharded(video_path, start_time_str, end_time_str, conf, tracker, workers, overlap, max_holistic=max_holistic,
+                                            adaptive_threshold=adaptive_threshold, max_stride=max_stride, probe_every=probe_every,
+                                            profile=profile, model_complexity=model_complexity, detect_every=detect_every, roi_min_visibility=roi_min_visibility,
+                                            sample_fps=sample_fps, gating=gating, detector=detector)
+        else:
+            result = extract_tracks(video_path, start_time_str, end_time_str, preview, conf, tracker, queue_depth, max_holistic=max_holistic,
+                                    adaptive_threshold=adaptive_threshold, max_stride=max_stride, probe_every=probe_every,
+                                    output_path=output_path if streamed else None, resume=resume, checkpoint_every=checkpoint_every, metrics=metrics,
+                                    profile=profile, model_complexity=model_complexity, models=models, detect_every=detect_every, roi_min_visibility=roi_min_visibility,
+                                    sample_fps=sample_fps, gating=gating, detector=detector, preview_detail=preview_detail, preview_output=preview_output)
+    if metrics_path: metrics.save(metrics_path)
+    if result is None: return None
+    tracks, meta = result
+    if not streamed: save_motion(output_path, tracks, meta)
+    logging.info(f"Données pour {len(tracks)} pistes sauvegardées dans: {output_path}")
+    if export_json:
+        save_motion(export_json, tracks, meta)
+        logging.info(f"Export JSON: {export_json}")
+    return output_path
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(description="Extrait l'animation 3D complète (corps, visage, mains) de plusieurs personnes.")
     parser.add_argument("--input_video", required=True)
-    parser.add_argument("--output_json", required=True)
+    parser.add_argument("--output", "--output_json", dest="output", required=True, help="Fichier de sortie (.motion, ou .json pour l'ancien format).")
     parser.add_argument("--start_time", default=None, help="Début (MM:SS).")
     parser.add_argument("--end_time", default=None, help="Fin (MM:SS).")
     parser.add_argument("--preview", action="store_true", help="Affiche une prévisualisation.")
+    parser.add_argument("--preview_detail", default="contours", choices=list(DETAIL_LEVELS),
+                        help="Détail de la prévisualisation: boîtes seules, pose, pose et mains, contours du visage en plus, ou maillage complet du visage.")
+    parser.add_argument("--preview_output", default=None, help="Écrit la vidéo annotée dans ce fichier (.mp4), sans fenêtre.")
     parser.add_argument("--conf", type=float, default=0.4, help="Seuil de confiance YOLO (0.0-1.0).")
     parser.add_argument("--tracker", default="bytetrack.yaml", help="Tracker à utiliser (ex: bytetrack.yaml).")
+    parser.add_argument("--export_json", default=None, help="Exporte aussi les données au format JSON.")
+    parser.add_argument("--queue_depth", type=int, default=8, help="Taille des files entre décodage, inférence et écriture.")
+    parser.add_argument("--workers", type=int, default=1, help="Nombre de processus: la vidéo est découpée en segments traités en parallèle.")
+    parser.add_argument("--overlap", type=int, default=30, help="Images de chevauchement entre segments, pour raccorder les pistes.")
+    parser.add_argument("--max_holistic", type=int, default=8, help="Instances Holistic simultanées (une par piste, LRU). 0: une instance partagée.")
+    parser.add_argument("--adaptive_threshold", type=float, default=None,
+                        help="Active l'inférence adaptative: déplacement de boîte (fraction de sa diagonale) au-delà duquel Holistic est relancé.")
+    parser.add_argument("--max_stride", type=int, default=5, help="Inférence adaptative: écart maximal entre deux images inférées.")
+    parser.add_argument("--probe_every", type=int, default=0, help="Inférence adaptative: infère quand même 1 image sautée sur N pour mesurer l'erreur d'interpolation.")
+    parser.add_argument("--resume", action="store_true", help="Reprend une extraction interrompue à son dernier checkpoint.")
+    parser.add_argument("--checkpoint_every", type=int, default=300, help="Écrit les données et un checkpoint toutes les N images (sortie .motion).")
+    parser.add_argument("--metrics", default=None, help="Sauvegarde les latences des sous-étapes et les mesures de l'extraction (.json).")
+    parser.add_argument("--profile", default="holistic", choices=list(PROFILES),
+                        help="pose: modèle Pose seul (33 points); pose_hands: Holistic sans stocker le visage; holistic: tous les points.")
+    parser.add_argument("--model_complexity", type=int, default=2, choices=[0, 1, 2], help="Complexité du modèle MediaPipe (vitesse / précision).")
+    parser.add_argument("--detect_every", type=int, default=1,
+                        help="Lance YOLO + ByteTrack une image sur N; entre deux, le crop de chaque piste suit ses landmarks de pose.")
+    parser.add_argument("--roi_min_visibility", type=float, default=0.5, help="Détection espacée: visibilité moyenne de la pose sous laquelle la détection est relancée.")
+    parser.add_argument("--sample_fps", type=float, default=None,
+                        help="Cadence d'analyse (images/s): les images en trop sont lues sans être décodées en couleur. Par défaut: toutes les images.")
+    add_gating_arguments(parser)
+    add_detector_arguments(parser)
+    parser.add_argument("--no_daemon", action="store_true", help="N'utilise pas le démon (pipeline_daemon.py) même s'il tourne.")
     args = parser.parse_args()
-    extract_holistic_motion(args.input_video, args.output_json, args.start_time, args.end_time, args.preview, args.conf, args.tracker)
+    kwargs = dict(video_path=args.input_video, output_path=args.output, start_time_str=args.start_time, end_time_str=args.end_time, conf=args.conf,
+                  tracker=args.tracker, export_json=args.export_json, queue_depth=args.queue_depth, workers=args.workers, overlap=args.overlap,
+                  max_holistic=args.max_holistic, adaptive_threshold=args.adaptive_threshold, max_stride=args.max_stride, probe_every=args.probe_every,
+                  resume=args.resume, checkpoint_every=args.checkpoint_every, metrics_path=args.metrics, profile=args.profile, model_complexity=args.model_complexity,
+                  detect_every=args.detect_every, roi_min_visibility=args.roi_min_visibility, sample_fps=args.sample_fps,
+                  gating=gating_options(args), detector=detector_options(args), preview_detail=args.preview_detail, preview_output=args.preview_output)
+    # La prévisualisation ouvre une fenêtre: elle reste dans ce processus
+    if not args.preview and not args.no_daemon:
+        from pipeline_daemon import submit
+        ok = submit('extract', **kwargs)
+        if ok is not None: raise SystemExit(0 if ok else 1)
+    if extract_holistic_motion(preview=args.preview, **kwargs) is None:
+        raise SystemExit(1)
@@ -0,0 +1,163 @@
+import logging
+import queue
+import threading
+import time
+
+# Étapes producteur/consommateur pour l'extraction: un thread de décodage qui lit les images
+# en avance, l'inférence dans le thread principal, et un thread d'écriture qui convertit et
+# stocke les résultats. Les files sont bornées pour limiter la mémoire, et l'ordre des images
+# est conservé puisque chaque étape n'a qu'un seul thread.
+
+_END = object()
+
+class StageStats:
+    """Compte les éléments traités et le temps actif d'une étape, pour en déduire son débit."""
+
+    def __init__(self, name):
+        self.name = name
+        self.count = 0
+        self.busy = 0.0
+        self._lock = threading.Lock()
+
+    def add(self, seconds, count=1):
+        with self._lock:
+            self.count += count
+            self.busy += seconds
+
+    def throughput(self):
+        return self.count / self.busy if self.busy > 0 else 0.0
+
+    def __str__(self):
+        return f"{self.name}: {self.count} en {self.busy:.1f}s actives ({self.throughput():.1f}/s)"
+
+def _put(q, item, stop_event):
+    """Ajoute un élément à une file bornée sans bloquer indéfiniment si le pipeline s'arrête."""
+    while not stop_event.is_set():
+        try:
+            q.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+def seek_to_frame(cap, frame_num):
+    """
+    Place cap avant l'image frame_num. Le backend saute à l'image clé qui la précède et décode jusqu'à elle;
+    s'il ne sait pas se positionner exactement, on avance avec grab() seul (sans conversion en image BGR).
+    """
+    import cv2
+    if frame_num <= 0: return
+    cap.set(cv2.CAP_PROP_POS_FRAMES, frame_num)
+    position = int(cap.get(cv2.CAP_PROP_POS_FRAMES))
+    if position == frame_num: return
+    if position > frame_num:
+        cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+        position = 0
+    while position < frame_num and cap.grab(): position += 1
+
+class FrameDecoder(threading.Thread):
+    """
+    Lit les images d'un cv2.VideoCapture dans un thread et les met en file (numéro, image, horodatage en ms).
+    Avec sample_fps, seule la première image de chaque intervalle de 1/sample_fps s (grille alignée sur le début
+    de la vidéo) est convertie: les autres sont seulement lues (grab), sans le coût de retrieve().
+    """
+
+    def __init__(self, cap, start_frame, end_frame, queue_depth=8, metrics=None, sample_fps=None):
+        super().__init__(name="FrameDecoder", daemon=True)
+        self.cap = cap
+        self.metrics = metrics
+        self.start_frame, self.end_frame = start_frame, end_frame
+        self.sample_fps = sample_fps
+        self.queue = queue.Queue(maxsize=max(1, queue_depth))
+        self.stats = StageStats("Décodage")
+        self.grabbed_only = 0
+        self.stop_event = threading.Event()
+        self.error = None
+
+    def run(self):
+        import cv2
+        frame_count, last_time, last_slot = self.start_frame, None, None
+        frame_ms = 1000.0 / (self.cap.get(cv2.CAP_PROP_FPS) or 30.0)
+        try:
+            while frame_count < self.end_frame and not self.stop_event.is_set():
+                t0 = time.perf_counter()
+                if not self.cap.grab(): break
+                frame_count += 1
+                time_ms = self.cap.get(cv2.CAP_PROP_POS_MSEC)
+                # Backend sans horodatage (ou horodatage qui n'avance pas): cadence nominale
+                if last_time is not None and time_ms <= last_time: time_ms = last_time + frame_ms
+                last_time = time_ms
+                if self.sample_fps:
+                    slot = int(time_ms * self.sample_fps / 1000.0 + 1e-6)
+                    if slot == last_slot:
+                        self.grabbed_only += 1
+                        self.stats.add(time.perf_counter() - t0, count=0)
+                        continue
+                    last_slot = slot
+                success, frame = self.cap.retrieve()
+                if not success: break
+                elapsed = time.perf_counter() - t0
+                self.stats.add(elapsed)
+                if self.metrics: self.metrics.record('decode', elapsed)
+                if not _put(self.queue, (frame_count, frame, time_ms), self.stop_event): return
+        except Exception as e:
+            self.error = e
+        finally:
+            _put(self.queue, _END, self.stop_event)
+
+    def __iter__(self):
+        """Itère sur les images décodées, dans l'ordre, jusqu'à la fin de la plage."""
+        while True:
+            item = self.queue.get()
+            if item is _END: break
+            yield item
+        if self.error: raise self.error
+
+    def qsize(self):
+        return self.queue.qsize()
+
+    def stop(self):
+        self.stop_event.set()
+        self.join()
+
+class ResultWriter(threading.Thread):
+    """Consomme des résultats dans un thread et les passe à handler(item), dans l'ordre de soumission."""
+
+    def __init__(self, handler, queue_depth=8, name="Écriture"):
+        super().__init__(name="ResultWriter", daemon=True)
+        self.handler = handler
+        self.queue = queue.Queue(maxsize=max(1, queue_depth))
+        self.stats = StageStats(name)
+        self.stop_event = threading.Event()
+        self.error = None
+
+    def run(self):
+        while True:
+            item = self.queue.get()
+            if item is _END: return
+            if self.error: continue
+            t0 = time.perf_counter()
+            try:
+                self.handler(item)
+            except Exception as e:
+                self.error = e
+            self.stats.add(time.perf_counter() - t0)
+
+    def submit(self, item):
+        if self.error: raise self.error
+        _put(self.queue, item, self.stop_event)
+
+    def qsize(self):
+        return self.queue.qsize()
+
+    def finish(self):
+        """Attend que tous les résultats soumis soient traités."""
+        _put(self.queue, _END, self.stop_event)
+        self.join()
+        if self.error: raise self.error
+
+def log_throughput(*stats, queues=None):
+    """Journalise le débit de chaque étape et, si fourni, le remplissage des files."""
+    message = " | ".join(str(s) for s in stats)
+    if queues: message += " | Files: " + ", ".join(f"{name}={size}" for name, size in queues.items())
+    logging.info(message)
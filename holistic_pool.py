@@ -0,0 +1,109 @@
+import logging
+from collections import OrderedDict
+
+class HolisticPool:
+    """
+    Garde une instance Holistic (mode vidéo) par piste active, pour que l'état de suivi interne de
+    MediaPipe soit toujours construit sur le crop de la même personne.
+
+    Le nombre d'instances est plafonné par max_instances: au-delà, la piste utilisée le moins
+    récemment perd son instance (LRU). Les instances des pistes absentes depuis plus de
+    max_idle_frames images sont aussi libérées. max_instances=0 reproduit l'ancien comportement
+    (une seule instance partagée par toutes les pistes).
+
+    MediaPipe n'expose pas s'il a relancé sa détection: on compte un appel comme "suivi seul" quand
+    l'instance a trouvé une pose au crop précédent de la même piste, et comme "détection" sinon.
+    """
+
+    def __init__(self, factory, max_instances=8, max_idle_frames=90):
+        self.factory = factory
+        self.max_instances = max_instances
+        self.max_idle_frames = max_idle_frames
+        # clé -> [instance, piste du dernier appel ayant trouvé une pose, dernière image vue]
+        self.instances = OrderedDict()
+        self.detection_calls = 0
+        self.tracking_calls = 0
+        self.created = 0
+        self.evicted = 0
+
+    def _entry(self, key):
+        entry = self.instances.get(key)
+        if entry is not None:
+            self.instances.move_to_end(key)
+            return entry
+        while self.instances and len(self.instances) >= max(1, self.max_instances):
+            self._evict(next(iter(self.instances)))
+        entry = [self.factory(), None, None]
+        self.instances[key] = entry
+        self.created += 1
+        return entry
+
+    def _release(self, instance):
+        # Une fabrique qui recycle ses instances (mode batch) les reprend au lieu de les fermer
+        release = getattr(self.factory, 'release', None)
+        if release: release(instance)
+        else: instance.close()
+
+    def _evict(self, key):
+        self._release(self.instances.pop(key)[0])
+        self.evicted += 1
+
+    def process(self, track_id, image, frame_num=None):
+        """Traite le crop d'une piste avec l'instance qui lui est associée."""
+        entry = self._entry(track_id if self.max_instances > 0 else None)
+        if entry[1] == track_id: self.tracking_calls += 1
+        else: self.detection_calls += 1
+        results = entry[0].process(image)
+        entry[1] = track_id if results.pose_landmarks else None
+        entry[2] = frame_num
+        return results
+
+    def evict_idle(self, frame_num):
+        """Libère les instances des pistes non vues depuis plus de max_idle_frames images."""
+        if self.max_instances <= 0: return
+        stale = [key for key, (_, _, last_seen) in self.instances.items()
+                 if last_seen is not None and frame_num - last_seen > self.max_idle_frames]
+        for key in stale: self._evict(key)
+
+    def close(self):
+        for key in list(self.instances):
+            self._release(self.instances.pop(key)[0])
+
+    def __str__(self):
+        calls = self.detection_calls + self.tracking_calls
+        ratio = self.tracking_calls / calls if calls else 0.0
+        return (f"Holistic: {len(self.instances)} instances actives ({self.created} créées, {self.evicted} libérées), "
+                f"{self.detection_calls} détections / {self.tracking_calls} suivis seuls ({ratio:.0%} en suivi)")
+
+    def log_stats(self):
+        logging.info(str(self))
+
+class RecyclingFactory:
+    """
+    Fabrique d'instances qui garde les instances libérées (au plus max_idle) pour les réutiliser,
+    au lieu de recharger le modèle. Une instance réutilisée est réinitialisée (reset) pour ne pas
+    hériter de l'état de suivi de la personne précédente.
+    """
+
+    def __init__(self, factory, max_idle=8):
+        self.factory = factory
+        self.max_idle = max_idle
+        self.idle = []
+        self.loaded = 0
+        self.reused = 0
+
+    def __call__(self):
+        if self.idle:
+            instance = self.idle.pop()
+            instance.reset()
+            self.reused += 1
+            return instance
+        self.loaded += 1
+        return self.factory()
+
+    def release(self, instance):
+        if len(self.idle) < self.max_idle: self.idle.append(instance)
+        else: instance.close()
+
+    def close(self):
+        while self.idle: self.idle.pop().close()
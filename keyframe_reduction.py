@@ -0,0 +1,103 @@
+import logging
+import numpy as np
+from motion_io import rotations_meta, track_seconds
+from track_pool import map_tracks
+
+# Réduction des images clés des courbes de rotation. Pour chaque os, un Douglas-Peucker sur la courbe
+# de quaternions ne garde que les images qu'une interpolation SLERP entre les clés retenues ne sait pas
+# reconstituer à tolerance degrés près. Les lignes conservées d'une piste sont l'union des clés de ses os;
+# la colonne 'keys' (images, os) indique, pour chaque ligne, les os dont c'est une clé.
+
+def slerp(q0, q1, t):
+    """Interpolation sphérique entre quaternions (..., 4) [x, y, z, w], pour t (...) dans [0, 1]."""
+    dot = np.sum(q0 * q1, axis=-1)
+    q1 = np.where(dot[..., None] < 0, -q1, q1) # Chemin le plus court (q et -q sont la même rotation)
+    omega = np.arccos(np.clip(np.abs(dot), 0.0, 1.0))
+    sin_omega = np.sin(omega)
+    small = sin_omega < 1e-6
+    safe = np.where(small, 1.0, sin_omega)
+    w0 = np.where(small, 1.0 - t, np.sin((1.0 - t) * omega) / safe)
+    w1 = np.where(small, t, np.sin(t * omega) / safe)
+    q = w0[..., None] * q0 + w1[..., None] * q1
+    return q / np.linalg.norm(q, axis=-1, keepdims=True)
+
+def angle_error(q, ref):
+    """Angle (radians) de la rotation entre deux quaternions unitaires (..., 4)."""
+    return 2.0 * np.arccos(np.clip(np.abs(np.sum(q * ref, axis=-1)), 0.0, 1.0))
+
+def reduce_curve(times, quats, tolerance):
+    """
+    Douglas-Peucker sur une courbe de quaternions valides (n, 4): indices des clés (triés, extrémités comprises)
+    telles que le SLERP entre clés voisines reste à moins de tolerance radians de chaque image.
+    """
+    n = len(quats)
+    keep = np.zeros(n, dtype=bool)
+    keep[[0, n - 1]] = True
+    stack = [(0, n - 1)]
+    while stack:
+        a, b = stack.pop()
+        if b - a < 2: continue
+        t = (times[a + 1:b] - times[a]) / (times[b] - times[a])
+        errors = angle_error(slerp(quats[a], quats[b], t), quats[a + 1:b])
+        worst = int(np.argmax(errors))
+        if errors[worst] > tolerance:
+            split = a + 1 + worst
+            keep[split] = True
+            stack += [(a, split), (split, b)]
+    return np.flatnonzero(keep)
+
+def bone_keys(times, quats, tolerance):
+    """
+    Clés d'un os (masque (n,)): réduction de chaque suite d'images valides, et, pour chaque suite de NaN (os absent),
+    sa première et sa dernière image, pour qu'aucune interpolation ne la traverse.
+    """
+    valid = ~np.isnan(quats).any(axis=1)
+    keys = np.zeros(len(quats), dtype=bool)
+    # Limites des suites d'images de même validité
+    bounds = np.flatnonzero(np.diff(valid.astype(np.int8))) + 1
+    for start, end in zip(np.r_[0, bounds], np.r_[bounds, len(quats)]):
+        if valid[start]:
+            keys[start + reduce_curve(times[start:end], quats[start:end], tolerance)] = True
+        else:
+            keys[[start, end - 1]] = True
+    return keys
+
+def reduce_track(times, rotations, tolerance_deg):
+    """
+    Réduit une piste de rotations (images, os, 4) aux instants times. Retourne (indices des lignes conservées, keys
+    de ces lignes); les valeurs conservées sont celles d'origine, y compris pour les os dont la ligne n'est pas une clé.
+    """
+    rotations = np.asarray(rotations, dtype=np.float64)
+    if len(rotations) == 0: return np.empty(0, dtype=int), np.zeros(rotations.shape[:2], dtype=np.uint8)
+    times = np.asarray(times, dtype=np.float64)
+    keys = np.stack([bone_keys(times, rotations[:, b], np.radians(tolerance_deg)) for b in range(rotations.shape[1])], axis=1)
+    rows = np.flatnonzero(keys.any(axis=1))
+    return rows, keys[rows].astype(np.uint8)
+
+def _reduce_track(inputs, outputs, tolerance_deg, fps):
+    """Réduit une piste dans outputs (tâche de map_tracks). Retourne le nombre de lignes conservées."""
+    rows, keys = reduce_track(track_seconds(inputs, fps), inputs['rotations'], tolerance_deg)
+    outputs['keys'][:len(rows)] = keys
+    for column in outputs.keys() - {'keys'}:
+        outputs[column][:len(rows)] = inputs[column][rows]
+    return len(rows)
+
+def reduce_rotations(tracks, meta, tolerance_deg, workers=1):
+    """Réduit toutes les pistes de rotations (réparties sur workers processus). Retourne (tracks, meta) avec la colonne 'keys'."""
+    columns = ['times'] if 'times' in meta['arrays'] else []
+    output_specs = lambda track: dict({'frames': (track['frames'].shape, np.int32), 'rotations': (track['rotations'].shape, np.float32),
+                                       'keys': (track['rotations'].shape[:2], np.uint8)},
+                                      **{column: (track[column].shape, track[column].dtype) for column in columns})
+    results = map_tracks(_reduce_track, tracks, ['frames', 'rotations'] + columns, output_specs, workers,
+                         tolerance_deg=tolerance_deg, fps=meta.get('fps') or 30.0)
+    reduced, before, after, keys_before, keys_after = {}, 0, 0, 0, 0
+    for track_id, (outputs, count) in results.items():
+        reduced[track_id] = {column: values[:count] for column, values in outputs.items()}
+        before += len(tracks[track_id]['frames'])
+        after += count
+        keys_before += int(np.prod(tracks[track_id]['rotations'].shape[:2]))
+        keys_after += int(reduced[track_id]['keys'].sum())
+    ratio = keys_before / keys_after if keys_after else 0.0
+    logging.info(f"Réduction des clés (tolérance {tolerance_deg}°): {keys_after}/{keys_before} clés ({ratio:.1f}x moins), {after}/{before} lignes.")
+    return reduced, rotations_meta(meta['bones'], fps=meta.get('fps'), keys=True, columns=columns, source=meta.get('source'),
+                                   sample_fps=meta.get('sample_fps'), key_tolerance_deg=tolerance_deg)
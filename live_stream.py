@@ -0,0 +1,208 @@
+import argparse
+import json
+import logging
+import os
+import socket
+import threading
+import time
+import cv2
+import numpy as np
+from extract_motion import setup_logging, crop_person, holistic_results_to_array, landmark_model_factory
+from motion_io import profile_groups
+from holistic_pool import HolisticPool
+from smoother import OneEuroArrayFilter, DEFAULT_FPS
+from calculate_rotations import SKELETON_BONES, compute_track_rotations
+from metrics import Metrics
+from detectors import create_detector, add_detector_arguments, detector_options
+
+# Mode temps réel: les images d'une caméra, d'un flux ou d'un fichier lu à vitesse réelle passent une
+# par une par YOLO + MediaPipe Pose, le lissage One-Euro en ligne et le calcul des rotations, puis les
+# quaternions des os de chaque personne sont envoyés en UDP (un datagramme JSON par image).
+# Si l'inférence prend du retard, seules les images les plus récentes sont traitées: les autres
+# sont abandonnées plutôt que mises en file, pour que la latence reste bornée.
+
+# Seules les rotations sont envoyées: le profil 'pose' (graphe MediaPipe Pose) suffit
+PROFILE = 'pose'
+POSE_SLICE = slice(0, 33)
+
+class LatestFrameReader(threading.Thread):
+    """
+    Lit les images dans un thread et ne garde que la plus récente. Une image remplacée avant d'avoir
+    été prise par l'inférence est comptée comme abandonnée. realtime_fps cadence la lecture d'un fichier.
+    """
+
+    def __init__(self, cap, realtime_fps=None):
+        super().__init__(name="LatestFrameReader", daemon=True)
+        self.cap = cap
+        self.realtime_fps = realtime_fps
+        self.condition = threading.Condition()
+        self.latest = None   # (numéro d'image, instant de capture, image)
+        self.finished = False
+        self.read = 0
+        self.dropped = 0
+        self.stop_event = threading.Event()
+
+    def run(self):
+        start = time.perf_counter()
+        try:
+            while not self.stop_event.is_set():
+                success, frame = self.cap.read()
+                if not success: break
+                self.read += 1
+                if self.realtime_fps:
+                    delay = start + self.read / self.realtime_fps - time.perf_counter()
+                    if delay > 0: time.sleep(delay)
+                with self.condition:
+                    if self.latest is not None: self.dropped += 1
+                    self.latest = (self.read, time.perf_counter(), frame)
+                    self.condition.notify()
+        finally:
+            with self.condition:
+                self.finished = True
+                self.condition.notify()
+
+    def get(self):
+        """Attend et retourne l'image la plus récente, ou None quand la source est terminée."""
+        with self.condition:
+            while self.latest is None and not self.finished:
+                self.condition.wait()
+            item, self.latest = self.latest, None
+            return item
+
+    def stop(self):
+        self.stop_event.set()
+        self.join()
+
+def open_source(source):
+    """Ouvre une caméra (index), un flux (URL) ou un fichier. Retourne (cap, est_un_fichier)."""
+    if source.isdigit(): return cv2.VideoCapture(int(source)), False
+    return cv2.VideoCapture(source), os.path.isfile(source)
+
+class TrackSmoother:
+    """Un filtre One-Euro en ligne par piste, sur les landmarks de pose. Les pistes absentes trop longtemps sont oubliées."""
+
+    def __init__(self, freq, mincutoff=1.0, beta=0.0, max_idle_frames=90):
+        self.freq, self.mincutoff, self.beta = freq, mincutoff, beta
+        self.max_idle_frames = max_idle_frames
+        self.filters = {}  # piste -> [filtre, dernière image vue]
+
+    def __call__(self, track_id, pose, timestamp, frame_num):
+        entry = self.filters.get(track_id)
+        if entry is None:
+            entry = self.filters[track_id] = [OneEuroArrayFilter(pose.shape, self.freq, self.mincutoff, self.beta), frame_num]
+        entry[1] = frame_num
+        return entry[0](pose, timestamp)
+
+    def evict_idle(self, frame_num):
+        for track_id in [t for t, (_, last_seen) in self.filters.items() if frame_num - last_seen > self.max_idle_frames]:
+            del self.filters[track_id]
+
+def run_live(source, host="127.0.0.1", port=9763, conf=0.4, tracker="bytetrack.yaml", mincutoff=1.0, beta=0.0, realtime=True,
+             model_complexity=1, max_holistic=4, preview=False, metrics_path=None, detector=None):
+    """
+    Boucle temps réel. Chaque datagramme UDP envoyé à (host, port) contient:
+    {"frame", "time" (s depuis le début), "latency_ms" (capture -> envoi), "tracks": {id: {os: [x, y, z, w]}}}.
+    """
+    setup_logging()
+    cap, is_file = open_source(source)
+    if not cap.isOpened():
+        logging.error(f"Impossible d'ouvrir la source: {source}")
+        return None
+    fps = cap.get(cv2.CAP_PROP_FPS) or DEFAULT_FPS
+
+    logging.info(f"Initialisation des modèles. Tracker: {tracker}, Confiance: {conf}, Complexité Pose: {model_complexity}.")
+    person_detector = create_detector(detector)
+    groups = profile_groups(PROFILE)
+    holistic_pool = HolisticPool(landmark_model_factory(PROFILE, model_complexity), max_instances=max_holistic)
+    smoother = TrackSmoother(fps, mincutoff, beta)
+    bones = list(SKELETON_BONES)
+    metrics = Metrics()
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    logging.info(f"Envoi des rotations en UDP vers {host}:{port}.")
+
+    reader = LatestFrameReader(cap, fps if is_file and realtime else None)
+    start = time.perf_counter()
+    reader.start()
+    processed = 0
+    try:
+        while True:
+            item = reader.get()
+            if item is None: break
+            frame_num, captured, frame = item
+            timestamp = captured - start
+
+            with metrics.timer('yolo_track'):
+                track_ids, track_boxes = person_detector.track(frame, conf, tracker)
+            tracks = {}
+            if len(track_ids):
+                image_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+                for box, track_id in zip(track_boxes, track_ids):
+                    person_crop, _, _ = crop_person(image_rgb, box)
+                    if person_crop.size == 0: continue
+                    with metrics.timer('holistic', len(track_ids)):
+                        results = holistic_pool.process(track_id, person_crop, frame_num)
+                    if not results.pose_world_landmarks: continue
+
+                    t0 = time.perf_counter()
+                    pose = holistic_results_to_array(results, groups)[POSE_SLICE]
+                    smoothed = pose.copy()
+                    smoothed[:, :3] = smoother(track_id, pose[:, :3], timestamp, frame_num)
+                    _, rotations = compute_track_rotations([frame_num], smoothed[None], POSE_SLICE, bones)
+                    metrics.record('smoothing_rotations', time.perf_counter() - t0)
+                    if len(rotations):
+                        tracks[str(track_id)] = {bone: quat for bone, quat in zip(bones, rotations[0].tolist()) if not np.isnan(quat[3])}
+            holistic_pool.evict_idle(frame_num)
+            smoother.evict_idle(frame_num)
+
+            latency = time.perf_counter() - captured
+            packet = {'frame': frame_num, 'time': timestamp, 'latency_ms': latency * 1e3, 'tracks': tracks}
+            sock.sendto(json.dumps(packet).encode(), (host, port))
+            metrics.record('end_to_end', time.perf_counter() - captured, len(tracks))
+            processed += 1
+
+            if preview:
+                for box in track_boxes:
+                    cv2.rectangle(frame, tuple(int(v) for v in box[:2]), tuple(int(v) for v in box[2:]), (0, 255, 0), 2)
+                cv2.putText(frame, f"{latency * 1e3:.0f} ms", (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 255, 0), 2)
+                cv2.imshow("MotionExtract Live", frame)
+                if cv2.waitKey(1) & 0xFF == ord('q'): break
+
+            if processed % 100 == 0:
+                latencies = metrics.report()['steps']['end_to_end']
+                logging.info(f"{processed} images traitées, {reader.dropped} abandonnées. Latence: p50 {latencies['p50_ms']:.0f} ms, "
+                             f"p95 {latencies['p95_ms']:.0f} ms. {holistic_pool}")
+    except KeyboardInterrupt:
+        logging.info("Arrêt demandé.")
+    finally:
+        reader.stop()
+        cap.release()
+        holistic_pool.close()
+        sock.close()
+        if preview: cv2.destroyAllWindows()
+
+    elapsed = time.perf_counter() - start
+    logging.info(f"{processed} images traitées en {elapsed:.1f}s ({processed / elapsed if elapsed else 0:.1f} img/s), "
+                 f"{reader.dropped} abandonnées sur {reader.read} lues.")
+    if processed:
+        metrics.log_summary()
+        if metrics_path: metrics.save(metrics_path, source=source, read=reader.read, dropped=reader.dropped)
+    return metrics
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Mode temps réel: rotations lissées des os envoyées en UDP, image par image.")
+    parser.add_argument("--source", required=True, help="Index de caméra (ex: 0), URL d'un flux, ou fichier vidéo.")
+    parser.add_argument("--host", default="127.0.0.1", help="Destinataire des datagrammes UDP.")
+    parser.add_argument("--port", type=int, default=9763, help="Port UDP du destinataire.")
+    parser.add_argument("--conf", type=float, default=0.4, help="Seuil de confiance YOLO (0.0-1.0).")
+    parser.add_argument("--tracker", default="bytetrack.yaml", help="Tracker à utiliser (ex: bytetrack.yaml).")
+    parser.add_argument("--mincutoff", type=float, default=1.0, help="Lissage: fréquence de coupure minimale.")
+    parser.add_argument("--beta", type=float, default=0.0, help="Lissage: paramètre beta du filtre.")
+    parser.add_argument("--no_realtime", action="store_true", help="Lit un fichier aussi vite que possible au lieu de sa vitesse réelle.")
+    parser.add_argument("--model_complexity", type=int, default=1, choices=[0, 1, 2], help="Complexité du modèle Pose (latence / précision).")
+    parser.add_argument("--max_holistic", type=int, default=4, help="Instances MediaPipe simultanées (une par piste).")
+    parser.add_argument("--preview", action="store_true", help="Affiche les images traitées et la latence.")
+    parser.add_argument("--metrics", default=None, help="Sauvegarde les latences mesurées (.json).")
+    add_detector_arguments(parser)
+    args = parser.parse_args()
+    run_live(args.source, args.host, args.port, args.conf, args.tracker, args.mincutoff, args.beta, not args.no_realtime,
+             args.model_complexity, args.max_holistic, args.preview, args.metrics, detector_options(args))
@@ -0,0 +1,200 @@
+import os
+import sys
+import json
+import time
+import logging
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+import numpy as np
+
+try:
+    import resource  # Absent sous Windows: pas de pic mémoire ni de CPU des sous-processus
+except ImportError:
+    resource = None
+
+# Instrumentation du pipeline: latences des sous-étapes de l'extraction (décodage, YOLO, conversion
+# de couleur, crop, Holistic, conversion des landmarks, écriture), résumées en percentiles globaux et
+# par nombre de pistes dans l'image, et mesures de chaque étape (temps réel, temps CPU, pic de RSS).
+# Le tout est sauvegardé dans un fichier JSON par exécution.
+
+RSS_SAMPLE_INTERVAL = 0.05 # Secondes entre deux lectures de la RSS pendant une étape
+_PAGE_SIZE = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+
+def process_peak_rss_mb(children=False):
+    """
+    Pic de mémoire résidente depuis le début du processus (ou le plus gros de ses sous-processus terminés), en Mo.
+    Cumulatif: ce n'est pas le pic d'une étape (voir RssSampler).
+    """
+    if resource is None: return None
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF)
+    # ru_maxrss est en octets sous macOS, en kilo-octets ailleurs
+    return usage.ru_maxrss / (1e6 if sys.platform == 'darwin' else 1e3)
+
+def _child_pids(pid):
+    """Sous-processus directs (Linux: /proc/<pid>/task/*/children)."""
+    children = []
+    try:
+        for task in os.listdir(f"/proc/{pid}/task"):
+            with open(f"/proc/{pid}/task/{task}/children") as f: children += [int(c) for c in f.read().split()]
+    except OSError:
+        pass
+    return children
+
+def current_rss_mb(pid=None, children=True):
+    """RSS actuelle du processus et, avec children, de tous ses descendants vivants, en Mo (Linux, sinon None)."""
+    pid = pid or os.getpid()
+    try:
+        with open(f"/proc/{pid}/statm") as f: rss = int(f.read().split()[1]) * _PAGE_SIZE / 1e6
+    except (OSError, IndexError, ValueError):
+        return None
+    if children:
+        rss += sum(current_rss_mb(child) or 0.0 for child in _child_pids(pid))
+    return rss
+
+class RssSampler(threading.Thread):
+    """Lit la RSS (processus et descendants) toutes les interval secondes dans un thread, et garde la première et la plus haute valeur."""
+
+    def __init__(self, interval=RSS_SAMPLE_INTERVAL):
+        super().__init__(name="RssSampler", daemon=True)
+        self.interval = interval
+        self.start_mb = self.peak_mb = current_rss_mb()
+        self.stop_event = threading.Event()
+
+    def sample(self):
+        rss = current_rss_mb()
+        if rss is not None: self.peak_mb = max(self.peak_mb or 0.0, rss)
+
+    def run(self):
+        while not self.stop_event.wait(self.interval): self.sample()
+
+    def stop(self):
+        self.stop_event.set()
+        if self.is_alive(): self.join()
+        self.sample()
+
+def _children_cpu():
+    if resource is None: return 0.0
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+def summarize(seconds):
+    """Percentiles d'une liste de durées, en millisecondes."""
+    ms = np.asarray(seconds, dtype=np.float64) * 1e3
+    p50, p95, p99 = np.percentile(ms, [50, 95, 99])
+    return {'count': int(len(ms)), 'mean_ms': float(ms.mean()), 'p50_ms': float(p50), 'p95_ms': float(p95),
+            'p99_ms': float(p99), 'max_ms': float(ms.max())}
+
+class Metrics:
+    """Collecte des durées par sous-étape et des mesures par étape. Utilisable depuis plusieurs threads."""
+
+    def __init__(self):
+        self.samples = defaultdict(list)  # sous-étape -> [(secondes, nombre de pistes ou None)]
+        self.stages = {}
+        self.external_steps = {}           # sous-étapes déjà résumées, rapportées par un sous-processus
+        self._lock = threading.Lock()
+
+    def record(self, step, seconds, tracks=None):
+        with self._lock:
+            self.samples[step].append((seconds, tracks))
+
+    @contextmanager
+    def timer(self, step, tracks=None):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(step, time.perf_counter() - t0, tracks)
+
+    @contextmanager
+    def stage(self, name):
+        """
+        Mesure une étape complète: temps réel, CPU (processus et sous-processus lancés), pic de RSS pendant l'étape
+        (processus et descendants, échantillonné) et sa hausse par rapport au début de l'étape. process_peak_rss_mb
+        est le pic cumulé depuis le début du processus (getrusage), qui ne redescend jamais d'une étape à l'autre.
+        """
+        wall0, cpu0, children0 = time.perf_counter(), time.process_time(), _children_cpu()
+        sampler = RssSampler() if current_rss_mb() is not None else None
+        if sampler: sampler.start()
+        try:
+            yield
+        finally:
+            if sampler: sampler.stop()
+            rss = [value for value in (process_peak_rss_mb(), process_peak_rss_mb(children=True)) if value]
+            self.stages[name] = {
+                'wall_s': time.perf_counter() - wall0,
+                'cpu_s': time.process_time() - cpu0 + _children_cpu() - children0,
+                'peak_rss_mb': sampler.peak_mb if sampler else None,
+                'peak_rss_delta_mb': sampler.peak_mb - sampler.start_mb if sampler else None,
+                'process_peak_rss_mb': max(rss) if rss else None,
+            }
+
+    def add_external(self, report, prefix=''):
+        """Intègre le rapport d'un sous-processus (même format que report())."""
+        for step, summary in report.get('steps', {}).items():
+            self.external_steps[prefix + step] = summary
+
+    def report(self):
+        with self._lock:
+            samples = {step: list(values) for step, values in self.samples.items()}
+        steps = {}
+        for step, values in samples.items():
+            summary = summarize([seconds for seconds, _ in values])
+            by_tracks = defaultdict(list)
+            for seconds, tracks in values:
+                if tracks is not None: by_tracks[tracks].append(seconds)
+            if by_tracks:
+                summary['by_track_count'] = {str(n): summarize(by_tracks[n]) for n in sorted(by_tracks)}
+            steps[step] = summary
+        steps.update(self.external_steps)
+        return {'stages': dict(self.stages), 'steps': steps}
+
+    def log_summary(self):
+        report = self.report()
+        for step, s in report['steps'].items():
+            logging.info(f"{step}: {s['count']} mesures, p50 {s['p50_ms']:.2f} ms, p95 {s['p95_ms']:.2f} ms, p99 {s['p99_ms']:.2f} ms")
+        for name, s in report['stages'].items():
+            rss = f", pic RSS {s['peak_rss_mb']:.0f} Mo (+{s['peak_rss_delta_mb']:.0f} Mo)" if s.get('peak_rss_mb') else ""
+            logging.info(f"Étape {name}: {s['wall_s']:.2f}s réelles, {s['cpu_s']:.2f}s CPU{rss}")
+
+    def save(self, path, **extra):
+        report = dict(self.report(), created=time.strftime('%Y-%m-%dT%H:%M:%S'), pid=os.getpid(), **extra)
+        with open(path, 'w') as f: json.dump(report, f, indent=4)
+        logging.info(f"Métriques sauvegardées dans: {path}")
+
+@contextmanager
+def profiled(kind, output_base):
+    """
+    Profile le bloc avec cProfile (kind='cprofile', fichier <output_base>.prof) ou pyinstrument
+    (kind='pyinstrument', fichier <output_base>.html). kind=None ne fait rien.
+    """
+    if kind is None:
+        yield
+        return
+    if kind == 'pyinstrument':
+        try:
+            from pyinstrument import Profiler
+        except ImportError:
+            logging.warning("pyinstrument n'est pas installé (pip install pyinstrument), profilage désactivé.")
+            yield
+            return
+        profiler = Profiler()
+        profiler.start()
+        try:
+            yield
+        finally:
+            profiler.stop()
+            with open(output_base + '.html', 'w') as f: f.write(profiler.output_html())
+            logging.info(f"Profil pyinstrument sauvegardé dans: {output_base}.html")
+        return
+    import cProfile
+    import pstats
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        profiler.dump_stats(output_base + '.prof')
+        logging.info(f"Profil cProfile sauvegardé dans: {output_base}.prof (fonctions les plus coûteuses ci-dessous)")
+        pstats.Stats(profiler, stream=sys.stderr).sort_stats('cumulative').print_stats(20)
@@ -0,0 +1,296 @@
+import json
+import os
+import logging
+import numpy as np
+
+# Format colonnaire des données intermédiaires.
+# Un fichier "<nom>.motion" est un dossier contenant un meta.json et, pour chaque piste,
+# un fichier binaire brut par colonne ("<piste>.<colonne>.bin"). Les lignes correspondent
+# aux images de la piste, ce qui permet de lire chaque colonne sans copie via np.memmap
+# et d'y ajouter des images à la fin.
+FORMAT_NAME = "motion_extract"
+FORMAT_VERSION = 1
+META_FILE = "meta.json"
+
+# Groupes de landmarks Holistic, dans l'ordre de stockage sur l'axe des landmarks
+LANDMARK_GROUPS = [('pose', 33), ('face', 468), ('left_hand', 21), ('right_hand', 21)]
+
+# Profils d'extraction: groupes de landmarks stockés, et modèle MediaPipe utilisé. Le graphe Pose est bien
+# plus léger que Holistic; Holistic calcule toujours le visage, pose_hands ne fait qu'éviter de le stocker.
+PROFILES = {
+    'pose': {'groups': ['pose'], 'model': 'pose'},
+    'pose_hands': {'groups': ['pose', 'left_hand', 'right_hand'], 'model': 'holistic'},
+    'holistic': {'groups': ['pose', 'face', 'left_hand', 'right_hand'], 'model': 'holistic'},
+}
+
+# Colonnes facultatives d'une piste de landmarks, et leur clé par image dans l'export JSON
+OPTIONAL_COLUMNS = {
+    'boxes': ({'dtype': 'float32', 'shape': [4]}, 'box'), # x1, y1, x2, y2 en pixels dans l'image complète
+    'inferred': ({'dtype': 'uint8', 'shape': []}, 'inferred'), # 1: landmarks inférés, 0: interpolés
+    'times': ({'dtype': 'float64', 'shape': []}, 'time_ms'), # Horodatage réel de l'image dans la vidéo, en millisecondes
+}
+
+def is_json_path(path):
+    return path.lower().endswith('.json')
+
+def group_slices(groups):
+    """Retourne {groupe: slice} pour indexer l'axe des landmarks d'une piste."""
+    slices, start = {}, 0
+    for name, count in groups:
+        slices[name] = slice(start, start + count)
+        start += count
+    return slices
+
+def profile_groups(profile):
+    """Groupes (nom, nombre de points) d'un profil, dans l'ordre de LANDMARK_GROUPS."""
+    return [(name, count) for name, count in LANDMARK_GROUPS if name in PROFILES[profile]['groups']]
+
+def cheapest_profile(required_groups):
+    """Profil le moins coûteux qui fournit tous les groupes demandés (la pose est toujours extraite)."""
+    for name, profile in PROFILES.items():
+        if set(required_groups) <= set(profile['groups']): return name
+    raise ValueError(f"Aucun profil ne fournit les groupes: {sorted(required_groups)}")
+
+def landmarks_meta(groups=LANDMARK_GROUPS, fps=None, columns=(), **extra):
+    """Métadonnées d'un fichier de landmarks (x, y, z, visibility par point), avec des colonnes facultatives."""
+    n_landmarks = sum(count for _, count in groups)
+    meta = {
+        'kind': 'landmarks', 'fps': fps, 'groups': [list(g) for g in groups],
+        'arrays': {'frames': {'dtype': 'int32', 'shape': []},
+                   'landmarks': {'dtype': 'float32', 'shape': [n_landmarks, 4]}},
+    }
+    for column in columns:
+        meta['arrays'][column] = dict(OPTIONAL_COLUMNS[column][0])
+    meta.update(extra)
+    return meta
+
+def rotations_meta(bones, fps=None, keys=False, columns=(), **extra):
+    """
+    Métadonnées d'un fichier de rotations (quaternion x, y, z, w par os). keys=True ajoute la colonne 'keys'
+    des courbes réduites (1 si la ligne est une clé de l'os, voir keyframe_reduction.py).
+    """
+    meta = {
+        'kind': 'rotations', 'fps': fps, 'bones': list(bones),
+        'arrays': {'frames': {'dtype': 'int32', 'shape': []},
+                   'rotations': {'dtype': 'float32', 'shape': [len(bones), 4]}},
+    }
+    if keys: meta['arrays']['keys'] = {'dtype': 'uint8', 'shape': [len(bones)]}
+    for column in columns:
+        meta['arrays'][column] = dict(OPTIONAL_COLUMNS[column][0])
+    meta.update(extra)
+    return meta
+
+def track_seconds(track, fps, start=0, stop=None):
+    """
+    Temps (secondes) des lignes [start, stop) d'une piste: son horodatage réel (colonne 'times') s'il a été
+    enregistré, sinon numéro d'image / fps.
+    """
+    if 'times' in track: return np.asarray(track['times'][start:stop], dtype=np.float64) / 1000.0
+    return np.asarray(track['frames'][start:stop], dtype=np.float64) / fps
+
+def _column_path(path, track_id, column):
+    return os.path.join(path, f"{track_id}.{column}.bin")
+
+class MotionWriter:
+    """Écrit des pistes dans le format colonnaire, par ajouts successifs d'images."""
+
+    def __init__(self, path, meta):
+        self.path = path
+        self.meta = dict(meta, format=FORMAT_NAME, version=FORMAT_VERSION, tracks={})
+        os.makedirs(path, exist_ok=True)
+        # On écrase un éventuel fichier précédent, sans toucher aux fichiers étrangers au format
+        for name in os.listdir(path):
+            if name.endswith('.bin') or name == META_FILE:
+                os.remove(os.path.join(path, name))
+
+    @classmethod
+    def reopen(cls, path):
+        """
+        Rouvre un fichier existant pour y ajouter des images. Les lignes écrites après le dernier
+        meta.json (écriture interrompue) sont supprimées, pour repartir d'un état cohérent.
+        """
+        writer = cls.__new__(cls)
+        writer.path = path
+        writer.meta = read_meta(path)
+        specs = writer.meta['arrays']
+        for name in os.listdir(path):
+            if not name.endswith('.bin'): continue
+            track_id, column, _ = name.rsplit('.', 2)
+            length = writer.meta['tracks'].get(track_id)
+            if length is None or column not in specs:
+                os.remove(os.path.join(path, name))
+                continue
+            spec = specs[column]
+            row_bytes = np.dtype(spec['dtype']).itemsize * int(np.prod(spec['shape'], dtype=np.int64))
+            os.truncate(os.path.join(path, name), length * row_bytes)
+        return writer
+
+    def append(self, track_id, **columns):
+        """Ajoute des images à une piste. Chaque colonne a la forme (n, *shape)."""
+        track_id = str(track_id)
+        specs = self.meta['arrays']
+        if set(columns) != set(specs):
+            raise ValueError(f"Colonnes attendues: {sorted(specs)}, reçues: {sorted(columns)}")
+        n_rows = None
+        for column, spec in specs.items():
+            values = np.ascontiguousarray(columns[column], dtype=spec['dtype'])
+            values = values.reshape((-1, *spec['shape']))
+            if n_rows is not None and len(values) != n_rows:
+                raise ValueError(f"Colonne '{column}' de longueur {len(values)} au lieu de {n_rows}.")
+            n_rows = len(values)
+            with open(_column_path(self.path, track_id, column), 'ab') as f:
+                f.write(values.tobytes())
+        self.meta['tracks'][track_id] = self.meta['tracks'].get(track_id, 0) + n_rows
+
+    def flush(self):
+        """Écrit le meta.json de manière atomique (les lignes déjà ajoutées deviennent lisibles)."""
+        tmp_path = os.path.join(self.path, META_FILE + '.tmp')
+        with open(tmp_path, 'w') as f: json.dump(self.meta, f, indent=4)
+        os.replace(tmp_path, os.path.join(self.path, META_FILE))
+
+    def close(self):
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def _map_column(path, track_id, column, spec, length):
+    shape = (length, *spec['shape'])
+    if length == 0: return np.empty(shape, dtype=spec['dtype'])
+    return np.memmap(_column_path(path, track_id, column), dtype=spec['dtype'], mode='r', shape=shape)
+
+def read_meta(path):
+    with open(os.path.join(path, META_FILE), 'r') as f:
+        meta = json.load(f)
+    if meta.get('format') != FORMAT_NAME:
+        raise ValueError(f"{path} n'est pas un fichier {FORMAT_NAME}.")
+    return meta
+
+def load_motion(path):
+    """
+    Charge un fichier de mouvement, colonnaire ou JSON. Retourne (tracks, meta) où
+    tracks = {id_piste: {colonne: tableau}}. Les colonnes du format binaire sont des np.memmap en lecture seule.
+    """
+    if is_json_path(path):
+        with open(path, 'r') as f:
+            return from_json_dict(json.load(f))
+    meta = read_meta(path)
+    tracks = {}
+    for track_id, length in meta['tracks'].items():
+        tracks[track_id] = {column: _map_column(path, track_id, column, spec, length)
+                            for column, spec in meta['arrays'].items()}
+    return tracks, meta
+
+def save_motion(path, tracks, meta):
+    """Sauvegarde des pistes au format colonnaire, ou en JSON si le chemin se termine par .json."""
+    if is_json_path(path):
+        with open(path, 'w') as f: json.dump(to_json_dict(tracks, meta), f, indent=4)
+        return
+    with MotionWriter(path, meta) as writer:
+        for track_id, track in tracks.items():
+            writer.append(track_id, **{column: track[column] for column in meta['arrays']})
+
+# --- Conversion vers / depuis l'ancien format JSON (dictionnaires imbriqués) ---
+
+def iter_landmark_frames(track, groups):
+    """Génère les images d'une piste de landmarks au format JSON {'frame', 'landmarks'} (+ colonnes facultatives)."""
+    slices = group_slices(groups)
+    optional = [(column, key) for column, (_, key) in OPTIONAL_COLUMNS.items() if column in track]
+    for i, (frame_num, points) in enumerate(zip(np.asarray(track['frames']).tolist(), track['landmarks'])):
+        landmarks = {}
+        for name, sl in slices.items():
+            group = points[sl]
+            if np.isnan(group[:, 0]).all():
+                landmarks[name] = None
+            else:
+                landmarks[name] = [{'x': x, 'y': y, 'z': z, 'visibility': v} for x, y, z, v in group.tolist()]
+        frame = {'frame': frame_num, 'landmarks': landmarks}
+        for column, key in optional:
+            frame[key] = track[column][i].tolist()
+        yield frame
+
+def iter_rotation_frames(track, bones, keys_only=False):
+    """
+    Génère les images d'une piste de rotations au format JSON {'frame', 'rotations'}, avec 'keys' (os dont
+    l'image est une clé) pour une piste réduite. keys_only ne garde dans 'rotations' que ces os.
+    """
+    keys = track.get('keys')
+    for i, (frame_num, quats) in enumerate(zip(np.asarray(track['frames']).tolist(), track['rotations'])):
+        valid = ~np.isnan(quats[:, 3])
+        key_bones = [bone for bone, is_key in zip(bones, keys[i]) if is_key] if keys is not None else None
+        rotations = {bone: quat for bone, quat, ok in zip(bones, quats.tolist(), valid) if ok and not (keys_only and bone not in key_bones)}
+        frame = {'frame': frame_num, 'rotations': rotations}
+        if key_bones is not None: frame['keys'] = key_bones
+        if 'times' in track: frame['time_ms'] = float(track['times'][i])
+        yield frame
+
+def to_json_dict(tracks, meta):
+    if meta['kind'] == 'rotations':
+        return {track_id: list(iter_rotation_frames(track, meta['bones'])) for track_id, track in tracks.items()}
+    return {track_id: list(iter_landmark_frames(track, meta['groups'])) for track_id, track in tracks.items()}
+
+def _landmarks_from_json(data):
+    present = {name for track_data in data.values() for frame in track_data
+               for name, lmk_list in (frame['landmarks'] or {}).items() if lmk_list}
+    groups = [(name, count) for name, count in LANDMARK_GROUPS if name in present]
+    slices = group_slices(groups)
+    first_frame = next((track_data[0] for track_data in data.values() if track_data), {})
+    columns = [column for column, (_, key) in OPTIONAL_COLUMNS.items() if key in first_frame]
+    meta = landmarks_meta(groups, columns=columns)
+    n_landmarks = meta['arrays']['landmarks']['shape'][0]
+    tracks = {}
+    for track_id, track_data in data.items():
+        landmarks = np.full((len(track_data), n_landmarks, 4), np.nan, dtype=np.float32)
+        for i, frame in enumerate(track_data):
+            for name, lmk_list in (frame['landmarks'] or {}).items():
+                if lmk_list and name in slices:
+                    landmarks[i, slices[name]] = [[lm['x'], lm['y'], lm['z'], lm['visibility']] for lm in lmk_list]
+        frames = np.array([frame['frame'] for frame in track_data], dtype=np.int32)
+        tracks[track_id] = {'frames': frames, 'landmarks': landmarks}
+        for column in columns:
+            spec, key = OPTIONAL_COLUMNS[column]
+            values = [frame[key] for frame in track_data]
+            tracks[track_id][column] = np.array(values, dtype=spec['dtype']).reshape((len(values), *spec['shape']))
+    return tracks, meta
+
+def _rotations_from_json(data):
+    bones = []
+    for track_data in data.values():
+        for frame in track_data:
+            bones.extend(b for b in frame['rotations'] if b not in bones)
+    first_frame = next((track_data[0] for track_data in data.values() if track_data), {})
+    meta = rotations_meta(bones, keys='keys' in first_frame, columns=['times'] if 'time_ms' in first_frame else [])
+    tracks = {}
+    for track_id, track_data in data.items():
+        rotations = np.full((len(track_data), len(bones), 4), np.nan, dtype=np.float32)
+        for i, frame in enumerate(track_data):
+            for bone, quat in frame['rotations'].items():
+                rotations[i, bones.index(bone)] = quat
+        frames = np.array([frame['frame'] for frame in track_data], dtype=np.int32)
+        tracks[track_id] = {'frames': frames, 'rotations': rotations}
+        if 'keys' in meta['arrays']:
+            tracks[track_id]['keys'] = np.array([[bone in frame['keys'] for bone in bones] for frame in track_data], dtype=np.uint8).reshape(-1, len(bones))
+        if 'times' in meta['arrays']:
+            tracks[track_id]['times'] = np.array([frame['time_ms'] for frame in track_data], dtype=np.float64)
+    return tracks, meta
+
+def from_json_dict(data):
+    """Convertit l'ancien format JSON {id_piste: [images]} en (tracks, meta)."""
+    first_frame = next((track_data[0] for track_data in data.values() if track_data), None)
+    if first_frame is not None and 'rotations' in first_frame:
+        return _rotations_from_json(data)
+    return _landmarks_from_json(data)
+
+if __name__ == '__main__':
+    import argparse
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s', datefmt='%Y-%m-%d %H:%M:%S')
+    parser = argparse.ArgumentParser(description="Convertit un fichier de mouvement entre le format colonnaire (.motion) et JSON.")
+    parser.add_argument("--input", required=True, help="Fichier d'entrée (.motion ou .json).")
+    parser.add_argument("--output", required=True, help="Fichier de sortie (.motion ou .json).")
+    args = parser.parse_args()
+    tracks, meta = load_motion(args.input)
+    save_motion(args.output, tracks, meta)
+    logging.info(f"{len(tracks)} pistes converties vers: {args.output}")
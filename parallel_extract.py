@@ -0,0 +1,141 @@
+import os
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from scipy.optimize import linear_sum_assignment
+from motion_io import group_slices
+
+# Extraction d'une vidéo découpée en segments temporels, chacun traité dans son propre processus
+# (avec ses propres instances YOLO et Holistic). Chaque segment commence `overlap` images avant
+# sa plage utile: ces images chauffent le tracker, et servent à raccorder les identifiants
+# ByteTrack locaux du segment aux pistes globales du segment précédent.
+
+def plan_segments(start_frame, end_frame, n_segments, overlap):
+    """
+    Découpe [start_frame, end_frame) en segments contigus.
+    Retourne des tuples (début de décodage, début utile, fin) en positions d'image.
+    """
+    bounds = np.linspace(start_frame, end_frame, n_segments + 1).round().astype(int)
+    segments = []
+    for core_start, core_end in zip(bounds[:-1].tolist(), bounds[1:].tolist()):
+        if core_end <= core_start: continue
+        decode_start = max(start_frame, core_start - overlap) if segments else core_start
+        segments.append((decode_start, core_start, core_end))
+    return segments
+
+def _extract_segment(video_path, decode_start, core_end, conf, tracker, n_threads, options):
+    """Point d'entrée d'un processus: extraction d'un segment avec des modèles propres au processus."""
+    import cv2
+    cv2.setNumThreads(1)
+    # Un détecteur dont les options ne fixent pas de threads se limite à la part du processus
+    # (torch.set_num_threads pour ultralytics, seul backend qui importe torch)
+    detector = options.get('detector') or {}
+    if not detector.get('threads'): options = dict(options, detector=dict(detector, threads=n_threads))
+    from extract_motion import extract_tracks
+    return extract_tracks(video_path, conf=conf, tracker=tracker, start_frame=decode_start, end_frame=core_end, **options)
+
+def box_iou(boxes_a, boxes_b):
+    """IoU ligne à ligne entre deux tableaux de boîtes (n, 4) en x1, y1, x2, y2."""
+    top_left = np.maximum(boxes_a[:, :2], boxes_b[:, :2])
+    bottom_right = np.minimum(boxes_a[:, 2:], boxes_b[:, 2:])
+    inter = np.prod(np.clip(bottom_right - top_left, 0, None), axis=1)
+    area_a = np.prod(boxes_a[:, 2:] - boxes_a[:, :2], axis=1)
+    area_b = np.prod(boxes_b[:, 2:] - boxes_b[:, :2], axis=1)
+    union = area_a + area_b - inter
+    return np.divide(inter, union, out=np.zeros_like(inter), where=union > 0)
+
+def match_overlap(prev_tracks, next_tracks, pose_slice, min_iou=0.3, pose_weight=1.0):
+    """
+    Associe les pistes de deux segments qui se chevauchent, d'après les images communes:
+    coût = (1 - IoU moyen des boîtes) + pose_weight * distance moyenne des landmarks de pose (mètres).
+    Retourne une liste de couples (id précédent, id suivant).
+    """
+    prev_ids, next_ids = list(prev_tracks), list(next_tracks)
+    cost = np.full((len(prev_ids), len(next_ids)), np.inf)
+    for i, prev_id in enumerate(prev_ids):
+        prev = prev_tracks[prev_id]
+        for j, next_id in enumerate(next_ids):
+            nxt = next_tracks[next_id]
+            _, prev_idx, next_idx = np.intersect1d(prev['frames'], nxt['frames'], return_indices=True)
+            if len(prev_idx) == 0: continue
+            iou = box_iou(np.asarray(prev['boxes'])[prev_idx], np.asarray(nxt['boxes'])[next_idx]).mean()
+            if iou < min_iou: continue
+            pose_dist = 0.0
+            if pose_slice is not None:
+                prev_pose = np.asarray(prev['landmarks'])[prev_idx, pose_slice, :3]
+                next_pose = np.asarray(nxt['landmarks'])[next_idx, pose_slice, :3]
+                pose_dist = np.nanmean(np.linalg.norm(prev_pose - next_pose, axis=-1))
+            cost[i, j] = (1.0 - iou) + pose_weight * np.nan_to_num(pose_dist)
+    if not np.isfinite(cost).any(): return []
+    rows, cols = linear_sum_assignment(np.where(np.isfinite(cost), cost, 1e9))
+    return [(prev_ids[i], next_ids[j]) for i, j in zip(rows, cols) if np.isfinite(cost[i, j])]
+
+def stitch_segments(segments, results, meta, min_iou=0.3):
+    """
+    Fusionne les pistes des segments en pistes globales. Les identifiants du premier segment sont conservés;
+    les nouvelles pistes des segments suivants reçoivent les identifiants libres suivants, comme en une passe.
+    Seules les images de la plage utile de chaque segment sont gardées.
+    """
+    pose_slice = group_slices(meta['groups']).get('pose')
+    pieces = {}
+    prev_tracks, prev_map = {}, {}
+    next_gid = 1
+    matched = 0
+    for index, ((_, core_start, _), tracks) in enumerate(zip(segments, results)):
+        mapping = {}
+        if index > 0:
+            # Les numéros d'image stockés commencent à position + 1
+            overlap_tracks = {}
+            for local_id, track in tracks.items():
+                in_overlap = np.asarray(track['frames']) <= core_start
+                if in_overlap.any():
+                    overlap_tracks[local_id] = {c: np.asarray(v)[in_overlap] for c, v in track.items()}
+            for prev_id, local_id in match_overlap(prev_tracks, overlap_tracks, pose_slice, min_iou):
+                mapping[local_id] = prev_map[prev_id]
+            matched += len(mapping)
+        else:
+            mapping = {local_id: int(local_id) for local_id in tracks}
+            next_gid = max(mapping.values(), default=0) + 1
+
+        for local_id, track in tracks.items():
+            keep = np.asarray(track['frames']) > core_start
+            if not keep.any(): continue
+            if local_id not in mapping:
+                mapping[local_id] = next_gid
+                next_gid += 1
+            pieces.setdefault(mapping[local_id], []).append({c: np.asarray(v)[keep] for c, v in track.items()})
+        prev_tracks, prev_map = tracks, mapping
+
+    stitched = {gid: {c: np.concatenate([p[c] for p in parts]) for c in parts[0]} for gid, parts in pieces.items()}
+    order = sorted(stitched, key=lambda gid: (int(stitched[gid]['frames'][0]), gid))
+    logging.info(f"Raccordement: {matched} pistes prolongées entre segments, {len(order)} pistes globales.")
+    return {str(gid): stitched[gid] for gid in order}
+
+def extract_tracks_parallel(video_path, start_frame, end_frame, conf=0.4, tracker="bytetrack.yaml", workers=None, overlap=30, min_iou=0.3, **options):
+    """
+    Extrait [start_frame, end_frame) en segments répartis sur un pool de processus, puis raccorde les pistes.
+    Les options supplémentaires sont transmises à extract_tracks dans chaque processus.
+    Retourne (tracks, meta) comme extract_tracks, ou None si un segment a échoué.
+    """
+    workers = workers or os.cpu_count() or 1
+    segments = plan_segments(start_frame, end_frame, workers, overlap)
+    if not segments:
+        logging.error(f"Plage d'images vide: [{start_frame}, {end_frame}).")
+        return None
+    n_threads = max(1, (os.cpu_count() or 1) // len(segments))
+    logging.info(f"Extraction en {len(segments)} segments sur {workers} processus (chevauchement: {overlap} images).")
+
+    # spawn: chaque processus charge proprement ses propres modèles (torch ne supporte pas bien fork)
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context) as executor:
+        futures = [executor.submit(_extract_segment, video_path, decode_start, core_end, conf, tracker, n_threads, options)
+                   for decode_start, _, core_end in segments]
+        results = [future.result() for future in futures]
+
+    if any(result is None for result in results):
+        logging.error("Au moins un segment a échoué.")
+        return None
+    meta = dict(results[0][1], frame_range=[int(start_frame), int(end_frame)])
+    tracks = stitch_segments(segments, [tracks for tracks, _ in results], meta, min_iou)
+    return tracks, meta
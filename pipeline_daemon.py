@@ -0,0 +1,199 @@
+import argparse
+import json
+import logging
+import os
+import socket
+import socketserver
+import sys
+import tempfile
+import threading
+import time
+
+# Démon local qui garde les modules importés (numpy, scipy, étapes du pipeline) et les modèles
+# d'extraction chargés, et exécute les étapes qu'on lui soumet sur un socket Unix. Les CLI
+# (smoother.py, calculate_rotations.py, extract_motion.py, export_animation.py) et run_pipeline
+# lui soumettent leur étape quand il tourne, au lieu de tout réimporter dans un nouvel interpréteur.
+# Ce module n'importe que la bibliothèque standard: le client reste rapide à charger.
+#
+# Protocole: une requête JSON par connexion {"stage", "kwargs", "cwd"}; le démon renvoie une ligne JSON
+# par message de log {"log": ...}, puis {"ok": bool, "error": ..., "seconds": ...}.
+
+LOG_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+CONNECT_TIMEOUT = 0.2
+
+def setup_logging():
+    logging.basicConfig(level=logging.INFO, format=LOG_FORMAT, datefmt='%Y-%m-%d %H:%M:%S')
+
+def default_socket_path():
+    """Socket du démon: $MOTION_EXTRACT_SOCKET, sinon un fichier par utilisateur dans le dossier temporaire."""
+    uid = os.getuid() if hasattr(os, 'getuid') else 0
+    return os.environ.get('MOTION_EXTRACT_SOCKET') or os.path.join(tempfile.gettempdir(), f"motion_extract-{uid}.sock")
+
+# --- Étapes exécutables par le démon ---
+
+def _smooth(**kwargs):
+    from smoother import smooth_animation_data
+    if smooth_animation_data(**kwargs) is None: raise RuntimeError("Lissage échoué.")
+
+def _rotations(**kwargs):
+    from calculate_rotations import calculate_bone_rotations
+    if calculate_bone_rotations(**kwargs) is None: raise RuntimeError("Calcul des rotations échoué.")
+
+def _export(**kwargs):
+    from export_animation import export_animation
+    if export_animation(**kwargs) is None: raise RuntimeError("Export échoué.")
+
+def _extract(**kwargs):
+    from extract_motion import extract_holistic_motion
+    if extract_holistic_motion(models=DaemonState.models(), **kwargs) is None: raise RuntimeError("Extraction échouée.")
+
+STAGES = {'smooth': _smooth, 'rotations': _rotations, 'export': _export, 'extract': _extract}
+
+class DaemonState:
+    """Modèles d'extraction résidents, créés au premier besoin (ou au démarrage avec --preload_models)."""
+    _models = None
+
+    @classmethod
+    def models(cls):
+        if cls._models is None:
+            from extract_motion import ResidentModels
+            cls._models = ResidentModels()
+        return cls._models
+
+def warm_up(preload_models=False):
+    """Importe les modules des étapes (et charge YOLO) une fois pour toutes."""
+    t0 = time.perf_counter()
+    import numpy, scipy.spatial.transform  # noqa: F401
+    import motion_io, smoother, calculate_rotations, export_animation  # noqa: F401
+    if preload_models: DaemonState.models().detector()
+    logging.info(f"Démon prêt en {time.perf_counter() - t0:.2f}s (modèles {'chargés' if preload_models else 'chargés au premier besoin'}).")
+
+class _SocketLogHandler(logging.Handler):
+    """Renvoie au client chaque message de log émis pendant son étape."""
+
+    def __init__(self, wfile):
+        super().__init__()
+        self.wfile = wfile
+        self.setFormatter(logging.Formatter(LOG_FORMAT, datefmt='%Y-%m-%d %H:%M:%S'))
+
+    def emit(self, record):
+        try:
+            self.wfile.write((json.dumps({'log': self.format(record)}) + "\n").encode('utf-8'))
+            self.wfile.flush()
+        except OSError:
+            pass # Client parti: l'étape continue
+
+class _JobHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        request = json.loads(self.rfile.readline())
+        stage = request.get('stage')
+        if stage == 'ping':
+            self._reply({'ok': True})
+            return
+        if stage == 'shutdown':
+            self._reply({'ok': True})
+            threading.Thread(target=self.server.shutdown, daemon=True).start()
+            return
+        if stage not in STAGES:
+            self._reply({'ok': False, 'error': f"Étape inconnue: {stage}"})
+            return
+        # Une étape à la fois: les modèles, le dossier courant et les handlers de log sont partagés
+        with self.server.job_lock:
+            handler = _SocketLogHandler(self.wfile)
+            logging.getLogger().addHandler(handler)
+            previous_cwd, t0 = os.getcwd(), time.perf_counter()
+            try:
+                os.chdir(request.get('cwd') or previous_cwd)
+                STAGES[stage](**request.get('kwargs', {}))
+                response = {'ok': True}
+            except Exception as e:
+                logging.exception(f"Erreur pendant l'étape: {stage}")
+                response = {'ok': False, 'error': str(e)}
+            finally:
+                os.chdir(previous_cwd)
+                logging.getLogger().removeHandler(handler)
+            response['seconds'] = time.perf_counter() - t0
+        self._reply(response)
+
+    def _reply(self, response):
+        self.wfile.write((json.dumps(response) + "\n").encode('utf-8'))
+
+class PipelineDaemon(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, path):
+        if os.path.exists(path):
+            if is_running(path): raise RuntimeError(f"Un démon tourne déjà sur: {path}")
+            os.remove(path) # Socket laissé par un démon arrêté brutalement
+        super().__init__(path, _JobHandler)
+        self.job_lock = threading.Lock()
+
+def serve(path=None, preload_models=False):
+    path = path or default_socket_path()
+    setup_logging()
+    warm_up(preload_models)
+    server = PipelineDaemon(path)
+    logging.info(f"Démon à l'écoute sur: {path}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if os.path.exists(path): os.remove(path)
+        logging.info("Démon arrêté.")
+
+# --- Client ---
+
+def _request(path, message, timeout=None):
+    """Envoie une requête et génère les lignes JSON de la réponse. Lève OSError si le démon ne répond pas."""
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.settimeout(CONNECT_TIMEOUT)
+    try:
+        sock.connect(path)
+        sock.settimeout(timeout)
+        sock.sendall((json.dumps(message) + "\n").encode('utf-8'))
+        with sock.makefile('rb') as f:
+            for line in f: yield json.loads(line)
+    finally:
+        sock.close()
+
+def is_running(path=None):
+    path = path or default_socket_path()
+    if not hasattr(socket, 'AF_UNIX') or not os.path.exists(path): return False
+    try:
+        return any(reply.get('ok') for reply in _request(path, {'stage': 'ping'}, CONNECT_TIMEOUT))
+    except OSError:
+        return False
+
+def submit(stage, path=None, **kwargs):
+    """
+    Soumet une étape au démon et affiche ses logs au fil de l'eau. Retourne True si l'étape a réussi,
+    False si elle a échoué, ou None si aucun démon ne tourne (l'appelant l'exécute alors lui-même).
+    """
+    path = path or default_socket_path()
+    if not is_running(path): return None
+    for reply in _request(path, {'stage': stage, 'kwargs': kwargs, 'cwd': os.getcwd()}):
+        if 'log' in reply:
+            print(reply['log'], file=sys.stderr, flush=True)
+            continue
+        if not reply['ok']: print(f"Démon: échec de l'étape {stage}: {reply.get('error')}", file=sys.stderr)
+        return reply['ok']
+    return False
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Démon local gardant modules et modèles en mémoire pour exécuter les étapes du pipeline.")
+    parser.add_argument("command", choices=["start", "stop", "status"], help="start: lance le démon (au premier plan); stop: l'arrête; status: indique s'il tourne.")
+    parser.add_argument("--socket", default=None, help=f"Socket Unix (par défaut: $MOTION_EXTRACT_SOCKET ou {default_socket_path()}).")
+    parser.add_argument("--preload_models", action="store_true", help="Charge YOLO dès le démarrage plutôt qu'à la première extraction.")
+    args = parser.parse_args()
+    socket_path = args.socket or default_socket_path()
+    if args.command == 'start':
+        serve(socket_path, args.preload_models)
+    elif args.command == 'stop':
+        if not is_running(socket_path): raise SystemExit("Aucun démon ne tourne.")
+        list(_request(socket_path, {'stage': 'shutdown'}))
+    else:
+        running = is_running(socket_path)
+        print(f"Démon {'actif' if running else 'arrêté'} ({socket_path})")
+        raise SystemExit(0 if running else 1)
@@ -0,0 +1,127 @@
+import logging
+import numpy as np
+from frame_pipeline import ResultWriter
+
+# Prévisualisation de l'extraction: les landmarks de chaque crop sont ramenés dans l'image complète en une
+# opération sur un tableau, et les segments de toutes les pistes sont dessinés groupe par groupe par un seul
+# appel à cv2.polylines. La vidéo annotée peut être écrite dans un fichier par un thread d'écriture, sans fenêtre.
+
+# Niveaux de détail, du plus léger au plus complet: groupes de landmarks dessinés
+DETAIL_LEVELS = {
+    'boxes': (),
+    'pose': ('pose',),
+    'body': ('pose', 'left_hand', 'right_hand'),
+    'contours': ('pose', 'left_hand', 'right_hand', 'face_contours'),
+    'full': ('pose', 'left_hand', 'right_hand', 'face'),
+}
+# Groupe -> (champ des résultats MediaPipe, connexions mediapipe.solutions.holistic, couleur BGR)
+GROUPS = {
+    'pose': ('pose_landmarks', 'POSE_CONNECTIONS', (255, 0, 0)),
+    'face_contours': ('face_landmarks', 'FACEMESH_CONTOURS', (80, 110, 10)),
+    'face': ('face_landmarks', 'FACEMESH_TESSELATION', (80, 110, 10)),
+    'left_hand': ('left_hand_landmarks', 'HAND_CONNECTIONS', (80, 22, 10)),
+    'right_hand': ('right_hand_landmarks', 'HAND_CONNECTIONS', (80, 44, 121)),
+}
+BOX_COLOR = (0, 255, 0)
+MIN_VISIBILITY = 0.5 # Comme mediapipe.solutions.drawing_utils: segments de pose cachés sous ce seuil
+WINDOW = "MotionExtract Preview"
+
+_CONNECTIONS = {}
+
+def connections(group):
+    """Connexions d'un groupe: tableau (segments, 2) d'indices de landmarks, construit une fois."""
+    if group not in _CONNECTIONS:
+        import mediapipe as mp
+        pairs = sorted(getattr(mp.solutions.holistic, GROUPS[group][1]))
+        _CONNECTIONS[group] = np.array(pairs, dtype=np.intp).reshape(-1, 2)
+    return _CONNECTIONS[group]
+
+def crop_to_frame(landmark_list, crop_origin, crop_size):
+    """Landmarks normalisés d'un crop -> (positions (n, 2) en pixels de l'image complète, visibilités (n,))."""
+    values = np.array([(lm.x, lm.y, lm.visibility) for lm in landmark_list.landmark], dtype=np.float32).reshape(-1, 3)
+    return values[:, :2] * np.asarray(crop_size, dtype=np.float32) + np.asarray(crop_origin, dtype=np.float32), values[:, 2]
+
+class PreviewOverlay:
+    """Annotations d'une image: boîtes et identifiants des pistes, et segments des landmarks, regroupés par groupe."""
+
+    def __init__(self, detail='contours', thickness=1):
+        if detail not in DETAIL_LEVELS: raise ValueError(f"Niveau de détail inconnu: {detail} (attendu: {', '.join(DETAIL_LEVELS)})")
+        self.groups = DETAIL_LEVELS[detail]
+        self.thickness = thickness
+        self.clear()
+
+    def clear(self):
+        self.boxes = []
+        self.segments = {group: [] for group in self.groups}
+
+    def add(self, track_id, box, results, crop_origin, crop_size):
+        """Ajoute une piste: sa boîte (x1, y1, x2, y2) et, si results (MediaPipe) est fourni, ses landmarks dans le crop."""
+        self.boxes.append((int(track_id), tuple(int(v) for v in box)))
+        if results is None: return
+        for group in self.groups:
+            landmarks = getattr(results, GROUPS[group][0], None)
+            if not landmarks: continue
+            points, visibility = crop_to_frame(landmarks, crop_origin, crop_size)
+            pairs = connections(group)
+            if group == 'pose': pairs = pairs[(visibility[pairs] >= MIN_VISIBILITY).all(axis=1)]
+            self.segments[group].append(points[pairs])
+
+    def draw(self, image):
+        """Dessine les annotations accumulées sur image (BGR, modifiée sur place), puis les oublie."""
+        import cv2
+        for group, parts in self.segments.items():
+            if not parts: continue
+            # Un seul appel par groupe: chaque segment est une polyligne ouverte de deux points
+            segments = np.round(np.concatenate(parts)).astype(np.int32)
+            cv2.polylines(image, segments, isClosed=False, color=GROUPS[group][2], thickness=self.thickness, lineType=cv2.LINE_AA)
+        for track_id, (x1, y1, x2, y2) in self.boxes:
+            cv2.rectangle(image, (x1, y1), (x2, y2), BOX_COLOR, 2)
+            cv2.putText(image, f"ID: {track_id}", (x1, y1 - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.8, BOX_COLOR, 2)
+        self.clear()
+        return image
+
+class AnnotatedVideoWriter:
+    """Écrit les images annotées dans une vidéo, dans un thread (ResultWriter): l'extraction n'attend que si la file est pleine."""
+
+    def __init__(self, path, fps, frame_size, queue_depth=8, codec='mp4v'):
+        import cv2
+        self.path = path
+        self.video = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*codec), fps, frame_size)
+        if not self.video.isOpened():
+            self.video.release()
+            raise ValueError(f"Impossible de créer la vidéo annotée: {path}")
+        self.writer = ResultWriter(self.video.write, queue_depth, name="Vidéo annotée")
+        self.writer.start()
+
+    @property
+    def stats(self):
+        return self.writer.stats
+
+    def write(self, image):
+        self.writer.submit(image)
+
+    def close(self):
+        try:
+            self.writer.finish()
+        finally:
+            self.video.release()
+        logging.info(f"Vidéo annotée sauvegardée dans: {self.path}")
+
+class PreviewWindow:
+    """Fenêtre de prévisualisation rafraîchie au plus max_fps fois par seconde (imshow et waitKey coûtent quelques ms)."""
+
+    def __init__(self, max_fps=30.0):
+        self.min_interval = 1.0 / max_fps if max_fps else 0.0
+        self.last_shown = None
+
+    def show(self, image, now):
+        """Affiche image si le dernier affichage date d'assez longtemps (now en secondes). Retourne False si 'q' a été pressé."""
+        import cv2
+        if self.last_shown is not None and now - self.last_shown < self.min_interval: return True
+        self.last_shown = now
+        cv2.imshow(WINDOW, image)
+        return cv2.waitKey(1) & 0xFF != ord('q')
+
+    def close(self):
+        import cv2
+        cv2.destroyAllWindows()
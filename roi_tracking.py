@@ -0,0 +1,89 @@
+import logging
+import numpy as np
+
+# Détection espacée: YOLO + ByteTrack ne tournent qu'une image sur detect_every. Entre deux détections,
+# la boîte de chaque piste est déduite des landmarks de pose trouvés sur l'image précédente (boîte
+# englobante des points visibles, agrandie de margin), puis découpée comme une boîte YOLO. Une piste
+# dont la pose est perdue ou trop peu visible relance la détection dès l'image suivante. Une piste dont la
+# boîte n'a pas été mise à jour sur la dernière image traitée (écartée par le filtrage, image sautée par
+# l'inférence adaptative) n'est plus suivie: sa boîte daterait. Elle attend la prochaine détection.
+
+def landmark_box(pose_landmarks, crop_origin, crop_size, frame_size, min_visibility=0.5, margin=0.15):
+    """
+    Boîte (x1, y1, x2, y2) en pixels de l'image complète englobant les landmarks de pose visibles d'un crop,
+    agrandie de margin (fraction de sa taille) de chaque côté. Retourne None si la pose est absente ou si la
+    visibilité moyenne est inférieure à min_visibility.
+    """
+    if not pose_landmarks: return None
+    points = np.array([(lm.x, lm.y, lm.visibility) for lm in pose_landmarks.landmark], dtype=np.float64)
+    if points[:, 2].mean() < min_visibility: return None
+    visible = points[points[:, 2] >= min_visibility, :2]
+    # Coordonnées normalisées du crop -> pixels de l'image complète
+    xy = visible * crop_size + crop_origin
+    low, high = xy.min(axis=0), xy.max(axis=0)
+    pad = (high - low) * margin
+    low = np.clip(low - pad, 0, frame_size)
+    high = np.clip(high + pad, 0, frame_size)
+    if (high - low).min() < 1: return None
+    return np.concatenate([low, high]).astype(int)
+
+class DetectionScheduler:
+    """
+    Décide à chaque image s'il faut lancer le détecteur, et fournit sinon les boîtes propagées des pistes.
+    La détection est relancée toutes les detect_every images, quand il n'y a aucune piste, ou quand une
+    piste a perdu sa pose à l'image précédente.
+    """
+
+    def __init__(self, detect_every=5, min_visibility=0.5, margin=0.15):
+        self.detect_every = max(1, detect_every)
+        self.min_visibility = min_visibility
+        self.margin = margin
+        self.boxes = {}          # piste -> boîte pour l'image suivante
+        self.updated = set()     # pistes dont la boîte a été mise à jour sur l'image en cours
+        self.last_detection = None
+        self.redetect = False
+        self.detector_calls = 0
+        self.forced_calls = 0
+        self.propagated_frames = 0
+
+    def should_detect(self, frame_num):
+        due = self.last_detection is None or frame_num - self.last_detection >= self.detect_every
+        if due or not self.boxes or self.redetect:
+            if not due: self.forced_calls += 1
+            return True
+        self.propagated_frames += 1
+        return False
+
+    def detected(self, frame_num, track_ids, boxes):
+        """Résultat du détecteur: les pistes qu'il n'a pas trouvées sont abandonnées."""
+        self.last_detection = frame_num
+        self.redetect = False
+        self.detector_calls += 1
+        self.boxes = {int(track_id): np.asarray(box) for track_id, box in zip(track_ids, boxes)}
+        self.updated = set()
+
+    def propagated(self):
+        """(identifiants, boîtes) des pistes pour une image sans détection, mises à jour sur l'image précédente."""
+        self.boxes = {track_id: box for track_id, box in self.boxes.items() if track_id in self.updated}
+        self.updated = set()
+        track_ids = np.array(list(self.boxes), dtype=int)
+        return track_ids, np.array([self.boxes[t] for t in track_ids.tolist()], dtype=int).reshape(-1, 4)
+
+    def update(self, track_id, pose_landmarks, crop_origin, crop_size, frame_size):
+        """Boîte de la piste pour l'image suivante, d'après ses landmarks. Une pose perdue relance la détection."""
+        box = landmark_box(pose_landmarks, crop_origin, crop_size, frame_size, self.min_visibility, self.margin)
+        self.updated.add(int(track_id))
+        if box is None:
+            self.boxes.pop(int(track_id), None)
+            self.redetect = True
+        else:
+            self.boxes[int(track_id)] = box
+
+    def __str__(self):
+        frames = self.detector_calls + self.propagated_frames
+        ratio = self.detector_calls / frames if frames else 0.0
+        return (f"Détecteur: {self.detector_calls}/{frames} images ({ratio:.0%}), dont {self.forced_calls} redétections "
+                f"sur perte de pose; {self.propagated_frames} images suivies par les landmarks")
+
+    def log_stats(self):
+        logging.info(str(self))
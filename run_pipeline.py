@@ -1,18 +1,24 @@
 import argparse
 import subprocess
+import json
 import os
 import logging
 import sys
+from metrics import Metrics, profiled
+
+# Mesures de toutes les étapes de l'exécution (temps réel, CPU, pic de RSS), sauvegardées en fin de pipeline
+METRICS = Metrics()
 
 def setup_logging():
     logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s', datefmt='%Y-%m-%d %H:%M:%S')
 
-def run_command(command):
+def run_command(command, name=None):
     """Exécute une commande en affichant sa sortie en temps réel."""
     logging.info(f"Lancement de: {' '.join(command)}")
     
     # En ne passant pas stdout/stderr, ils sont hérités du parent et s'affichent directement.
-    result = subprocess.run(command)
+    with METRICS.stage(name or os.path.basename(command[1] if len(command) > 1 else command[0])):
+        result = subprocess.run(command)
     
     if result.returncode != 0:
         logging.error(f"L'étape précédente a échoué avec le code {result.returncode}. Arrêt du pipeline.")
@@ -20,6 +26,262 @@ def run_command(command):
     
     logging.info("Étape terminée avec succès.")
 
+def run_daemon_stage(name, stage, **kwargs):
+    """
+    Soumet une étape au démon (pipeline_daemon.py) s'il tourne, avec le même contrat d'arrêt que run_command.
+    Retourne False si aucun démon ne tourne: l'étape doit alors être lancée dans un nouvel interpréteur.
+    """
+    from pipeline_daemon import is_running, submit
+    if not is_running(): return False
+    logging.info(f"Étape soumise au démon: {name}")
+    with METRICS.stage(name):
+        ok = submit(stage, **kwargs)
+    if ok is None:
+        # Démon arrêté entre is_running() et submit(): l'étape n'a pas été lancée
+        logging.warning("Le démon s'est arrêté avant de recevoir l'étape: lancement dans un nouvel interpréteur.")
+        return False
+    if not ok:
+        logging.error("L'étape précédente a échoué. Arrêt du pipeline.")
+        sys.exit(1)
+    logging.info("Étape terminée avec succès.")
+    return True
+
+def run_stage(name, func, *args, **kwargs):
+    """Exécute une étape dans le processus courant, avec le même contrat d'arrêt que run_command."""
+    logging.info(f"Lancement de l'étape: {name}")
+    try:
+        with METRICS.stage(name):
+            result = func(*args, **kwargs)
+    except Exception:
+        logging.exception(f"Erreur pendant l'étape: {name}")
+        result = None
+    if result is None:
+        logging.error("L'étape précédente a échoué. Arrêt du pipeline.")
+        sys.exit(1)
+    logging.info("Étape terminée avec succès.")
+    return result
+
+def json_path_for(motion_path):
+    return os.path.splitext(motion_path)[0] + ".json"
+
+# Groupes de landmarks dont chaque étape aval a besoin (le lissage traite ceux qui sont présents)
+STAGE_GROUPS = {'rotations': {'pose'}, 'visualization': {'pose'}}
+
+def extraction_profile(args):
+    """Profil demandé, ou en mode auto le moins coûteux qui couvre les besoins des étapes aval."""
+    from motion_io import cheapest_profile
+    if args.extraction_profile != 'auto': return args.extraction_profile
+    required = set()
+    if not args.skip_rotation: required |= STAGE_GROUPS['rotations']
+    if not args.no_visualization: required |= STAGE_GROUPS['visualization']
+    profile = cheapest_profile(required)
+    logging.info(f"Profil d'extraction choisi: {profile}.")
+    return profile
+
+STAGE_NAMES = {'raw': "extraction", 'smoothed': "lissage", 'rotations': "calcul des rotations"}
+
+# Modules dont le code détermine la sortie de chaque étape (version du code dans la clé du cache)
+STAGE_CODE = {
+    'raw': ['extract_motion.py', 'frame_pipeline.py', 'holistic_pool.py', 'adaptive_sampling.py', 'roi_tracking.py', 'track_gating.py', 'detectors.py', 'track_store.py', 'parallel_extract.py', 'motion_io.py'],
+    'smoothed': ['smoother.py', 'track_pool.py', 'motion_io.py'],
+    'rotations': ['calculate_rotations.py', 'keyframe_reduction.py', 'skeleton.py', 'track_pool.py', 'motion_io.py'],
+}
+
+def stage_keys(args, paths, cache):
+    """
+    Clés de cache des étapes. Chaque clé dépend de celle de l'étape précédente: changer les paramètres
+    du lissage ne change que les clés du lissage et des rotations. Une étape sautée (--skip_*) est
+    identifiée par le contenu de son fichier existant.
+    """
+    from stage_cache import stage_key
+    keys = {}
+    if args.skip_extraction:
+        keys['raw'] = cache.file_digest(paths['raw'])
+    else:
+        params = {'conf': args.conf, 'start_time': args.start_time, 'end_time': args.end_time, 'tracker': "bytetrack.yaml", 'workers': args.workers,
+                  'profile': args.extraction_profile, 'model_complexity': args.model_complexity, 'detect_every': args.detect_every,
+                  'sample_fps': args.sample_fps, 'gating': args.gating,
+                  # Le nombre de threads ne change pas les détections
+                  'detector': {key: value for key, value in args.detector.items() if key != 'threads'}}
+        keys['raw'] = stage_key('raw', cache.file_digest(args.input_video), params, STAGE_CODE['raw'])
+    if args.skip_smoothing:
+        keys['smoothed'] = cache.file_digest(paths['smoothed'])
+    else:
+        keys['smoothed'] = stage_key('smoothed', keys['raw'], {'mincutoff': args.mincutoff, 'beta': args.beta}, STAGE_CODE['smoothed'])
+    keys['rotations'] = stage_key('rotations', keys['smoothed'], {'key_tolerance': args.key_tolerance}, STAGE_CODE['rotations'])
+    return keys
+
+def run_subprocess_pipeline(args, paths, cache=None):
+    """Chaque étape est lancée dans un nouvel interpréteur et lit le fichier de l'étape précédente."""
+    from motion_io import load_motion, save_motion
+    import shutil
+    python_executable = sys.executable
+    keys = stage_keys(args, paths, cache) if cache else {}
+
+    def cached_command(key, cmd, daemon_stage=None, **daemon_kwargs):
+        """
+        Copie la sortie en cache si elle existe, sinon lance l'étape et met sa sortie en cache.
+        L'étape est soumise au démon s'il tourne (sans nouvel interpréteur), sinon lancée avec cmd.
+        """
+        cached_path = cache.get(keys[key], key) if cache else None
+        if cached_path is None:
+            if not (daemon_stage and run_daemon_stage(STAGE_NAMES[key], daemon_stage, **daemon_kwargs)):
+                run_command(cmd, STAGE_NAMES[key])
+            if cache: cache.put(keys[key], key, source_path=paths[key])
+            return
+        shutil.rmtree(paths[key], ignore_errors=True)
+        shutil.copytree(cached_path, paths[key])
+        if args.export_json: save_motion(json_path_for(paths[key]), *load_motion(paths[key]))
+
+    def json_export_args(motion_path):
+        """Arguments pour exporter aussi une étape en JSON, à côté du fichier .motion."""
+        if not args.export_json: return []
+        return ["--export_json", json_path_for(motion_path)]
+
+    if not args.skip_extraction:
+        cmd = [python_executable, "extract_motion.py", "--input_video", args.input_video, "--output", paths['raw'], "--conf", str(args.conf),
+               "--workers", str(args.workers), "--profile", args.extraction_profile, "--model_complexity", str(args.model_complexity),
+               "--detect_every", str(args.detect_every)]
+        if args.sample_fps: cmd.extend(["--sample_fps", str(args.sample_fps)])
+        from track_gating import gating_command_args
+        cmd.extend(gating_command_args(args.gating))
+        from detectors import detector_command_args
+        cmd.extend(detector_command_args(args.detector))
+        if args.start_time: cmd.extend(["--start_time", args.start_time])
+        if args.end_time: cmd.extend(["--end_time", args.end_time])
+        if args.resume: cmd.append("--resume")
+        # Les latences des sous-étapes sont mesurées dans le sous-processus, puis intégrées au rapport
+        extraction_metrics = paths['metrics'] + ".extraction.tmp"
+        cached_command('raw', cmd + json_export_args(paths['raw']) + ["--metrics", extraction_metrics], 'extract',
+                       video_path=args.input_video, output_path=paths['raw'], start_time_str=args.start_time, end_time_str=args.end_time, conf=args.conf,
+                       export_json=json_path_for(paths['raw']) if args.export_json else None, workers=args.workers, resume=args.resume,
+                       metrics_path=extraction_metrics, profile=args.extraction_profile, model_complexity=args.model_complexity, detect_every=args.detect_every,
+                       sample_fps=args.sample_fps, gating=args.gating, detector=args.detector)
+        if os.path.exists(extraction_metrics):
+            with open(extraction_metrics, 'r') as f: METRICS.add_external(json.load(f))
+            os.remove(extraction_metrics)
+
+    if not args.skip_smoothing:
+        cached_command('smoothed', [python_executable, "smoother.py", "--input", paths['raw'], "--output", paths['smoothed'],
+                                    "--mincutoff", str(args.mincutoff), "--beta", str(args.beta), "--workers", str(args.track_workers)] + json_export_args(paths['smoothed']), 'smooth',
+                       input_path=paths['raw'], output_path=paths['smoothed'], mincutoff=args.mincutoff, beta=args.beta, workers=args.track_workers,
+                       export_json=json_path_for(paths['smoothed']) if args.export_json else None)
+
+    if not args.skip_rotation:
+        key_tolerance_args = ["--key_tolerance", str(args.key_tolerance)] if args.key_tolerance is not None else []
+        cached_command('rotations', [python_executable, "calculate_rotations.py", "--input", paths['smoothed'], "--output", paths['rotations'], "--workers", str(args.track_workers)] + key_tolerance_args + json_export_args(paths['rotations']),
+                       'rotations', input_path=paths['smoothed'], output_path=paths['rotations'], key_tolerance=args.key_tolerance, workers=args.track_workers,
+                       export_json=json_path_for(paths['rotations']) if args.export_json else None)
+
+    for fmt in args.export_animation:
+        if not run_daemon_stage(f"export {fmt.upper()}", 'export', input_path=paths['rotations'], output_path=animation_path(paths, fmt)):
+            run_command([python_executable, "export_animation.py", "--input", paths['rotations'], "--output", animation_path(paths, fmt)], f"export {fmt.upper()}")
+    export_fbx(args, paths)
+
+    if not args.no_visualization:
+        logging.info("Lancement de la visualisation 3D...")
+        cmd = [python_executable, "visualize_animation.py", "--input", paths['smoothed']]
+        if args.render: cmd.extend(["--output", paths['render']])
+        run_command(cmd, "visualisation")
+
+def run_inprocess_pipeline(args, paths, cache=None):
+    """
+    Les étapes sont importées et s'échangent directement leurs tableaux en mémoire.
+    Les fichiers intermédiaires ne sont écrits qu'avec --save_intermediate (ou quand une étape externe en a besoin).
+    Avec un cache, une étape dont la sortie est déjà en cache n'est pas recalculée, ni les étapes qui la précèdent.
+    """
+    from motion_io import load_motion, save_motion
+    keys = stage_keys(args, paths, cache) if cache else {}
+
+    def cached(key):
+        cached_path = cache.get(keys[key], key) if cache else None
+        return load_motion(cached_path) if cached_path else None
+
+    def store(key, result):
+        if cache: cache.put(keys[key], key, *result)
+        return result
+
+    def save_stage(key, tracks, meta, required=False):
+        if args.save_intermediate or required:
+            save_motion(paths[key], tracks, meta)
+            logging.info(f"Données sauvegardées dans: {paths[key]}")
+        if args.export_json:
+            save_motion(json_path_for(paths[key]), tracks, meta)
+
+    def raw_data():
+        if args.skip_extraction:
+            return run_stage("chargement des données brutes", load_motion, paths['raw'])
+        result = cached('raw')
+        if result is not None:
+            save_stage('raw', *result)
+            return result
+        if args.workers > 1:
+            from extract_motion import extract_tracks_sharded
+            tracks, meta = run_stage("extraction", extract_tracks_sharded, args.input_video, args.start_time, args.end_time, conf=args.conf, workers=args.workers,
+                                     profile=args.extraction_profile, model_complexity=args.model_complexity, detect_every=args.detect_every,
+                                     sample_fps=args.sample_fps, gating=args.gating, detector=args.detector)
+        else:
+            from extract_motion import extract_tracks
+            # Avec --save_intermediate ou --resume, l'extraction écrit elle-même le fichier brut, avec checkpoints
+            streamed = args.save_intermediate or args.resume
+            tracks, meta = run_stage("extraction", extract_tracks, args.input_video, args.start_time, args.end_time, conf=args.conf,
+                                     output_path=paths['raw'] if streamed else None, resume=args.resume, metrics=METRICS,
+                                     profile=args.extraction_profile, model_complexity=args.model_complexity, detect_every=args.detect_every,
+                                     sample_fps=args.sample_fps, gating=args.gating, detector=args.detector)
+            if streamed:
+                if args.export_json: save_motion(json_path_for(paths['raw']), tracks, meta)
+                return store('raw', (tracks, meta))
+        save_stage('raw', tracks, meta)
+        return store('raw', (tracks, meta))
+
+    if args.skip_smoothing:
+        smoothed_tracks, smoothed_meta = run_stage("chargement des données lissées", load_motion, paths['smoothed'])
+    else:
+        result = cached('smoothed')
+        if result is None:
+            from smoother import smooth_tracks
+            result = store('smoothed', run_stage("lissage", smooth_tracks, *raw_data(), mincutoff=args.mincutoff, beta=args.beta, workers=args.track_workers))
+        smoothed_tracks, smoothed_meta = result
+        save_stage('smoothed', smoothed_tracks, smoothed_meta)
+
+    rotation_result = None
+    if not args.skip_rotation:
+        rotation_result = cached('rotations')
+        if rotation_result is None:
+            from calculate_rotations import compute_rotations
+            rotation_result = store('rotations', run_stage("calcul des rotations", compute_rotations, smoothed_tracks, smoothed_meta, args.key_tolerance, args.track_workers))
+        rotation_tracks, rotation_meta = rotation_result
+        # Blender relit les rotations depuis le disque
+        save_stage('rotations', rotation_tracks, rotation_meta, required=args.export_fbx)
+
+    if args.export_animation:
+        from export_animation import export_tracks
+        if rotation_result is None:
+            rotation_result = run_stage("chargement des rotations", load_motion, paths['rotations'])
+        for fmt in args.export_animation:
+            run_stage(f"export {fmt.upper()}", export_tracks, *rotation_result, animation_path(paths, fmt))
+    export_fbx(args, paths)
+
+    if not args.no_visualization:
+        logging.info("Lancement de la visualisation 3D...")
+        from visualize_animation import visualize_tracks
+        with METRICS.stage("visualisation"):
+            visualize_tracks(smoothed_tracks, smoothed_meta, output=paths['render'] if args.render else None)
+
+def animation_path(paths, fmt):
+    """Fichier d'animation exporté sans Blender (BVH: un fichier par piste, suffixé par son id s'il y en a plusieurs)."""
+    return os.path.splitext(paths['fbx'])[0] + '.' + fmt
+
+def export_fbx(args, paths):
+    if not args.export_fbx: return
+    logging.info("Lancement de l'exportation FBX avec Blender...")
+    cmd = [
+        args.blender_path, "--background", "--python", "export_to_fbx.py", "--",
+        "--input", paths['rotations'],
+        "--output_fbx", paths['fbx']
+    ]
+    run_command(cmd, "export FBX")
+
 def main():
     parser = argparse.ArgumentParser(description="Pipeline complet pour l'extraction d'animation 3D.")
     parser.add_argument("--input_video", required=True, help="Vidéo d'entrée.")
@@ -27,16 +289,50 @@ def main():
     parser.add_argument("--start_time", help="Début (MM:SS).")
     parser.add_argument("--end_time", help="Fin (MM:SS).")
     parser.add_argument("--conf", type=float, default=0.5, help="Seuil de confiance YOLO.")
+    parser.add_argument("--workers", type=int, default=1, help="Processus d'extraction (la vidéo est découpée en segments).")
+    parser.add_argument("--track_workers", type=int, default=1, help="Processus du lissage et des rotations (les pistes sont réparties entre eux; 0: un par cœur).")
+    parser.add_argument("--extraction_profile", default="auto", choices=["auto", "pose", "pose_hands", "holistic"],
+                        help="Landmarks extraits. auto: le profil le moins coûteux suffisant pour les étapes lancées (pose pour les rotations).")
+    parser.add_argument("--model_complexity", type=int, default=2, choices=[0, 1, 2], help="Complexité du modèle MediaPipe.")
+    parser.add_argument("--detect_every", type=int, default=1, help="Lance le détecteur YOLO une image sur N (crops suivis par les landmarks entre deux).")
+    from track_gating import add_gating_arguments, gating_options
+    add_gating_arguments(parser)
+    from detectors import add_detector_arguments, detector_options
+    add_detector_arguments(parser)
+    parser.add_argument("--sample_fps", type=float, default=None,
+                        help="Cadence d'analyse (images/s), ex: 30 pour une vidéo à 120 fps. Les autres images sont lues sans être décodées en couleur.")
+    parser.add_argument("--mincutoff", type=float, default=1.0, help="Lissage: fréquence de coupure minimale.")
+    parser.add_argument("--beta", type=float, default=0.0, help="Lissage: paramètre beta du filtre.")
     
     # Contrôle du pipeline
+    parser.add_argument("--key_tolerance", type=float, default=None,
+                        help="Réduit les rotations aux images clés: erreur maximale (degrés) de l'interpolation SLERP entre clés.")
     parser.add_argument("--skip_extraction", action="store_true")
     parser.add_argument("--skip_smoothing", action="store_true")
     parser.add_argument("--skip_rotation", action="store_true")
     parser.add_argument("--no_visualization", action="store_true")
     parser.add_argument("--export_fbx", action="store_true", help="Active l'exportation finale en FBX via Blender.")
     parser.add_argument("--blender_path", help="Chemin vers l'exécutable de Blender.")
+    parser.add_argument("--export_animation", nargs="+", default=[], choices=["bvh", "gltf", "glb"],
+                        help="Exporte aussi l'animation de toutes les pistes en BVH et/ou glTF/GLB, sans Blender.")
+    parser.add_argument("--render", action="store_true", help="Rend la visualisation hors écran dans <vidéo>_skeleton.mp4 au lieu de l'afficher.")
+    parser.add_argument("--export_json", action="store_true", help="Exporte aussi chaque étape au format JSON.")
+    parser.add_argument("--subprocess", action="store_true", help="Lance chaque étape dans un interpréteur séparé (ancien mode, via fichiers).")
+    parser.add_argument("--save_intermediate", action="store_true", help="En mode intégré, sauvegarde aussi les fichiers .motion de chaque étape dans output_dir. "
+                             "Indépendant du cache, qui garde de toute façon la sortie de chaque étape (voir --no_cache).")
+    parser.add_argument("--resume", action="store_true", help="Reprend une extraction interrompue à son dernier checkpoint.")
+    parser.add_argument("--metrics", default=None, help="Fichier des mesures de l'exécution (par défaut: <output_dir>/<vidéo>_metrics.json).")
+    parser.add_argument("--profile", choices=["cprofile", "pyinstrument"], default=None, help="Profile le pipeline (mode intégré uniquement).")
+
+    # Cache des étapes
+    parser.add_argument("--cache_dir", default=None, help="Dossier du cache des étapes, partagé entre les exécutions (par défaut: $MOTION_EXTRACT_CACHE ou ~/.cache/motion_extract).")
+    parser.add_argument("--cache_size", type=float, default=5.0, help="Taille maximale du cache, en Go.")
+    parser.add_argument("--no_cache", action="store_true", help="Désactive le cache des étapes: sans --save_intermediate, seuls les fichiers nécessaires sont alors écrits.")
+    parser.add_argument("--cache_stats", "--cache-stats", action="store_true", help="Affiche l'état du cache en fin de pipeline.")
 
     args = parser.parse_args()
+    args.gating = gating_options(args)
+    args.detector = detector_options(args)
     setup_logging()
 
     if args.export_fbx and not args.blender_path:
@@ -44,38 +340,35 @@ def main():
         sys.exit(1)
 
     os.makedirs(args.output_dir, exist_ok=True)
+    args.extraction_profile = extraction_profile(args)
 
     base_name = os.path.splitext(os.path.basename(args.input_video))[0]
-    raw_json_path = os.path.join(args.output_dir, f"{base_name}_raw.json")
-    smoothed_json_path = os.path.join(args.output_dir, f"{base_name}_smoothed.json")
-    rotations_json_path = os.path.join(args.output_dir, f"{base_name}_rotations.json")
-    fbx_path = os.path.join(args.output_dir, f"{base_name}_animation.fbx")
-    python_executable = sys.executable
+    paths = {
+        'raw': os.path.join(args.output_dir, f"{base_name}_raw.motion"),
+        'smoothed': os.path.join(args.output_dir, f"{base_name}_smoothed.motion"),
+        'rotations': os.path.join(args.output_dir, f"{base_name}_rotations.motion"),
+        'fbx': os.path.join(args.output_dir, f"{base_name}_animation.fbx"),
+        'render': os.path.join(args.output_dir, f"{base_name}_skeleton.mp4"),
+        'metrics': args.metrics or os.path.join(args.output_dir, f"{base_name}_metrics.json"),
+    }
 
-    if not args.skip_extraction:
-        cmd = [python_executable, "extract_motion.py", "--input_video", args.input_video, "--output_json", raw_json_path, "--conf", str(args.conf)]
-        if args.start_time: cmd.extend(["--start_time", args.start_time])
-        if args.end_time: cmd.extend(["--end_time", args.end_time])
-        run_command(cmd)
-
-    if not args.skip_smoothing:
-        run_command([python_executable, "smoother.py", "--input_json", raw_json_path, "--output_json", smoothed_json_path])
+    cache = None
+    if not args.no_cache:
+        from stage_cache import StageCache, default_cache_dir
+        cache = StageCache(args.cache_dir or default_cache_dir(), int(args.cache_size * 1e9))
 
-    if not args.skip_rotation:
-        run_command([python_executable, "calculate_rotations.py", "--input_json", smoothed_json_path, "--output_json", rotations_json_path])
+    if args.subprocess:
+        if args.profile: logging.warning("--profile n'est disponible qu'en mode intégré: les étapes tournent ici dans d'autres processus.")
+        run_subprocess_pipeline(args, paths, cache)
+    else:
+        with profiled(args.profile, os.path.join(args.output_dir, f"{base_name}_profile")):
+            run_inprocess_pipeline(args, paths, cache)
 
-    if args.export_fbx:
-        logging.info("Lancement de l'exportation FBX avec Blender...")
-        cmd = [
-            args.blender_path, "--background", "--python", "export_to_fbx.py", "--",
-            "--input_json", rotations_json_path,
-            "--output_fbx", fbx_path
-        ]
-        run_command(cmd)
+    METRICS.log_summary()
+    METRICS.save(paths['metrics'], input_video=os.path.abspath(args.input_video), mode="subprocess" if args.subprocess else "in-process")
 
-    if not args.no_visualization:
-        logging.info("Lancement de la visualisation 3D...")
-        run_command([python_executable, "visualize_animation.py", "--input_json", smoothed_json_path])
+    if cache and args.cache_stats:
+        logging.info(str(cache))
 
     logging.info("Pipeline terminé.")
 
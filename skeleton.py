@@ -0,0 +1,92 @@
+import numpy as np
+
+# Squelette de sortie, partagé par les exports (Blender, BVH, glTF).
+# Les noms d'os correspondent à SKELETON_BONES dans calculate_rotations.py.
+BONE_HIERARCHY = {
+    'hips': None, # Racine
+    'spine': 'hips',
+    'neck': 'spine',
+    'head': 'neck',
+    'left_upper_arm': 'spine',
+    'left_lower_arm': 'left_upper_arm',
+    'right_upper_arm': 'spine',
+    'right_lower_arm': 'right_upper_arm',
+    'left_upper_leg': 'hips',
+    'left_lower_leg': 'left_upper_leg',
+    'right_upper_leg': 'hips',
+    'right_lower_leg': 'right_upper_leg',
+}
+
+# Positions approximatives en T-Pose (en mètres)
+BONE_T_POSE_HEADS = {
+    'hips': (0, 0.9, 0),
+    'spine': (0, 1.0, 0),
+    'neck': (0, 1.4, 0),
+    'head': (0, 1.55, 0),
+    'left_upper_arm': (0.05, 1.4, 0),
+    'left_lower_arm': (0.4, 1.4, 0),
+    'right_upper_arm': (-0.05, 1.4, 0),
+    'right_lower_arm': (-0.4, 1.4, 0),
+    'left_upper_leg': (0.1, 0.9, 0),
+    'left_lower_leg': (0.1, 0.5, 0),
+    'right_upper_leg': (-0.1, 0.9, 0),
+    'right_lower_leg': (-0.1, 0.5, 0),
+}
+
+BONE_T_POSE_TAILS = {
+    'hips': (0, 1.0, 0), # Va vers la colonne
+    'spine': (0, 1.4, 0),
+    'neck': (0, 1.55, 0),
+    'head': (0, 1.7, 0),
+    'left_upper_arm': (0.4, 1.4, 0),
+    'left_lower_arm': (0.7, 1.4, 0),
+    'right_upper_arm': (-0.4, 1.4, 0),
+    'right_lower_arm': (-0.7, 1.4, 0),
+    'left_upper_leg': (0.1, 0.5, 0),
+    'left_lower_leg': (0.1, 0.1, 0),
+    'right_upper_leg': (-0.1, 0.5, 0),
+    'right_lower_leg': (-0.1, 0.1, 0),
+}
+
+def bone_offset(bone_name):
+    """Position de la tête de l'os relative à celle de son parent (absolue pour la racine)."""
+    head = np.array(BONE_T_POSE_HEADS[bone_name], dtype=np.float64)
+    parent = BONE_HIERARCHY[bone_name]
+    return head - np.array(BONE_T_POSE_HEADS[parent]) if parent else head
+
+def children(bone_name):
+    return [bone for bone, parent in BONE_HIERARCHY.items() if parent == bone_name]
+
+def local_rotations(bones, global_quats):
+    """
+    Convertit les rotations globales (images, os, 4) en x, y, z, w, ordonnées comme bones, en rotations
+    locales: local = inverse(global du parent) * global. Un os sans rotation (NaN) garde l'orientation de
+    son parent (rotation locale identité), et ses enfants sont exprimés par rapport à celle-ci.
+    """
+    from scipy.spatial.transform import Rotation as R
+    global_quats = np.asarray(global_quats, dtype=np.float64)
+    n_frames = len(global_quats)
+    effective = {}  # os -> rotations globales effectives (N, 4)
+    identity = np.tile([0.0, 0.0, 0.0, 1.0], (n_frames, 1))
+    local = np.repeat(identity[:, None], len(bones), axis=1)
+    for bone_name in BONE_HIERARCHY:  # Parents avant enfants
+        if bone_name not in bones: continue
+        index = bones.index(bone_name)
+        parent = BONE_HIERARCHY[bone_name]
+        parent_global = effective.get(parent, identity) if parent else identity
+        quats = global_quats[:, index]
+        valid = ~np.isnan(quats).any(axis=1)
+        effective[bone_name] = np.where(valid[:, None], np.nan_to_num(quats), parent_global)
+        local[:, index] = (R.from_quat(parent_global).inv() * R.from_quat(effective[bone_name])).as_quat()
+    return local
+
+def effective_keys(bones, keys):
+    """
+    Clés (images, os) des rotations locales: une rotation locale dépend de la globale de l'os et de celle de son
+    parent, elle a donc une clé partout où l'os ou l'un de ses ancêtres en a une.
+    """
+    effective = np.array(keys, dtype=bool)
+    for bone_name, parent in BONE_HIERARCHY.items():  # Parents avant enfants
+        if bone_name in bones and parent in bones:
+            effective[:, bones.index(bone_name)] |= effective[:, bones.index(parent)]
+    return effective
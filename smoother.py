@@ -1,81 +1,135 @@
-import json
 import argparse
 import logging
-from OneEuroFilter import OneEuroFilter
-import matplotlib.pyplot as plt
+import numpy as np
+from motion_io import load_motion, save_motion, group_slices, track_seconds
+from track_pool import map_tracks
+
+DEFAULT_FPS = 30
 
 def setup_logging():
     logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s', datefmt='%Y-%m-%d %H:%M:%S')
 
-def smooth_animation_data(input_path, output_path, mincutoff=1.0, beta=0.0, preview=False):
+def _alpha(cutoff, freq):
+    """Coefficient du filtre passe-bas pour une fréquence de coupure et d'échantillonnage données."""
+    tau = 1.0 / (2 * np.pi * cutoff)
+    return 1.0 / (1.0 + tau * freq)
+
+class OneEuroArrayFilter:
+    """
+    Filtre One-Euro appliqué à tout un tableau de valeurs à chaque pas de temps.
+    Chaque élément se comporte comme un OneEuroFilter indépendant (paquet OneEuroFilter 0.2.1: même état, mêmes
+    formules, dérivée estimée depuis la dernière valeur filtrée et non brute, voir tests/test_smoother.py);
+    les éléments à NaN sont ignorés pour ce pas de temps, comme un filtre qu'on n'appellerait pas.
+    """
+
+    def __init__(self, shape, freq, mincutoff=1.0, beta=0.0, dcutoff=1.0):
+        if freq <= 0 or mincutoff <= 0 or dcutoff <= 0:
+            raise ValueError("freq, mincutoff et dcutoff doivent être > 0")
+        self.mincutoff, self.beta, self.dcutoff = float(mincutoff), float(beta), float(dcutoff)
+        self.freq = np.full(shape, float(freq))
+        self.last_time = np.full(shape, np.nan)
+        self.x_prev = np.full(shape, np.nan)   # Dernière valeur filtrée (NaN: pas encore initialisé)
+        self.dx_prev = np.full(shape, np.nan)  # Dernière dérivée filtrée
+
+    def __call__(self, x, timestamp):
+        x = np.asarray(x, dtype=np.float64)
+        valid = ~np.isnan(x)
+        # Mise à jour de la fréquence d'échantillonnage à partir des timestamps
+        with np.errstate(invalid='ignore'):
+            update_freq = valid & (self.last_time > 0) & (timestamp > 0) & (timestamp > self.last_time)
+        self.freq = np.where(update_freq, 1.0 / np.where(update_freq, timestamp - self.last_time, 1.0), self.freq)
+        self.last_time = np.where(valid, timestamp, self.last_time)
+
+        # Estimation de la variation par seconde, puis de la fréquence de coupure
+        initialized = ~np.isnan(self.x_prev)
+        dx = np.where(initialized, (x - self.x_prev) * self.freq, 0.0)
+        alpha_d = _alpha(self.dcutoff, self.freq)
+        edx = np.where(initialized, alpha_d * dx + (1.0 - alpha_d) * self.dx_prev, dx)
+        cutoff = self.mincutoff + self.beta * np.abs(edx)
+
+        # Filtrage de la valeur
+        alpha = _alpha(cutoff, self.freq)
+        filtered = np.where(initialized, alpha * x + (1.0 - alpha) * self.x_prev, x)
+        self.x_prev = np.where(valid, filtered, self.x_prev)
+        self.dx_prev = np.where(valid, edx, self.dx_prev)
+        return filtered
+
+def one_euro_smooth(values, timestamps, freq, mincutoff=1.0, beta=0.0, dcutoff=1.0):
+    """Lisse un tableau (images, ...) en une seule passe: boucle sur le temps, vectorisé sur le reste."""
+    values = np.asarray(values)
+    smoothed = np.empty(values.shape, dtype=np.float64)
+    one_euro = OneEuroArrayFilter(values.shape[1:], freq, mincutoff, beta, dcutoff)
+    for i, timestamp in enumerate(timestamps):
+        smoothed[i] = one_euro(values[i], timestamp)
+    return smoothed
+
+def _smooth_track(inputs, outputs, video_fps, freq, mincutoff, beta):
+    """Lisse une piste dans outputs['landmarks'] (tâche de map_tracks)."""
+    landmarks = inputs['landmarks']
+    outputs['landmarks'][:, :, :3] = one_euro_smooth(landmarks[:, :, :3], track_seconds(inputs, video_fps), freq, mincutoff, beta)
+    outputs['landmarks'][:, :, 3] = landmarks[:, :, 3]
+
+def smooth_tracks(raw_tracks, meta, mincutoff=1.0, beta=0.0, fps=None, workers=1):
+    """
+    Applique le filtre One-Euro à toutes les pistes en mémoire. Retourne (smoothed_tracks, meta).
+    Les timestamps sont les horodatages réels enregistrés par l'extraction (colonne 'times'), sinon ils sont
+    calculés à partir des numéros d'image et de la fréquence de la vidéo (celle enregistrée par l'extraction,
+    sauf si fps est fourni). Les pistes sont réparties sur workers processus.
+    """
+    video_fps = fps or meta.get('fps')
+    if not video_fps:
+        video_fps = DEFAULT_FPS
+        logging.warning(f"Fréquence de la vidéo inconnue, utilisation de {video_fps} fps (voir --fps).")
+    logging.info(f"Lissage à {video_fps:.3f} fps (mincutoff={mincutoff}, beta={beta}).")
+    # fps imposé: les horodatages enregistrés sont ignorés
+    columns = ['frames', 'landmarks'] + (['times'] if 'times' in meta['arrays'] and not fps else [])
+    # Fréquence initiale du filtre: celle des images analysées (le filtre la recalcule ensuite d'après les timestamps)
+    freq = (meta.get('sample_fps') if 'times' in columns else None) or video_fps
+
+    logging.info(f"Traitement des personnes ID: {', '.join(raw_tracks)}")
+    results = map_tracks(_smooth_track, raw_tracks, columns, lambda track: {'landmarks': (track['landmarks'].shape, np.float32)},
+                         workers, video_fps=video_fps, freq=freq, mincutoff=mincutoff, beta=beta)
+    smoothed_tracks = {person_id: dict(track, landmarks=results[person_id][0]['landmarks']) for person_id, track in raw_tracks.items()}
+    return smoothed_tracks, meta
+
+def smooth_animation_data(input_path, output_path, mincutoff=1.0, beta=0.0, preview=False, export_json=None, fps=None, workers=1):
     """
     Charge les données d'animation, applique un filtre One-Euro, et sauvegarde les données lissées.
-    Optionnellement, affiche un graphique de comparaison.
+    Optionnellement, affiche un graphique de comparaison. Retourne output_path, ou None si l'entrée est illisible.
     """
     setup_logging()
     logging.info(f"Chargement du fichier d'entrée: {input_path}")
     try:
-        with open(input_path, 'r') as f:
-            raw_data = json.load(f)
-    except (IOError, json.JSONDecodeError) as e:
-        logging.error(f"Impossible de lire le fichier JSON d'entrée: {e}")
-        return
-
-    smoothed_data = {}
-    video_fps = 30  # Hypothèse raisonnable pour la fréquence du filtre
-
-    # Pour la visualisation
-    preview_raw_vals = []
-    preview_smoothed_vals = []
-
-    for person_id, track_data in raw_data.items():
-        logging.info(f"Traitement de la personne ID: {person_id}")
-        
-        filters = {}
-        first_valid_frame = next((frame for frame in track_data if frame['landmarks']), None)
-        if not first_valid_frame: continue
-
-        for lmk_type, lmk_list in first_valid_frame['landmarks'].items():
-            if lmk_list:
-                # Correction du nom du paramètre: min_cutoff -> mincutoff
-                filters[lmk_type] = {
-                    'x': [OneEuroFilter(freq=video_fps, mincutoff=mincutoff, beta=beta) for _ in lmk_list],
-                    'y': [OneEuroFilter(freq=video_fps, mincutoff=mincutoff, beta=beta) for _ in lmk_list],
-                    'z': [OneEuroFilter(freq=video_fps, mincutoff=mincutoff, beta=beta) for _ in lmk_list]
-                }
-
-        new_track_data = []
-        for frame_data in track_data:
-            frame_num = frame_data['frame']
-            timestamp = frame_num / video_fps
-            new_landmarks = {}
-
-            for lmk_type, lmk_list in frame_data['landmarks'].items():
-                if lmk_list and lmk_type in filters:
-                    smoothed_lmk_list = []
-                    for i, lmk in enumerate(lmk_list):
-                        smooth_x = filters[lmk_type]['x'][i](lmk['x'], timestamp)
-                        smooth_y = filters[lmk_type]['y'][i](lmk['y'], timestamp)
-                        smooth_z = filters[lmk_type]['z'][i](lmk['z'], timestamp)
-                        smoothed_lmk_list.append({'x': smooth_x, 'y': smooth_y, 'z': smooth_z, 'visibility': lmk['visibility']})
-                        
-                        # Collecter des données pour le preview (ex: poignet droit, axe X)
-                        if preview and person_id == next(iter(raw_data)) and lmk_type == 'pose' and i == 16:
-                            preview_raw_vals.append(lmk['x'])
-                            preview_smoothed_vals.append(smooth_x)
-
-                    new_landmarks[lmk_type] = smoothed_lmk_list
-            
-            new_track_data.append({'frame': frame_num, 'landmarks': new_landmarks})
-        
-        smoothed_data[person_id] = new_track_data
+        raw_tracks, meta = load_motion(input_path)
+    except (IOError, ValueError) as e:
+        logging.error(f"Impossible de lire le fichier d'entrée: {e}")
+        return None
+
+    smoothed_tracks, meta = smooth_tracks(raw_tracks, meta, mincutoff, beta, fps, workers)
 
     logging.info(f"Sauvegarde des données lissées dans: {output_path}")
-    with open(output_path, 'w') as f: json.dump(smoothed_data, f, indent=4)
+    save_motion(output_path, smoothed_tracks, meta)
+    if export_json:
+        save_motion(export_json, smoothed_tracks, meta)
+        logging.info(f"Export JSON: {export_json}")
     logging.info("Lissage terminé avec succès.")
 
-    # Afficher le graphique de prévisualisation si demandé
-    if preview and preview_raw_vals:
+    if preview: show_smoothing_preview(raw_tracks, smoothed_tracks, meta)
+    return output_path
+
+def show_smoothing_preview(raw_tracks, smoothed_tracks, meta):
+    """Affiche un graphique comparant les données brutes et lissées (poignet droit, axe X, première personne)."""
+    import matplotlib.pyplot as plt # Importé seulement pour la prévisualisation (lent à charger)
+    pose_slice = group_slices(meta['groups']).get('pose')
+    if pose_slice is None or not raw_tracks: return
+    preview_index = pose_slice.start + 16
+    person_id = next(iter(raw_tracks))
+    raw_vals = raw_tracks[person_id]['landmarks'][:, preview_index, 0]
+    present = ~np.isnan(raw_vals)
+    preview_raw_vals = raw_vals[present]
+    preview_smoothed_vals = smoothed_tracks[person_id]['landmarks'][present, preview_index, 0]
+
+    if len(preview_raw_vals):
         plt.figure(figsize=(15, 6))
         plt.plot(preview_raw_vals, 'r-', alpha=0.5, label='Données Brutes')
         plt.plot(preview_smoothed_vals, 'b-', label='Données Lissées')
@@ -88,12 +142,22 @@ def smooth_animation_data(input_path, output_path, mincutoff=1.0, beta=0.0, prev
         plt.show()
 
 if __name__ == '__main__':
-    parser = argparse.ArgumentParser(description="Applique un lissage (One-Euro Filter) aux données d'animation JSON.")
-    parser.add_argument("--input_json", required=True, help="Fichier JSON d'entrée.")
-    parser.add_argument("--output_json", required=True, help="Fichier JSON de sortie.")
+    parser = argparse.ArgumentParser(description="Applique un lissage (One-Euro Filter) aux données d'animation.")
+    parser.add_argument("--input", "--input_json", dest="input", required=True, help="Fichier d'entrée (.motion ou .json).")
+    parser.add_argument("--output", "--output_json", dest="output", required=True, help="Fichier de sortie (.motion ou .json).")
     parser.add_argument("--mincutoff", type=float, default=1.0, help="Fréquence de coupure minimale.")
     parser.add_argument("--beta", type=float, default=0.0, help="Paramètre beta du filtre.")
+    parser.add_argument("--fps", type=float, default=None, help="Fréquence de la vidéo (par défaut: celle enregistrée à l'extraction, sinon 30).")
+    parser.add_argument("--workers", type=int, default=1, help="Processus de lissage (les pistes sont réparties entre eux; 0: un par cœur).")
     parser.add_argument("--preview", action="store_true", help="Affiche un graphique comparant les données brutes et lissées.")
+    parser.add_argument("--export_json", default=None, help="Exporte aussi les données lissées au format JSON.")
+    parser.add_argument("--no_daemon", action="store_true", help="N'utilise pas le démon (pipeline_daemon.py) même s'il tourne.")
 
     args = parser.parse_args()
-    smooth_animation_data(args.input_json, args.output_json, args.mincutoff, args.beta, args.preview)
+    kwargs = dict(input_path=args.input, output_path=args.output, mincutoff=args.mincutoff, beta=args.beta, export_json=args.export_json, fps=args.fps, workers=args.workers)
+    if not args.preview and not args.no_daemon:
+        from pipeline_daemon import submit
+        ok = submit('smooth', **kwargs)
+        if ok is not None: raise SystemExit(0 if ok else 1)
+    if smooth_animation_data(preview=args.preview, **kwargs) is None:
+        raise SystemExit(1)
@@ -0,0 +1,142 @@
+import os
+import json
+import time
+import shutil
+import hashlib
+import logging
+from motion_io import save_motion
+
+# Cache des étapes du pipeline, adressé par contenu. La clé d'une étape est le hash de son entrée
+# (contenu de la vidéo, ou clé de l'étape précédente), de ses paramètres et du code source des
+# modules qui la calculent: une sortie n'est réutilisée que si elle a été produite exactement dans
+# les mêmes conditions. Les sorties sont stockées en .motion dans le dossier du cache, dont la
+# taille est bornée par éviction des entrées les moins récemment utilisées (LRU).
+
+INDEX_FILE = "index.json"
+
+def default_cache_dir():
+    """Cache partagé par toutes les exécutions: $MOTION_EXTRACT_CACHE, sinon ~/.cache/motion_extract."""
+    return os.environ.get('MOTION_EXTRACT_CACHE') or os.path.join(os.path.expanduser('~'), '.cache', 'motion_extract')
+
+def _hash_file(path, hasher=None, chunk_size=1 << 20):
+    hasher = hasher or hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            hasher.update(chunk)
+    return hasher
+
+def code_version(files):
+    """Hash du code source des modules d'une étape (chemins relatifs au dossier des scripts)."""
+    base_dir = os.path.dirname(os.path.abspath(__file__))
+    hasher = hashlib.sha256()
+    for name in sorted(files):
+        hasher.update(name.encode())
+        _hash_file(os.path.join(base_dir, name), hasher)
+    return hasher.hexdigest()
+
+def stage_key(stage, upstream, params, files):
+    """Clé d'une étape: hash de l'entrée, des paramètres et de la version du code."""
+    payload = json.dumps({'stage': stage, 'input': upstream, 'params': params, 'code': code_version(files)}, sort_keys=True)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+def _dir_size(path):
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names)
+
+class StageCache:
+    """Dossier de sorties d'étapes indexées par clé, avec une taille maximale en octets."""
+
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+        self.index = {'entries': {}, 'files': {}, 'hits': 0, 'misses': 0}
+        index_path = os.path.join(directory, INDEX_FILE)
+        if os.path.exists(index_path):
+            with open(index_path, 'r') as f: self.index.update(json.load(f))
+        # Les entrées dont le dossier a disparu sont oubliées
+        self.index['entries'] = {key: entry for key, entry in self.index['entries'].items() if os.path.isdir(self.path_for(key))}
+        self.evict()  # La taille maximale a pu être réduite depuis la dernière exécution
+
+    def path_for(self, key):
+        return os.path.join(self.directory, f"{key}.motion")
+
+    def _save_index(self):
+        tmp_path = os.path.join(self.directory, INDEX_FILE + '.tmp')
+        with open(tmp_path, 'w') as f: json.dump(self.index, f, indent=4)
+        os.replace(tmp_path, os.path.join(self.directory, INDEX_FILE))
+
+    def file_digest(self, path):
+        """
+        Hash du contenu d'un fichier, mémorisé tant que sa taille et sa date de modification ne changent pas.
+        Pour un dossier (.motion), hash de tous ses fichiers.
+        """
+        if os.path.isdir(path):
+            hasher = hashlib.sha256()
+            for name in sorted(os.listdir(path)):
+                hasher.update(name.encode())
+                _hash_file(os.path.join(path, name), hasher)
+            return hasher.hexdigest()
+        stat = os.stat(path)
+        abs_path = os.path.abspath(path)
+        known = self.index['files'].get(abs_path)
+        if known and known['size'] == stat.st_size and known['mtime_ns'] == stat.st_mtime_ns:
+            return known['sha256']
+        logging.info(f"Calcul du hash de: {path}")
+        digest = _hash_file(path).hexdigest()
+        self.index['files'][abs_path] = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'sha256': digest}
+        self._save_index()
+        return digest
+
+    def get(self, key, stage=None):
+        """Chemin de la sortie en cache pour cette clé, ou None."""
+        entry = self.index['entries'].get(key)
+        if entry is None:
+            self.index['misses'] += 1
+            self._save_index()
+            return None
+        entry['last_used'] = time.time()
+        self.index['hits'] += 1
+        self._save_index()
+        logging.info(f"Cache: sortie de l'étape '{stage or entry['stage']}' réutilisée ({key[:12]}).")
+        return self.path_for(key)
+
+    def put(self, key, stage, tracks=None, meta=None, source_path=None):
+        """Ajoute une sortie au cache, depuis des tableaux ou en copiant un fichier .motion existant."""
+        final_path = self.path_for(key)
+        tmp_path = final_path + '.tmp'
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        if source_path is not None: shutil.copytree(source_path, tmp_path)
+        else: save_motion(tmp_path, tracks, meta)
+        shutil.rmtree(final_path, ignore_errors=True)
+        os.replace(tmp_path, final_path)
+        now = time.time()
+        self.index['entries'][key] = {'stage': stage, 'size': _dir_size(final_path), 'created': now, 'last_used': now}
+        self.evict(keep=key)
+        self._save_index()
+        return final_path
+
+    def evict(self, keep=None):
+        """Supprime les entrées les moins récemment utilisées jusqu'à repasser sous la taille maximale."""
+        entries = self.index['entries']
+        total = sum(entry['size'] for entry in entries.values())
+        for key in sorted(entries, key=lambda k: entries[k]['last_used']):
+            if total <= self.max_bytes: break
+            if key == keep: continue
+            total -= entries.pop(key)['size']
+            shutil.rmtree(self.path_for(key), ignore_errors=True)
+            logging.info(f"Cache: entrée {key[:12]} évincée.")
+
+    def __str__(self):
+        entries = self.index['entries'].values()
+        total = sum(entry['size'] for entry in entries)
+        lookups = self.index['hits'] + self.index['misses']
+        hit_rate = self.index['hits'] / lookups if lookups else 0.0
+        lines = [f"Cache {self.directory}: {len(entries)} entrées, {total / 1e6:.1f} Mo / {self.max_bytes / 1e6:.1f} Mo, "
+                 f"{self.index['hits']} réutilisations / {self.index['misses']} calculs ({hit_rate:.0%})"]
+        by_stage = {}
+        for entry in entries:
+            count, size = by_stage.get(entry['stage'], (0, 0))
+            by_stage[entry['stage']] = (count + 1, size + entry['size'])
+        for stage, (count, size) in sorted(by_stage.items()):
+            lines.append(f"  {stage}: {count} entrées, {size / 1e6:.1f} Mo")
+        return "\n".join(lines)
@@ -0,0 +1,102 @@
+import numpy as np
+
+from adaptive_sampling import INFER, PROBE, SKIP, AdaptiveSampler, KeyframeInterpolator
+
+BOX = [0, 0, 100, 100]
+
+class Collector:
+    """Reçoit les images émises par KeyframeInterpolator, par piste."""
+
+    def __init__(self):
+        self.frames = {}
+
+    def __call__(self, track_id, frames, landmarks, boxes, inferred, times):
+        rows = self.frames.setdefault(track_id, {})
+        for frame, lm, flag, time_ms in zip(frames, landmarks, inferred, times):
+            rows[int(frame)] = (lm.copy(), int(flag), float(time_ms))
+
+def lm(value, n=2):
+    return np.full((n, 4), value, dtype=np.float32)
+
+def test_sampler_skips_still_boxes_until_max_stride():
+    sampler = AdaptiveSampler(motion_threshold=0.05, max_stride=3)
+    assert sampler.decide(1, 0, BOX) == INFER
+    sampler.keyframe_done(1, 0, BOX)
+    assert [sampler.decide(1, f, BOX) for f in (1, 2, 3)] == [SKIP, SKIP, INFER]
+    # Une boîte qui bouge plus que le seuil est inférée
+    assert sampler.decide(1, 1, [10, 0, 110, 100]) == INFER
+
+def test_sampler_probes_one_skip_in_n():
+    sampler = AdaptiveSampler(max_stride=100, probe_every=3)
+    sampler.decide(1, 0, BOX)
+    sampler.keyframe_done(1, 0, BOX)
+    assert [sampler.decide(1, f, BOX) for f in range(1, 7)] == [SKIP, SKIP, PROBE, SKIP, SKIP, PROBE]
+
+def test_skipped_frames_interpolated_by_timestamp():
+    out = Collector()
+    interp = KeyframeInterpolator(out)
+    interp.keyframe(1, 0, 0.0, BOX, lm(0.0))
+    # Horodatages irréguliers: le poids suit le temps, pas le numéro d'image
+    interp.skipped(1, 1, 10.0, BOX)
+    interp.skipped(1, 2, 75.0, BOX)
+    assert set(out.frames[1]) == {0}
+    interp.keyframe(1, 3, 100.0, BOX, lm(1.0))
+    rows = out.frames[1]
+    assert sorted(rows) == [0, 1, 2, 3]
+    np.testing.assert_allclose(rows[1][0], lm(0.1), atol=1e-6)
+    np.testing.assert_allclose(rows[2][0], lm(0.75), atol=1e-6)
+    assert [rows[f][1] for f in range(4)] == [1, 0, 0, 1]
+    assert rows[2][2] == 75.0
+
+def test_skips_before_first_key_dropped_and_trailing_skips_repeat_last_key():
+    out = Collector()
+    interp = KeyframeInterpolator(out)
+    interp.skipped(1, 0, 0.0, BOX)
+    interp.keyframe(1, 1, 33.0, BOX, lm(0.5))
+    interp.skipped(1, 2, 66.0, BOX)
+    interp.skipped(1, 3, 99.0, BOX)
+    interp.finish()
+    rows = out.frames[1]
+    assert sorted(rows) == [1, 2, 3]
+    for frame in (2, 3):
+        np.testing.assert_allclose(rows[frame][0], lm(0.5))
+        assert rows[frame][1] == 0
+
+def test_tracks_are_interpolated_independently():
+    out = Collector()
+    interp = KeyframeInterpolator(out)
+    interp.keyframe(1, 0, 0.0, BOX, lm(0.0))
+    interp.keyframe(2, 0, 0.0, BOX, lm(10.0))
+    interp.skipped(1, 1, 50.0, BOX)
+    interp.skipped(2, 1, 50.0, BOX)
+    interp.keyframe(1, 2, 100.0, BOX, lm(1.0))
+    interp.keyframe(2, 2, 100.0, BOX, lm(20.0))
+    np.testing.assert_allclose(out.frames[1][1][0], lm(0.5))
+    np.testing.assert_allclose(out.frames[2][1][0], lm(15.0))
+
+def test_probe_error_measured_on_error_slice():
+    out = Collector()
+    interp = KeyframeInterpolator(out, error_slice=slice(0, 1))
+    interp.keyframe(1, 0, 0.0, BOX, lm(0.0))
+    probe = lm(0.5)
+    probe[0, :3] = [0.5, 0.5, 0.8]   # écart de 0.3 en z sur le landmark mesuré
+    probe[1, :3] = np.nan             # hors de error_slice: ignoré
+    interp.skipped(1, 1, 50.0, BOX, probe_landmarks=probe)
+    interp.keyframe(1, 2, 100.0, BOX, lm(1.0))
+    np.testing.assert_allclose(interp.errors, [0.3], atol=1e-6)
+    # La sonde ne remplace pas la valeur interpolée
+    np.testing.assert_allclose(out.frames[1][1][0], lm(0.5))
+
+def test_state_restores_pending_frames():
+    out = Collector()
+    interp = KeyframeInterpolator(out)
+    interp.keyframe(1, 0, 0.0, BOX, lm(0.0))
+    interp.skipped(1, 1, 50.0, BOX)
+    state = interp.get_state()
+
+    resumed_out = Collector()
+    resumed = KeyframeInterpolator(resumed_out)
+    resumed.set_state(state)
+    resumed.keyframe(1, 2, 100.0, BOX, lm(1.0))
+    assert sorted(resumed_out.frames[1]) == [1, 2]
+    np.testing.assert_allclose(resumed_out.frames[1][1][0], lm(0.5))
@@ -0,0 +1,89 @@
+import warnings
+import numpy as np
+from scipy.spatial.transform import Rotation as R
+from calculate_rotations import SKELETON_BONES, compute_track_rotations, t_pose_vector
+
+BONES = list(SKELETON_BONES)
+POSE_SLICE = slice(0, 33)
+
+def per_frame_rotations(pose):
+    """
+    Référence: l'ancien calcul image par image (une matrice de racine par image, align_vectors par os).
+    {os: quaternion}; un os dégénéré (vecteur nul) ou une racine sans repère est absent.
+    """
+    def vector(start, end):
+        vec = pose[end] - pose[start]
+        norm = np.linalg.norm(vec)
+        return vec / norm if norm > 0 else np.zeros(3)
+
+    rotations = {}
+    hip_right_vec, spine_vec = vector(*SKELETON_BONES['hips']), vector(24, 12)
+    hip_forward_vec = np.cross(spine_vec, hip_right_vec)
+    if np.linalg.norm(hip_forward_vec) > 0:
+        hip_forward_vec /= np.linalg.norm(hip_forward_vec)
+        hip_up_vec = np.cross(hip_right_vec, hip_forward_vec)
+        rotations['hips'] = R.from_matrix(np.array([hip_right_vec, hip_up_vec, -hip_forward_vec]).T).as_quat()
+    for bone_name, (start_idx, end_idx) in SKELETON_BONES.items():
+        if bone_name == 'hips': continue
+        bone_vec = vector(start_idx, end_idx)
+        if np.all(bone_vec == 0): continue
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore") # Une seule paire de vecteurs: scipy prévient que la rotation n'est pas unique
+            rot, _ = R.align_vectors([bone_vec], [t_pose_vector(bone_name)])
+        rotations[bone_name] = rot.as_quat()
+    return rotations
+
+def random_pose_track(n_frames=60, seed=0):
+    """Landmarks (images, 33 + 10, 4) autour d'une pose debout, avec un second groupe (hors pose) parfois absent."""
+    rng = np.random.default_rng(seed)
+    rest = rng.normal(0, 0.3, (33, 3))
+    rest[[23, 24, 11, 12]] = [[0.1, 0, 0], [-0.1, 0, 0], [0.18, -0.45, 0], [-0.18, -0.45, 0]]
+    landmarks = np.zeros((n_frames, 43, 4))
+    landmarks[:, :33, :3] = rest + rng.normal(0, 0.05, (n_frames, 33, 3))
+    landmarks[:, 33:, :3] = rng.normal(0, 1, (n_frames, 10, 3))
+    landmarks[:, :, 3] = 1.0
+    return landmarks
+
+def quat_angle(q, ref):
+    return 2.0 * np.arccos(np.clip(np.abs(np.sum(q * ref, axis=-1)), 0.0, 1.0))
+
+def test_matches_per_frame_reference():
+    landmarks = random_pose_track()
+    landmarks[5, 7, 0] = np.nan               # Pose incomplète: image ignorée
+    landmarks[9, 33:] = np.nan                # Groupe hors pose absent: image gardée
+    landmarks[12, 15, :3] = landmarks[12, 13, :3]  # Avant-bras gauche de longueur nulle
+    landmarks[20, 28, :3] = landmarks[20, 26, :3]  # Jambe droite de longueur nulle
+    frames = np.arange(100, 100 + len(landmarks))
+
+    kept, rotations = compute_track_rotations(frames, landmarks, POSE_SLICE, BONES)
+    assert 105 not in kept and 109 in kept
+    assert len(kept) == len(frames) - 1
+
+    for row, frame in enumerate(kept):
+        expected = per_frame_rotations(landmarks[frame - 100, POSE_SLICE, :3])
+        for bone_index, bone_name in enumerate(BONES):
+            quat = rotations[row, bone_index]
+            if bone_name not in expected:
+                assert np.isnan(quat).all(), (frame, bone_name)
+                continue
+            assert quat_angle(quat, expected[bone_name]) < 1e-6, (frame, bone_name)
+
+    # Os toujours dégénéré (tête: même landmark aux deux extrémités) et os de longueur nulle ponctuels
+    assert np.isnan(rotations[:, BONES.index('head')]).all()
+    assert np.isnan(rotations[list(kept).index(112), BONES.index('left_lower_arm')]).all()
+    assert np.isnan(rotations[list(kept).index(120), BONES.index('right_lower_leg')]).all()
+
+def test_root_from_matrix_and_degenerate_root():
+    """Racine: quaternions de R.from_matrix image par image; une colonne vertébrale alignée sur les hanches donne NaN."""
+    landmarks = random_pose_track(n_frames=10, seed=1)
+    # Épaule droite dans l'axe des hanches: repère de la racine indéfini
+    landmarks[3, 12, :3] = landmarks[3, 24, :3] + 2.0 * (landmarks[3, 23, :3] - landmarks[3, 24, :3])
+    kept, rotations = compute_track_rotations(np.arange(10), landmarks, POSE_SLICE, BONES)
+    hips = rotations[:, BONES.index('hips')]
+    assert np.isnan(hips[3]).all()
+    for frame in set(range(10)) - {3}:
+        expected = per_frame_rotations(landmarks[frame, POSE_SLICE, :3])['hips']
+        assert quat_angle(hips[frame], expected) < 1e-6
+        # La rotation de la racine amène bien l'axe X sur le vecteur des hanches
+        hip_right = landmarks[frame, 23, :3] - landmarks[frame, 24, :3]
+        np.testing.assert_allclose(R.from_quat(hips[frame]).apply([1.0, 0.0, 0.0]), hip_right / np.linalg.norm(hip_right), atol=1e-9)
@@ -0,0 +1,73 @@
+import numpy as np
+import pytest
+from scipy.spatial.transform import Rotation as R
+
+from keyframe_reduction import angle_error, reduce_rotations, reduce_track, slerp
+from motion_io import rotations_meta
+
+def rotation_track(n_frames=200, n_bones=3, seed=0):
+    """Courbes de rotation lisses (oscillations autour d'axes différents), à des instants irréguliers."""
+    rng = np.random.default_rng(seed)
+    times = np.cumsum(rng.uniform(0.02, 0.05, n_frames))
+    rotations = np.empty((n_frames, n_bones, 4))
+    for b in range(n_bones):
+        axis = rng.normal(size=3)
+        axis /= np.linalg.norm(axis)
+        angles = 0.8 * np.sin(times * (1.5 + b)) + 0.3 * np.sin(times * 7.0)
+        rotations[:, b] = R.from_rotvec(angles[:, None] * axis).as_quat()
+    return times, rotations
+
+def reconstruct(times, rotations, keys):
+    """Courbe de chaque os reconstituée par SLERP entre ses clés; NaN entre deux clés NaN."""
+    result = np.full_like(rotations, np.nan)
+    for b in range(rotations.shape[1]):
+        key_rows = np.flatnonzero(keys[:, b])
+        for k0, k1 in zip(key_rows[:-1], key_rows[1:]):
+            q0, q1 = rotations[k0, b], rotations[k1, b]
+            if np.isnan(q0).any() or np.isnan(q1).any(): continue
+            t = (times[k0:k1 + 1] - times[k0]) / (times[k1] - times[k0])
+            result[k0:k1 + 1, b] = slerp(q0, q1, t)
+    return result
+
+def full_keys(n_frames, rows, keys):
+    mask = np.zeros((n_frames, keys.shape[1]), dtype=bool)
+    mask[rows] = keys.astype(bool)
+    return mask
+
+@pytest.mark.parametrize("tolerance_deg", [0.1, 0.5, 2.0])
+def test_slerp_error_within_tolerance(tolerance_deg):
+    times, rotations = rotation_track()
+    rows, keys = reduce_track(times, rotations, tolerance_deg)
+    keys = full_keys(len(times), rows, keys)
+    assert keys[[0, -1]].all() # Extrémités toujours gardées
+    assert keys.sum() < keys.size # La réduction garde moins de clés que d'images
+    errors = angle_error(reconstruct(times, rotations, keys), rotations)
+    assert np.degrees(errors.max()) <= tolerance_deg + 1e-9
+
+def test_nan_runs_bounded_by_keys():
+    times, rotations = rotation_track(n_bones=2)
+    rotations[50:80, 1] = np.nan
+    rows, keys = reduce_track(times, rotations, 0.5)
+    keys = full_keys(len(times), rows, keys)
+    # Début et fin de la suite de NaN, et dernières / premières images valides qui l'entourent
+    assert keys[[49, 50, 79, 80], 1].all()
+    reconstructed = reconstruct(times, rotations, keys)
+    assert np.isnan(reconstructed[50:80, 1]).all()
+    valid = ~np.isnan(rotations[:, 1, 0])
+    assert np.degrees(angle_error(reconstructed[valid, 1], rotations[valid, 1]).max()) <= 0.5 + 1e-9
+    # L'os 0 n'est pas affecté
+    assert not keys[50:80, 0].all()
+
+def test_reduce_rotations_keeps_union_of_key_rows():
+    times, rotations = rotation_track(n_frames=120)
+    bones = ['hips', 'spine', 'head']
+    meta = rotations_meta(bones, fps=30.0, columns=['times'])
+    track = {'frames': np.arange(120, dtype=np.int32), 'rotations': rotations.astype(np.float32), 'times': times * 1000.0}
+    reduced, reduced_meta = reduce_rotations({'1': track}, meta, 0.5)
+    assert reduced_meta['arrays']['keys']['shape'] == [3]
+    rows, keys = reduce_track(times, track['rotations'], 0.5)
+    np.testing.assert_array_equal(reduced['1']['frames'], rows)
+    np.testing.assert_array_equal(reduced['1']['keys'], keys)
+    np.testing.assert_array_equal(reduced['1']['rotations'], track['rotations'][rows])
+    np.testing.assert_array_equal(reduced['1']['times'], track['times'][rows])
+    assert reduced['1']['keys'].any(axis=1).all()
@@ -0,0 +1,70 @@
+import numpy as np
+import pytest
+
+from motion_io import MotionWriter, group_slices, landmarks_meta, load_motion, profile_groups, rotations_meta, save_motion
+
+GROUPS = profile_groups('pose_hands')
+
+def landmark_tracks(rng):
+    """Deux pistes avec toutes les colonnes facultatives, un groupe absent (NaN) et un point NaN."""
+    meta = landmarks_meta(GROUPS, fps=30.0, columns=['boxes', 'inferred', 'times'])
+    n_landmarks = meta['arrays']['landmarks']['shape'][0]
+    tracks = {}
+    for track_id, frames in (('1', [1, 2, 5]), ('3', [4])):
+        n = len(frames)
+        landmarks = rng.random((n, n_landmarks, 4)).astype(np.float32)
+        tracks[track_id] = {'frames': np.array(frames, dtype=np.int32), 'landmarks': landmarks,
+                            'boxes': rng.uniform(0, 640, (n, 4)).astype(np.float32),
+                            'inferred': np.array([1, 0, 1][:n], dtype=np.uint8),
+                            'times': np.array(frames, dtype=np.float64) * 1000.0 / 30.0}
+    slices = group_slices(GROUPS)
+    tracks['1']['landmarks'][0, slices['left_hand']] = np.nan
+    tracks['1']['landmarks'][1, 3, :3] = np.nan
+    return tracks, meta
+
+def assert_tracks_equal(loaded, tracks, columns):
+    assert list(loaded) == list(tracks)
+    for track_id, track in tracks.items():
+        for column in columns:
+            np.testing.assert_array_equal(np.asarray(loaded[track_id][column]), track[column], err_msg=f"{track_id}.{column}")
+            assert loaded[track_id][column].dtype == track[column].dtype
+
+@pytest.mark.parametrize("name", ["raw.motion", "raw.json"])
+def test_landmarks_round_trip(name, tmp_path):
+    tracks, meta = landmark_tracks(np.random.default_rng(0))
+    save_motion(str(tmp_path / name), tracks, meta)
+    loaded, loaded_meta = load_motion(str(tmp_path / name))
+    assert loaded_meta['groups'] == meta['groups']
+    assert loaded_meta['arrays'] == meta['arrays']
+    assert_tracks_equal(loaded, tracks, meta['arrays'])
+
+@pytest.mark.parametrize("name", ["rotations.motion", "rotations.json"])
+def test_rotations_round_trip(name, tmp_path):
+    rng = np.random.default_rng(1)
+    bones = ['hips', 'spine', 'head']
+    meta = rotations_meta(bones, fps=30.0, keys=True, columns=['times'])
+    rotations = rng.normal(size=(4, 3, 4)).astype(np.float32)
+    rotations[2, 1] = np.nan
+    tracks = {'2': {'frames': np.array([3, 4, 6, 9], dtype=np.int32), 'rotations': rotations,
+                    'keys': np.array([[1, 1, 1], [0, 1, 0], [1, 0, 0], [1, 1, 1]], dtype=np.uint8),
+                    'times': np.array([100.0, 133.3, 200.0, 300.0])}}
+    save_motion(str(tmp_path / name), tracks, meta)
+    loaded, loaded_meta = load_motion(str(tmp_path / name))
+    assert loaded_meta['bones'] == bones
+    assert loaded_meta['arrays'] == meta['arrays']
+    assert_tracks_equal(loaded, tracks, meta['arrays'])
+
+def test_reopen_drops_rows_after_last_flush(tmp_path):
+    tracks, meta = landmark_tracks(np.random.default_rng(2))
+    path = str(tmp_path / "raw.motion")
+    track = tracks['1']
+    writer = MotionWriter(path, meta)
+    writer.append('1', **{column: track[column][:2] for column in meta['arrays']})
+    writer.flush()
+    # Écriture interrompue: ces lignes ne sont pas dans meta.json
+    writer.append('1', **{column: track[column][2:] for column in meta['arrays']})
+    writer = MotionWriter.reopen(path)
+    writer.append('1', **{column: track[column][2:] for column in meta['arrays']})
+    writer.close()
+    loaded, _ = load_motion(path)
+    assert_tracks_equal(loaded, {'1': track}, meta['arrays'])
@@ -0,0 +1,62 @@
+import numpy as np
+
+from parallel_extract import match_overlap, plan_segments, stitch_segments
+
+META = {'groups': [['pose', 33]]}
+
+def person_track(positions, offset):
+    """Piste d'une personne qui avance de 2 px par image; les numéros d'image stockés sont position + 1."""
+    positions = np.asarray(positions)
+    x = offset + 2.0 * positions
+    boxes = np.stack([x, np.full_like(x, 100.0), x + 80, np.full_like(x, 300.0)], axis=1)
+    landmarks = np.zeros((len(positions), 33, 4), dtype=np.float32)
+    landmarks[:, :, 0] = (x / 1000.0)[:, None]
+    landmarks[:, :, 1] = np.linspace(0, 1, 33)
+    return {'frames': positions.astype(np.int32) + 1, 'boxes': boxes.astype(np.float32), 'landmarks': landmarks}
+
+def segment_results(segments, people):
+    """
+    Pistes de chaque segment, comme extract_tracks: people = {offset: (première position, dernière position,
+    identifiant local par segment)}. Chaque segment voit les images [début de décodage, fin).
+    """
+    results = []
+    for index, (decode_start, _, core_end) in enumerate(segments):
+        tracks = {}
+        for offset, (first, last, local_ids) in people.items():
+            positions = np.arange(max(first, decode_start), min(last + 1, core_end))
+            if len(positions): tracks[str(local_ids[index])] = person_track(positions, offset)
+        results.append(tracks)
+    return results
+
+def test_plan_segments():
+    assert plan_segments(0, 100, 2, 10) == [(0, 0, 50), (40, 50, 100)]
+    # Segments plus courts que le chevauchement: le décodage remonte au plus au début de la plage
+    assert plan_segments(0, 20, 4, 10) == [(0, 0, 5), (0, 5, 10), (0, 10, 15), (5, 15, 20)]
+    assert plan_segments(10, 12, 4, 5) == [(10, 10, 11), (10, 11, 12)]
+
+def test_match_overlap_pairs_same_person():
+    prev = {'1': person_track(range(40, 50), 0), '2': person_track(range(40, 50), 400)}
+    nxt = {'7': person_track(range(40, 51), 400), '8': person_track(range(40, 51), 0)}
+    assert sorted(match_overlap(prev, nxt, slice(0, 33))) == [('1', '8'), ('2', '7')]
+    # Boîtes disjointes: aucun appariement
+    assert match_overlap(prev, {'9': person_track(range(40, 51), 2000)}, slice(0, 33)) == []
+
+def test_ids_continue_across_segments():
+    segments = plan_segments(0, 100, 2, 10)
+    # A: toute la vidéo (1 puis 7); B: premier segment seulement (4); C: apparaît dans le second (3)
+    people = {0: (0, 99, [1, 7]), 300: (10, 45, [4, 5]), 600: (60, 99, [2, 3])}
+    stitched = stitch_segments(segments, segment_results(segments, people), META)
+    # Comme en une passe: A et B gardent leurs identifiants, C reçoit le suivant du premier segment
+    assert list(stitched) == ['1', '4', '5']
+    np.testing.assert_array_equal(stitched['1']['frames'], np.arange(1, 101))
+    np.testing.assert_array_equal(stitched['4']['frames'], np.arange(11, 47))
+    np.testing.assert_array_equal(stitched['5']['frames'], np.arange(61, 101))
+    np.testing.assert_array_equal(stitched['1']['boxes'], person_track(range(100), 0)['boxes'])
+
+def test_segments_shorter_than_overlap():
+    segments = plan_segments(0, 20, 4, 10)
+    people = {0: (0, 19, [3, 5, 6, 9]), 500: (12, 19, [0, 0, 1, 2])}
+    stitched = stitch_segments(segments, segment_results(segments, people), META)
+    assert list(stitched) == ['3', '4']
+    np.testing.assert_array_equal(stitched['3']['frames'], np.arange(1, 21))
+    np.testing.assert_array_equal(stitched['4']['frames'], np.arange(13, 21))
@@ -0,0 +1,9 @@
+import pytest
+
+import pipeline_daemon
+
+@pytest.mark.parametrize("stage", ['smooth', 'rotations', 'export'])
+def test_failed_stage_raises(stage, tmp_path):
+    # Une étape qui échoue doit lever: le démon répond alors {'ok': False}
+    with pytest.raises(RuntimeError):
+        pipeline_daemon.STAGES[stage](input_path=str(tmp_path / "absent.motion"), output_path=str(tmp_path / "out.motion"))
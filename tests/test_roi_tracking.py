@@ -0,0 +1,51 @@
+from types import SimpleNamespace
+
+import numpy as np
+
+from roi_tracking import DetectionScheduler, landmark_box
+
+FRAME_SIZE = (640, 480)
+
+def pose(visibility=1.0):
+    """Pose factice: 33 landmarks répartis dans le crop, tous de la même visibilité."""
+    xs = np.linspace(0.25, 0.75, 33)
+    return SimpleNamespace(landmark=[SimpleNamespace(x=x, y=1.0 - x, visibility=visibility) for x in xs])
+
+def update(scheduler, track_id, landmarks=None):
+    scheduler.update(track_id, landmarks or pose(), (100, 50), (200, 300), FRAME_SIZE)
+
+def test_landmark_box():
+    box = landmark_box(pose(), (100, 50), (200, 300), FRAME_SIZE, margin=0.0)
+    np.testing.assert_array_equal(box, [150, 125, 250, 275])
+    assert landmark_box(pose(visibility=0.2), (100, 50), (200, 300), FRAME_SIZE) is None
+
+def test_propagates_updated_tracks():
+    scheduler = DetectionScheduler(detect_every=5)
+    assert scheduler.should_detect(1)
+    scheduler.detected(1, [1, 2], [[0, 0, 50, 50], [60, 60, 90, 90]])
+    update(scheduler, 1)
+    update(scheduler, 2)
+    assert not scheduler.should_detect(2)
+    track_ids, boxes = scheduler.propagated()
+    assert track_ids.tolist() == [1, 2]
+    np.testing.assert_array_equal(boxes[0], landmark_box(pose(), (100, 50), (200, 300), FRAME_SIZE))
+
+def test_ages_out_tracks_not_updated():
+    # Piste 2 écartée (filtrage) ou sautée (inférence adaptative): pas d'update, donc pas de boîte périmée
+    scheduler = DetectionScheduler(detect_every=5)
+    scheduler.detected(1, [1, 2], [[0, 0, 50, 50], [60, 60, 90, 90]])
+    update(scheduler, 1)
+    assert not scheduler.should_detect(2)
+    assert scheduler.propagated()[0].tolist() == [1]
+    # Image 2: la piste 1 n'est pas mise à jour non plus; plus aucune piste, la détection est relancée
+    assert scheduler.propagated()[0].tolist() == []
+    assert scheduler.should_detect(3)
+    assert scheduler.forced_calls == 1
+
+def test_lost_pose_forces_detection():
+    scheduler = DetectionScheduler(detect_every=5)
+    scheduler.detected(1, [1, 2], [[0, 0, 50, 50], [60, 60, 90, 90]])
+    update(scheduler, 1)
+    update(scheduler, 2, pose(visibility=0.1))
+    assert scheduler.should_detect(2)
+    assert scheduler.propagated()[0].tolist() == [1]
@@ -0,0 +1,92 @@
+import math
+import numpy as np
+import pytest
+from smoother import OneEuroArrayFilter, one_euro_smooth
+
+class ScalarOneEuroFilter:
+    """
+    Filtre One-Euro scalaire, avec la sémantique du paquet OneEuroFilter 0.2.1 (ancienne dépendance du lissage):
+    la dérivée est estimée à partir de la dernière valeur *filtrée* (lastFilteredValue), et la fréquence n'est
+    recalculée que si les deux timestamps sont non nuls et croissants.
+    """
+
+    def __init__(self, freq, mincutoff=1.0, beta=0.0, dcutoff=1.0, raw_derivative=False):
+        self.freq, self.mincutoff, self.beta, self.dcutoff = float(freq), float(mincutoff), float(beta), float(dcutoff)
+        self.raw_derivative = raw_derivative # Variante des autres implémentations: dérivée depuis la valeur brute précédente
+        self.x_prev = self.dx_prev = self.raw_prev = None
+        self.last_time = None
+
+    def _alpha(self, cutoff):
+        tau = 1.0 / (2 * math.pi * cutoff)
+        return 1.0 / (1.0 + tau * self.freq)
+
+    def __call__(self, x, timestamp):
+        if self.last_time and timestamp and timestamp > self.last_time:
+            self.freq = 1.0 / (timestamp - self.last_time)
+        self.last_time = timestamp
+        previous = self.raw_prev if self.raw_derivative else self.x_prev
+        dx = 0.0 if previous is None else (x - previous) * self.freq
+        self.raw_prev = x
+        alpha_d = self._alpha(self.dcutoff)
+        edx = dx if self.dx_prev is None else alpha_d * dx + (1.0 - alpha_d) * self.dx_prev
+        self.dx_prev = edx
+        alpha = self._alpha(self.mincutoff + self.beta * abs(edx))
+        self.x_prev = x if self.x_prev is None else alpha * x + (1.0 - alpha) * self.x_prev
+        return self.x_prev
+
+def scalar_smooth(values, timestamps, freq, mincutoff, beta, filter_class=ScalarOneEuroFilter, **options):
+    """Référence: un filtre scalaire par élément, qui n'est pas appelé quand l'élément vaut NaN."""
+    flat = values.reshape(len(values), -1)
+    smoothed = np.full(flat.shape, np.nan)
+    for j in range(flat.shape[1]):
+        one_euro = filter_class(freq, mincutoff=mincutoff, beta=beta, **options)
+        for i, timestamp in enumerate(timestamps):
+            if not np.isnan(flat[i, j]): smoothed[i, j] = one_euro(flat[i, j], timestamp)
+    return smoothed.reshape(values.shape)
+
+def noisy_track(n_frames=120, n_points=5, seed=0):
+    """Trajectoires bruitées (images, points, 3) aux numéros d'image irréguliers (à partir de 0), avec des images NaN."""
+    rng = np.random.default_rng(seed)
+    frames = np.concatenate([[0], np.cumsum(rng.integers(1, 4, n_frames - 1))])
+    t = frames[:, None, None] / 30.0
+    values = np.sin(2 * np.pi * 0.7 * t + rng.uniform(0, np.pi, (1, n_points, 3))) + rng.normal(0, 0.05, (n_frames, n_points, 3))
+    values[rng.random(n_frames) < 0.1] = np.nan                   # Images entières sans landmarks
+    values[rng.random((n_frames, n_points)) < 0.05] = np.nan      # Points manquants
+    return frames, values
+
+@pytest.mark.parametrize("mincutoff, beta", [(1.0, 0.0), (0.5, 0.7), (2.0, 5.0)])
+def test_matches_scalar_filter(mincutoff, beta):
+    frames, values = noisy_track()
+    timestamps = frames / 30.0
+    expected = scalar_smooth(values, timestamps, 30.0, mincutoff, beta)
+    smoothed = one_euro_smooth(values, timestamps, 30.0, mincutoff, beta)
+    np.testing.assert_array_equal(np.isnan(smoothed), np.isnan(values))
+    np.testing.assert_allclose(smoothed, expected, rtol=0, atol=1e-12, equal_nan=True)
+
+def test_matches_onefilter_package():
+    """Même comparaison avec le paquet OneEuroFilter lui-même, s'il est installé."""
+    package = pytest.importorskip("OneEuroFilter")
+    frames, values = noisy_track(seed=1)
+    timestamps = frames / 30.0
+    expected = scalar_smooth(values, timestamps, 30.0, 0.5, 0.7, filter_class=package.OneEuroFilter)
+    np.testing.assert_allclose(one_euro_smooth(values, timestamps, 30.0, 0.5, 0.7), expected, rtol=0, atol=1e-12, equal_nan=True)
+
+def test_derivative_uses_filtered_value():
+    """Avec beta > 0, les deux sémantiques de la dérivée divergent: le lissage suit celle de OneEuroFilter 0.2.1."""
+    frames, values = noisy_track(seed=2)
+    timestamps = frames / 30.0
+    smoothed = one_euro_smooth(values, timestamps, 30.0, 1.0, 1.0)
+    raw_variant = scalar_smooth(values, timestamps, 30.0, 1.0, 1.0, raw_derivative=True)
+    assert np.nanmax(np.abs(smoothed - raw_variant)) > 1e-3
+    np.testing.assert_allclose(smoothed, scalar_smooth(values, timestamps, 30.0, 1.0, 1.0), rtol=0, atol=1e-12, equal_nan=True)
+
+def test_state_untouched_by_nan():
+    """Un élément à NaN ne change pas l'état du filtre: la suite est celle d'un filtre qui n'aurait pas été appelé."""
+    one_euro = OneEuroArrayFilter((2,), 30.0, mincutoff=1.0, beta=0.5)
+    one_euro(np.array([0.0, 0.0]), 1 / 30.0)
+    out = one_euro(np.array([np.nan, 1.0]), 2 / 30.0)
+    assert np.isnan(out[0])
+    out = one_euro(np.array([1.0, 1.0]), 3 / 30.0)
+    reference = ScalarOneEuroFilter(30.0, mincutoff=1.0, beta=0.5)
+    reference(0.0, 1 / 30.0)
+    assert out[0] == pytest.approx(reference(1.0, 3 / 30.0), abs=1e-15)
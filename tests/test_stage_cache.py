@@ -0,0 +1,83 @@
+import argparse
+import itertools
+
+import numpy as np
+import pytest
+
+import stage_cache
+from motion_io import landmarks_meta, load_motion, profile_groups
+from run_pipeline import stage_keys
+from stage_cache import StageCache
+
+def pipeline_args(**overrides):
+    args = dict(skip_extraction=False, skip_smoothing=False, conf=0.4, start_time=None, end_time=None, workers=1,
+                extraction_profile='pose', model_complexity=2, detect_every=1, sample_fps=None, gating=None,
+                detector={'backend': 'ultralytics', 'model': None, 'threads': 0}, mincutoff=1.0, beta=0.0, key_tolerance=None)
+    args.update(overrides)
+    return argparse.Namespace(**args, input_video=None)
+
+@pytest.fixture
+def video(tmp_path):
+    path = tmp_path / "video.mp4"
+    path.write_bytes(b"contenu de la video")
+    return str(path)
+
+@pytest.fixture
+def clock(monkeypatch):
+    # Horloge strictement croissante: l'ordre LRU ne dépend pas de la résolution de time.time()
+    ticks = itertools.count(1000)
+    monkeypatch.setattr(stage_cache.time, 'time', lambda: float(next(ticks)))
+
+def keys_for(cache, video, **overrides):
+    args = pipeline_args(**overrides)
+    args.input_video = video
+    return stage_keys(args, {}, cache)
+
+def test_smoothing_params_invalidate_only_downstream_keys(tmp_path, video):
+    cache = StageCache(str(tmp_path / "cache"), 10**9)
+    base = keys_for(cache, video)
+    smoothing = keys_for(cache, video, mincutoff=2.0)
+    assert smoothing['raw'] == base['raw']
+    assert smoothing['smoothed'] != base['smoothed'] and smoothing['rotations'] != base['rotations']
+    reduction = keys_for(cache, video, key_tolerance=0.5)
+    assert (reduction['raw'], reduction['smoothed']) == (base['raw'], base['smoothed'])
+    assert reduction['rotations'] != base['rotations']
+    extraction = keys_for(cache, video, conf=0.5)
+    assert all(extraction[stage] != base[stage] for stage in base)
+    # Les threads du détecteur ne changent pas les détections
+    assert keys_for(cache, video, detector={'backend': 'ultralytics', 'model': None, 'threads': 4}) == base
+
+def test_video_content_changes_keys(tmp_path, video):
+    cache = StageCache(str(tmp_path / "cache"), 10**9)
+    base = keys_for(cache, video)
+    with open(video, 'ab') as f: f.write(b"!")
+    assert keys_for(cache, video)['raw'] != base['raw']
+
+def entry(n_frames=50):
+    meta = landmarks_meta(profile_groups('pose'), fps=30.0)
+    landmarks = np.random.default_rng(n_frames).random((n_frames, 33, 4)).astype(np.float32)
+    return {'1': {'frames': np.arange(n_frames, dtype=np.int32), 'landmarks': landmarks}}, meta
+
+def test_put_get_round_trip(tmp_path, clock):
+    cache = StageCache(str(tmp_path / "cache"), 10**9)
+    assert cache.get('a') is None
+    tracks, meta = entry()
+    cache.put('a', 'raw', tracks, meta)
+    loaded, _ = load_motion(cache.get('a'))
+    np.testing.assert_array_equal(loaded['1']['landmarks'], tracks['1']['landmarks'])
+    assert (cache.index['hits'], cache.index['misses']) == (1, 1)
+
+def test_lru_eviction(tmp_path, clock):
+    directory = str(tmp_path / "cache")
+    cache = StageCache(directory, 10**9)
+    cache.put('a', 'raw', *entry())
+    size = cache.index['entries']['a']['size']
+    cache = StageCache(directory, int(2.5 * size))
+    cache.put('b', 'smoothed', *entry())
+    assert cache.get('a') is not None # 'a' devient la plus récemment utilisée
+    cache.put('c', 'rotations', *entry())
+    assert set(cache.index['entries']) == {'a', 'c'}
+    assert cache.get('b') is None
+    # Une taille maximale réduite évince dès l'ouverture, index relu depuis le disque
+    cache = StageCache(directory, size)
+    assert set(cache.index['entries']) == {'c'}
@@ -0,0 +1,65 @@
+import numpy as np
+import pytest
+
+from track_gating import GATING_DEFAULTS, TrackGate, gating_command_args
+
+FRAME = (100, 100)
+
+def box(size, x=0):
+    return [x, 0, x + size, size]
+
+def test_defaults_do_not_filter():
+    assert TrackGate.from_options(None) is None
+    assert TrackGate.from_options(dict(GATING_DEFAULTS)) is None
+    assert TrackGate.from_options({'min_area': 0.05}).min_area == 0.05
+
+def test_unknown_rank_is_rejected():
+    with pytest.raises(ValueError):
+        TrackGate(rank_by='confidence')
+
+def test_small_boxes_are_skipped():
+    gate = TrackGate(min_area=0.05)
+    # 20x20 = 4% de l'image, 30x30 = 9%
+    keep = gate.select([1, 2], [box(20), box(30)], FRAME)
+    assert keep.tolist() == [False, True]
+    assert gate.skipped['area'] == 1 and gate.processed == 1
+
+def test_young_tracks_wait_for_min_age():
+    gate = TrackGate(min_age=3)
+    assert gate.select([1], [box(10)], FRAME).tolist() == [False]
+    assert gate.select([1, 2], [box(10), box(10, 50)], FRAME).tolist() == [False, False]
+    assert gate.select([1, 2], [box(10), box(10, 50)], FRAME).tolist() == [True, False]
+    assert gate.skipped['age'] == 4 and gate.processed == 1
+
+def test_max_tracks_keeps_largest_boxes():
+    gate = TrackGate(max_tracks=2)
+    keep = gate.select([1, 2, 3], [box(10), box(30, 20), box(20, 60)], FRAME)
+    assert keep.tolist() == [False, True, True]
+    assert gate.skipped['rank'] == 1
+
+def test_max_tracks_keeps_oldest_tracks():
+    gate = TrackGate(max_tracks=1, rank_by='age')
+    gate.select([2], [box(10)], FRAME)
+    keep = gate.select([1, 2], [box(50), box(10, 60)], FRAME)
+    assert keep.tolist() == [False, True]
+
+def test_rank_ties_keep_detector_order():
+    gate = TrackGate(max_tracks=2)
+    keep = gate.select([5, 3, 4], [box(10), box(10, 20), box(10, 40)], FRAME)
+    assert keep.tolist() == [True, True, False]
+
+def test_allowlist_is_applied_before_other_filters():
+    gate = TrackGate(min_area=0.05, track_ids=[2, 3])
+    keep = gate.select([1, 2, 3], [box(50), box(10, 40), box(30, 60)], FRAME)
+    assert keep.tolist() == [False, False, True]
+    # Chaque crop écarté n'est compté qu'une fois, pour le premier critère qui l'écarte
+    assert gate.skipped == {'area': 1, 'age': 0, 'rank': 0, 'ids': 1}
+
+def test_empty_frame():
+    gate = TrackGate(min_area=0.05, max_tracks=1)
+    keep = gate.select(np.zeros(0, dtype=int), np.zeros((0, 4)), FRAME)
+    assert keep.shape == (0,) and gate.processed == 0
+
+def test_command_args_list_only_non_default_options():
+    options = dict(GATING_DEFAULTS, min_age=3, track_ids=[4, 7])
+    assert gating_command_args(options) == ["--min_track_age", "3", "--track_ids", "4", "7"]
@@ -0,0 +1,57 @@
+import numpy as np
+
+from calculate_rotations import compute_rotations
+from motion_io import landmarks_meta, profile_groups
+from smoother import smooth_tracks
+from track_pool import SharedArrays, map_tracks
+
+def landmark_tracks(lengths=(120, 7, 60, 1), seed=0):
+    """Pistes de longueurs différentes, avec des trous dans les numéros d'image et des landmarks NaN."""
+    rng = np.random.default_rng(seed)
+    meta = landmarks_meta(profile_groups('pose'), fps=30.0, columns=['times'])
+    tracks = {}
+    for track_id, n in enumerate(lengths, start=1):
+        frames = np.cumsum(rng.integers(1, 3, n)).astype(np.int32)
+        landmarks = (rng.normal(size=(n, 33, 4)) * 0.3).astype(np.float32)
+        landmarks[rng.random(n) < 0.1, 5] = np.nan
+        tracks[str(track_id)] = {'frames': frames, 'landmarks': landmarks, 'times': frames * 1000.0 / 30.0}
+    return tracks, meta
+
+def _scale(inputs, outputs, factor):
+    outputs['values'][...] = inputs['values'] * factor
+    return float(inputs['values'].sum())
+
+def assert_same(parallel, serial):
+    assert list(parallel) == list(serial)
+    for track_id, track in serial.items():
+        for column, values in track.items():
+            np.testing.assert_array_equal(parallel[track_id][column], values, err_msg=f"{track_id}.{column}")
+
+def test_shared_arrays_round_trip():
+    arrays = {('1', 'a'): np.arange(10, dtype=np.int32), ('1', 'b'): np.ones((3, 4), dtype=np.float32)}
+    shared = SharedArrays.from_arrays(arrays)
+    try:
+        for key, values in arrays.items():
+            np.testing.assert_array_equal(shared.copy(key), values)
+            assert shared.copy(key).dtype == values.dtype
+    finally:
+        shared.close()
+
+def test_map_tracks_parallel_equals_serial():
+    tracks = {str(i): {'values': np.arange(i * 5, dtype=np.float64)} for i in range(1, 5)}
+    specs = lambda track: {'values': (track['values'].shape, np.float64)}
+    serial = map_tracks(_scale, tracks, ['values'], specs, workers=1, factor=2.0)
+    parallel = map_tracks(_scale, tracks, ['values'], specs, workers=3, factor=2.0)
+    assert list(parallel) == list(tracks)
+    for track_id in tracks:
+        np.testing.assert_array_equal(parallel[track_id][0]['values'], serial[track_id][0]['values'])
+        assert parallel[track_id][1] == serial[track_id][1]
+
+def test_smoothing_and_rotations_independent_of_workers():
+    tracks, meta = landmark_tracks()
+    smoothed, smoothed_meta = smooth_tracks(tracks, meta, mincutoff=1.0, beta=0.1, workers=1)
+    smoothed_parallel, _ = smooth_tracks(tracks, meta, mincutoff=1.0, beta=0.1, workers=2)
+    assert_same(smoothed_parallel, smoothed)
+    rotations, _ = compute_rotations(smoothed, smoothed_meta, key_tolerance=0.5, workers=1)
+    rotations_parallel, _ = compute_rotations(smoothed, smoothed_meta, key_tolerance=0.5, workers=2)
+    assert_same(rotations_parallel, rotations)
@@ -0,0 +1,67 @@
+import numpy as np
+
+from adaptive_sampling import KeyframeInterpolator
+from motion_io import landmarks_meta, load_motion, profile_groups
+from track_store import TrackStore
+
+N_FRAMES = 30
+CHECKPOINT_EVERY = 9
+
+def make_meta():
+    return landmarks_meta(profile_groups('pose'), fps=30.0, columns=['boxes', 'inferred', 'times'], frame_range=[0, N_FRAMES])
+
+def events(frame_num):
+    """Résultats d'une image: piste 1 inférée une image sur 3 (sautée sinon), piste 2 inférée à partir de l'image 10."""
+    rng = np.random.default_rng(frame_num)
+    if frame_num % 3 == 1: yield 'key', '1', rng.random((33, 4)).astype(np.float32)
+    else: yield 'skip', '1', None
+    if frame_num >= 10: yield 'key', '2', rng.random((33, 4)).astype(np.float32)
+
+def extract(store, interpolator, first, last):
+    """Comme extract_tracks: images first..last, checkpoint (avec l'état de l'interpolation) toutes les CHECKPOINT_EVERY images."""
+    for frame_num in range(first, last + 1):
+        time_ms = frame_num * 1000.0 / 30.0
+        for kind, track_id, landmarks in events(frame_num):
+            box = [frame_num, 0, frame_num + 10, 10]
+            if kind == 'key': interpolator.keyframe(track_id, frame_num, time_ms, box, landmarks)
+            else: interpolator.skipped(track_id, frame_num, time_ms, box)
+        if frame_num % CHECKPOINT_EVERY == 0:
+            store.checkpoint(frame_num, {'interpolator': interpolator.get_state()})
+
+def run(store, state=None, first=1, last=N_FRAMES, finish=True):
+    interpolator = KeyframeInterpolator(store.append, error_slice=slice(0, 33))
+    if state: interpolator.set_state(state['interpolator'])
+    extract(store, interpolator, first, last)
+    if not finish: return None
+    interpolator.finish()
+    return store.finish(make_meta())
+
+def assert_same_tracks(tracks, expected):
+    assert list(tracks) == list(expected)
+    for track_id, track in expected.items():
+        for column, values in track.items():
+            np.testing.assert_array_equal(np.asarray(tracks[track_id][column]), np.asarray(values), err_msg=f"{track_id}.{column}")
+
+def test_in_memory_matches_file(tmp_path):
+    in_memory, _ = run(TrackStore(list(make_meta()['arrays'])))
+    on_disk, _ = run(TrackStore.create(str(tmp_path / "raw.motion"), make_meta()))
+    assert_same_tracks(on_disk, in_memory)
+    # Images sautées interpolées entre les clés, sans trou
+    np.testing.assert_array_equal(in_memory['1']['frames'], np.arange(1, N_FRAMES + 1))
+    np.testing.assert_array_equal(in_memory['1']['inferred'][:4], [1, 0, 0, 1])
+
+def test_resume_mid_stream(tmp_path):
+    expected, _ = run(TrackStore(list(make_meta()['arrays'])))
+    path = str(tmp_path / "raw.motion")
+    # Extraction interrompue à l'image 21: les images après le checkpoint de l'image 18 sont perdues
+    run(TrackStore.create(path, make_meta()), last=21, finish=False)
+    partial, _ = load_motion(path)
+    assert partial['1']['frames'].max() == 16
+
+    store, checkpoint, state = TrackStore.resume(path)
+    assert checkpoint['frame'] == 18
+    # Les images 17 et 18 de la piste 1, sautées, attendent la clé 19 dans l'état de l'interpolation
+    assert [pending[0] for pending in state['interpolator']['pending']['1']] == [17, 18]
+    tracks, _ = run(store, state, first=checkpoint['frame'] + 1)
+    assert_same_tracks(tracks, expected)
+    assert TrackStore.resume(path)[1] is None # Terminé: rien à reprendre
@@ -0,0 +1,95 @@
+import logging
+import numpy as np
+
+# Filtrage des pistes avant l'inférence MediaPipe: les boîtes ByteTrack trop petites (personnes au loin),
+# trop récentes (fausses pistes qui ne durent que quelques images), hors des K premières, ou absentes
+# d'une liste d'identifiants ne reçoivent pas d'inférence. Les options sont un dict JSON (démon, cache).
+
+GATING_DEFAULTS = {
+    'min_area': 0.0,   # Aire minimale de la boîte, en fraction de l'image
+    'min_age': 1,      # Images où la piste a été vue avant d'être inférée (1: dès la première)
+    'max_tracks': 0,   # Nombre maximal de pistes inférées par image (0: pas de limite)
+    'rank_by': 'area', # Classement pour max_tracks: 'area' (plus grandes boîtes) ou 'age' (pistes les plus anciennes)
+    'track_ids': None, # Liste des identifiants de pistes autorisés (None: toutes)
+}
+
+class TrackGate:
+    """Choisit, à chaque image, les pistes dont le crop est inféré, et compte les crops inférés et écartés."""
+
+    def __init__(self, min_area=0.0, min_age=1, max_tracks=0, rank_by='area', track_ids=None):
+        if rank_by not in ('area', 'age'): raise ValueError(f"Classement inconnu: {rank_by} (attendu: area, age)")
+        self.min_area = min_area
+        self.min_age = max(1, min_age)
+        self.max_tracks = max_tracks
+        self.rank_by = rank_by
+        self.track_ids = None if track_ids is None else {int(t) for t in track_ids}
+        self.age = {}  # piste -> nombre d'images où elle a été vue
+        self.processed = 0
+        self.skipped = {'area': 0, 'age': 0, 'rank': 0, 'ids': 0}
+
+    @classmethod
+    def from_options(cls, options):
+        """Filtre décrit par un dict d'options (voir GATING_DEFAULTS), ou None si aucune option ne filtre."""
+        options = dict(GATING_DEFAULTS, **(options or {}))
+        if options == GATING_DEFAULTS: return None
+        return cls(**options)
+
+    def select(self, track_ids, boxes, frame_size):
+        """Masque des pistes (track_ids, boxes (n, 4) en pixels) à inférer dans une image de frame_size (largeur, hauteur)."""
+        track_ids = np.asarray(track_ids, dtype=int)
+        boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+        for track_id in track_ids.tolist(): self.age[track_id] = self.age.get(track_id, 0) + 1
+        ages = np.array([self.age[t] for t in track_ids.tolist()], dtype=int)
+        areas = np.clip(boxes[:, 2] - boxes[:, 0], 0, None) * np.clip(boxes[:, 3] - boxes[:, 1], 0, None) / float(np.prod(frame_size))
+
+        keep = np.ones(len(track_ids), dtype=bool)
+        for reason, rejected in (('ids', np.array([self.track_ids is not None and t not in self.track_ids for t in track_ids.tolist()], dtype=bool)),
+                                 ('area', areas < self.min_area), ('age', ages < self.min_age)):
+            self.skipped[reason] += int((keep & rejected).sum())
+            keep &= ~rejected
+        if self.max_tracks and keep.sum() > self.max_tracks:
+            candidates = np.flatnonzero(keep)
+            score = areas[candidates] if self.rank_by == 'area' else ages[candidates]
+            # Tri stable: à égalité, l'ordre du détecteur
+            dropped = candidates[np.argsort(-score, kind='stable')[self.max_tracks:]]
+            keep[dropped] = False
+            self.skipped['rank'] += len(dropped)
+        self.processed += int(keep.sum())
+        return keep
+
+    def __str__(self):
+        skipped = sum(self.skipped.values())
+        total = self.processed + skipped
+        ratio = skipped / total if total else 0.0
+        reasons = ", ".join(f"{count} {name}" for name, count in (("trop petits", self.skipped['area']), ("pistes trop récentes", self.skipped['age']),
+                                                                   ("hors des premières pistes", self.skipped['rank']), ("hors liste", self.skipped['ids'])) if count)
+        return f"Filtrage des pistes: {self.processed}/{total} crops inférés, {skipped} écartés ({ratio:.0%}{': ' + reasons if reasons else ''})"
+
+    def log_stats(self):
+        logging.info(str(self))
+
+def add_gating_arguments(parser):
+    """Options de filtrage des pistes, communes aux CLI d'extraction."""
+    parser.add_argument("--min_box_area", type=float, default=GATING_DEFAULTS['min_area'],
+                        help="N'infère pas les pistes dont la boîte couvre moins de cette fraction de l'image (ex: 0.01).")
+    parser.add_argument("--min_track_age", type=int, default=GATING_DEFAULTS['min_age'],
+                        help="N'infère une piste qu'après l'avoir vue sur N images (écarte les fausses pistes éphémères).")
+    parser.add_argument("--max_tracks", type=int, default=GATING_DEFAULTS['max_tracks'], help="N'infère que les N premières pistes de chaque image (0: toutes).")
+    parser.add_argument("--rank_tracks_by", default=GATING_DEFAULTS['rank_by'], choices=["area", "age"],
+                        help="Classement pour --max_tracks: plus grandes boîtes, ou pistes les plus anciennes.")
+    parser.add_argument("--track_ids", type=int, nargs="+", default=GATING_DEFAULTS['track_ids'], help="N'infère que ces identifiants de pistes ByteTrack.")
+
+def gating_options(args):
+    """Dict d'options de filtrage (voir GATING_DEFAULTS) à partir des arguments de add_gating_arguments."""
+    return {'min_area': args.min_box_area, 'min_age': args.min_track_age, 'max_tracks': args.max_tracks,
+            'rank_by': args.rank_tracks_by, 'track_ids': args.track_ids}
+
+GATING_FLAGS = {'min_area': "--min_box_area", 'min_age': "--min_track_age", 'max_tracks': "--max_tracks", 'rank_by': "--rank_tracks_by", 'track_ids': "--track_ids"}
+
+def gating_command_args(options):
+    """Arguments de ligne de commande reproduisant un dict d'options (seulement celles qui diffèrent des valeurs par défaut)."""
+    args = []
+    for key, value in (options or {}).items():
+        if value == GATING_DEFAULTS[key]: continue
+        args += [GATING_FLAGS[key]] + ([str(v) for v in value] if isinstance(value, (list, tuple)) else [str(value)])
+    return args
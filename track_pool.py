@@ -0,0 +1,98 @@
+import logging
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+import numpy as np
+
+# Post-traitement des pistes (lissage, rotations, réduction des clés) réparti sur un pool de processus.
+# Les pistes sont indépendantes: chaque processus traite des pistes entières. Les colonnes des pistes
+# sont copiées une fois dans un bloc de mémoire partagée, que les processus rattachent par son nom
+# (sans sérialiser les tableaux); ils écrivent leurs résultats sur place dans un second bloc, préalloué.
+
+ALIGNMENT = 64
+
+class SharedArrays:
+    """Tableaux numpy (clé -> tableau) réunis dans un seul bloc de mémoire partagée."""
+
+    def __init__(self, specs, arrays=None):
+        """specs: clé -> (forme, dtype). arrays (optionnel): clé -> valeurs initiales à copier."""
+        self.layout, size = {}, 0
+        for key, (shape, dtype) in specs.items():
+            dtype = np.dtype(dtype)
+            self.layout[key] = (size, tuple(int(n) for n in shape), dtype.str)
+            size += -(-int(np.prod(shape, dtype=np.int64)) * dtype.itemsize // ALIGNMENT) * ALIGNMENT
+        self.shm = shared_memory.SharedMemory(create=True, size=max(size, 1))
+        self.arrays = _views(self.shm, self.layout)
+        for key, values in (arrays or {}).items():
+            self.arrays[key][...] = values
+
+    @classmethod
+    def from_arrays(cls, arrays):
+        arrays = {key: np.asarray(values) for key, values in arrays.items()}
+        return cls({key: (values.shape, values.dtype) for key, values in arrays.items()}, arrays)
+
+    @property
+    def spec(self):
+        """Ce qu'un autre processus doit recevoir pour rattacher le bloc (quelques octets)."""
+        return self.shm.name, self.layout
+
+    def copy(self, key):
+        return np.array(self.arrays[key])
+
+    def close(self):
+        self.arrays = None
+        self.shm.close()
+        self.shm.unlink()
+
+def _views(shm, layout):
+    return {key: np.ndarray(shape, dtype=np.dtype(dtype), buffer=shm.buf, offset=offset) for key, (offset, shape, dtype) in layout.items()}
+
+def _attach(spec):
+    name, layout = spec
+    shm = shared_memory.SharedMemory(name=name)
+    return shm, _views(shm, layout)
+
+def _run_task(task, track_id, input_spec, output_spec, columns, output_columns, kwargs):
+    """Point d'entrée d'un processus: applique task à une piste, directement dans la mémoire partagée."""
+    input_shm, inputs = _attach(input_spec)
+    output_shm, outputs = _attach(output_spec)
+    try:
+        return task({c: inputs[track_id, c] for c in columns}, {c: outputs[track_id, c] for c in output_columns}, **kwargs)
+    finally:
+        del inputs, outputs # Les vues doivent disparaître avant de fermer les blocs
+        input_shm.close()
+        output_shm.close()
+
+def map_tracks(task, tracks, columns, output_specs, workers=1, **kwargs):
+    """
+    Applique task(inputs, outputs, **kwargs) à chaque piste. inputs: colonnes columns de la piste; outputs:
+    tableaux préalloués output_specs(track) -> {colonne: (forme, dtype)}, que task remplit sur place. task doit
+    être une fonction de module (importable par les processus). Retourne {piste: (outputs, retour de task)},
+    dans l'ordre des pistes. Avec workers <= 1 ou une seule piste, tout s'exécute dans le processus courant.
+    """
+    specs = {track_id: output_specs(track) for track_id, track in tracks.items()}
+    workers = min(workers or os.cpu_count() or 1, len(tracks))
+    if workers <= 1:
+        results = {}
+        for track_id, track in tracks.items():
+            outputs = {c: np.empty(shape, dtype=dtype) for c, (shape, dtype) in specs[track_id].items()}
+            results[track_id] = (outputs, task({c: track[c] for c in columns}, outputs, **kwargs))
+        return results
+
+    inputs = SharedArrays.from_arrays({(track_id, c): track[c] for track_id, track in tracks.items() for c in columns})
+    outputs = None
+    try:
+        outputs = SharedArrays({(track_id, c): spec for track_id, track_specs in specs.items() for c, spec in track_specs.items()})
+        logging.info(f"Traitement de {len(tracks)} pistes sur {workers} processus.")
+        context = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context) as executor:
+            # Les pistes les plus longues d'abord, pour que la dernière à finir soit courte
+            order = sorted(tracks, key=lambda track_id: -len(tracks[track_id][columns[0]]))
+            futures = {track_id: executor.submit(_run_task, task, track_id, inputs.spec, outputs.spec, columns, list(specs[track_id]), kwargs)
+                       for track_id in order}
+            returned = {track_id: futures[track_id].result() for track_id in tracks}
+        return {track_id: ({c: outputs.copy((track_id, c)) for c in specs[track_id]}, returned[track_id]) for track_id in tracks}
+    finally:
+        inputs.close()
+        if outputs is not None: outputs.close()
@@ -0,0 +1,112 @@
+import os
+import glob
+import pickle
+import logging
+import numpy as np
+from motion_io import META_FILE, MotionWriter, load_motion
+
+# Stockage des pistes pendant l'extraction. Sans fichier de sortie, les images restent en mémoire
+# (mode intégré du pipeline). Avec un fichier .motion, elles sont ajoutées au disque à chaque
+# checkpoint, et le meta.json référence un fichier d'état (tracker, échantillonnage adaptatif,
+# interpolation en cours) qui permet de reprendre l'extraction après l'image du checkpoint.
+
+class TrackStore:
+    """Accumule les images des pistes, en mémoire ou par morceaux dans un fichier .motion."""
+
+    def __init__(self, columns, writer=None):
+        self.columns = columns
+        self.writer = writer
+        self.buffers = {}  # piste -> liste de morceaux par colonne
+
+    @classmethod
+    def create(cls, path, meta):
+        """Nouveau fichier de sortie, lisible (vide) dès sa création."""
+        writer = MotionWriter(path, meta)
+        writer.meta['checkpoint'] = {'frame': meta['frame_range'][0], 'state_file': None}
+        writer.flush()
+        store = cls(list(meta['arrays']), writer)
+        store._remove_states()
+        return store
+
+    @classmethod
+    def resume(cls, path):
+        """
+        Rouvre un fichier interrompu. Retourne (store, checkpoint, état), avec checkpoint None si
+        l'extraction était terminée, ou None s'il n'y a pas de fichier à reprendre.
+        """
+        if not os.path.exists(os.path.join(path, META_FILE)): return None
+        writer = MotionWriter.reopen(path)
+        checkpoint = writer.meta.get('checkpoint')
+        if not checkpoint: return cls(list(writer.meta['arrays']), writer), None, None
+        state = None
+        if checkpoint.get('state_file'):
+            with open(os.path.join(path, checkpoint['state_file']), 'rb') as f:
+                state = pickle.load(f)
+        return cls(list(writer.meta['arrays']), writer), checkpoint, state
+
+    def append(self, track_id, *values):
+        if track_id not in self.buffers: self.buffers[track_id] = tuple([] for _ in self.columns)
+        for chunks, value in zip(self.buffers[track_id], values): chunks.append(np.asarray(value))
+
+    def _concatenated(self, track_chunks):
+        return {column: np.concatenate(chunks) for column, chunks in zip(self.columns, track_chunks) if chunks}
+
+    def _flush(self):
+        # Uniquement avec un checkpoint ou à la fin: les lignes du meta.json correspondent toujours à son checkpoint
+        for track_id, track_chunks in self.buffers.items():
+            if track_chunks[0]: self.writer.append(track_id, **self._concatenated(track_chunks))
+        self.buffers = {}
+
+    def checkpoint(self, frame_num, state):
+        """Écrit les images en attente puis l'état permettant de reprendre après frame_num."""
+        if self.writer is None: return
+        self._flush()
+        state_file = f"checkpoint_{frame_num}.pkl"
+        tmp_path = os.path.join(self.writer.path, state_file + '.tmp')
+        with open(tmp_path, 'wb') as f: pickle.dump(state, f)
+        os.replace(tmp_path, os.path.join(self.writer.path, state_file))
+        self.writer.meta['checkpoint'] = {'frame': int(frame_num), 'state_file': state_file}
+        self.writer.flush()
+        self._remove_states(keep=state_file)
+
+    def _remove_states(self, keep=None):
+        for old in glob.glob(os.path.join(self.writer.path, "checkpoint_*.pkl")):
+            if os.path.basename(old) != keep: os.remove(old)
+
+    def finish(self, meta):
+        """Termine le stockage et retourne (tracks, meta): tableaux en mémoire, ou np.memmap sur le fichier écrit."""
+        if self.writer is None:
+            return {str(k): self._concatenated(chunks) for k, chunks in self.buffers.items()}, meta
+        self._flush()
+        self.writer.meta['checkpoint'] = None
+        self.writer.meta.update(meta)
+        self.writer.flush()
+        self._remove_states()
+        return load_motion(self.writer.path)
+
+def get_tracker_state(yolo_model):
+    """État sérialisé des trackers ultralytics (pistes actives et compteur d'identifiants), ou None."""
+    trackers = getattr(getattr(yolo_model, 'predictor', None), 'trackers', None)
+    if not trackers: return None
+    from ultralytics.trackers.basetrack import BaseTrack
+    try:
+        return pickle.dumps({'trackers': trackers, 'next_id': BaseTrack._count})
+    except Exception as e:
+        logging.warning(f"État du tracker non sauvegardable: {e}")
+        return None
+
+def set_tracker_state(yolo_model, state):
+    """Restaure l'état sauvegardé par get_tracker_state (le predictor doit déjà exister)."""
+    if state is None: return False
+    from ultralytics.trackers.basetrack import BaseTrack
+    saved = pickle.loads(state)
+    yolo_model.predictor.trackers = saved['trackers']
+    BaseTrack._count = saved['next_id']
+    return True
+
+def reset_tracker(yolo_model):
+    """Remet à zéro les trackers d'un modèle déjà utilisé (pistes et compteur d'identifiants), pour une nouvelle vidéo."""
+    trackers = getattr(getattr(yolo_model, 'predictor', None), 'trackers', None)
+    from ultralytics.trackers.basetrack import BaseTrack
+    for tracker in trackers or []: tracker.reset()
+    BaseTrack.reset_id()
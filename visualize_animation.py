@@ -1,9 +1,11 @@
-import json
 import argparse
 import logging
+import os
 import numpy as np
 import matplotlib.pyplot as plt
-from matplotlib.animation import FuncAnimation
+from matplotlib.animation import FuncAnimation, FFMpegWriter, PillowWriter
+from mpl_toolkits.mplot3d.art3d import Line3DCollection
+from motion_io import load_motion, group_slices
 
 def setup_logging():
     logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s', datefmt='%Y-%m-%d %H:%M:%S')
@@ -15,76 +17,137 @@ POSE_CONNECTIONS = [
     (23, 25), (25, 27), (27, 29), (27, 31), (24, 26), (26, 28), (28, 30),
     (28, 32), (31, 32)
 ]
+CONNECTION_STARTS, CONNECTION_ENDS = (np.array(side) for side in zip(*POSE_CONNECTIONS))
 
-def visualize_animation(input_path):
+DEFAULT_FPS = 30.0
+BOUNDS_CHUNK = 4096 # Images lues à la fois pour calculer l'étendue de la scène
+
+def to_z_up(points):
+    """Inversion Y et Z pour une vue Z-up: Y devient -Z, Z devient Y."""
+    return (points * [1, 1, -1])[..., [0, 2, 1]]
+
+def scene_bounds(tracks, pose_slice):
+    """Étendue (min, max) des poses de toutes les pistes, lues par blocs d'images sans tout charger."""
+    lows, highs = [], []
+    for track in tracks.values():
+        for start in range(0, len(track['landmarks']), BOUNDS_CHUNK):
+            pose = to_z_up(np.asarray(track['landmarks'][start:start + BOUNDS_CHUNK, pose_slice, :3], dtype=np.float64))
+            pose = pose[~np.isnan(pose).any(axis=(1, 2))]
+            if len(pose):
+                lows.append(pose.min(axis=(0, 1)))
+                highs.append(pose.max(axis=(0, 1)))
+    if not lows: return None
+    return np.min(lows, axis=0), np.max(highs, axis=0)
+
+def timeline(tracks, stride):
+    """
+    Images affichées (une sur stride parmi celles de toutes les pistes), et pour chaque piste la ligne
+    correspondante de chaque image affichée (-1 si la piste n'a pas cette image).
+    """
+    frames = np.unique(np.concatenate([np.asarray(track['frames']) for track in tracks.values()]))[::stride]
+    rows = {}
+    for track_id, track in tracks.items():
+        track_frames = np.asarray(track['frames'])
+        index = np.clip(np.searchsorted(track_frames, frames), 0, max(len(track_frames) - 1, 0))
+        found = track_frames[index] == frames if len(track_frames) else np.zeros(len(frames), dtype=bool)
+        rows[track_id] = np.where(found, index, -1)
+    return frames, rows
+
+def visualize_animation(input_path, track_ids=None, output=None, size=(960, 720), stride=1):
     setup_logging()
     logging.info(f"Chargement des données depuis: {input_path}")
-    with open(input_path, 'r') as f:
-        data = json.load(f)
-
-    person_id = next(iter(data))
-    track_data = data[person_id]
-    logging.info(f"Visualisation de l'animation pour la personne ID: {person_id}")
-
-    all_x, all_y, all_z = [], [], []
-    frames_data = []
-    for frame_data in track_data:
-        if frame_data['landmarks'] and frame_data['landmarks'].get('pose'):
-            landmarks = frame_data['landmarks']['pose']
-            frames_data.append(landmarks)
-            for lm in landmarks:
-                all_x.append(lm['x'])
-                # Inversion Y et Z pour une vue Z-up
-                all_y.append(-lm['z']) # Y devient -Z
-                all_z.append(lm['y'])  # Z devient Y
-
-    fig = plt.figure(figsize=(10, 8))
+    tracks, meta = load_motion(input_path)
+    return visualize_tracks(tracks, meta, track_ids, output, size, stride)
+
+def visualize_tracks(tracks, meta, track_ids=None, output=None, size=(960, 720), stride=1):
+    """
+    Affiche l'animation de plusieurs pistes de landmarks (toutes par défaut), ou la rend hors écran dans un fichier
+    MP4 / GIF (output) de size pixels, une image sur stride. Chaque image n'est lue qu'au moment de son affichage.
+    """
+    pose_slice = group_slices(meta['groups'])['pose']
+    track_ids = [str(t) for t in track_ids] if track_ids else list(tracks)
+    tracks = {track_id: tracks[track_id] for track_id in track_ids if len(tracks[track_id]['frames'])}
+    bounds = scene_bounds(tracks, pose_slice)
+    if bounds is None:
+        logging.error("Aucune pose à afficher.")
+        return None
+    frames, rows = timeline(tracks, stride)
+    logging.info(f"Visualisation de {len(frames)} images pour les personnes ID: {', '.join(tracks)}")
+
+    if output: plt.switch_backend('Agg')
+    dpi = 100
+    fig = plt.figure(figsize=(size[0] / dpi, size[1] / dpi), dpi=dpi)
     ax = fig.add_subplot(111, projection='3d')
 
-    x_min, x_max = min(all_x), max(all_x)
-    y_min, y_max = min(all_y), max(all_y)
-    z_min, z_max = min(all_z), max(all_z)
-    
     # Rendre les axes cubiques
-    max_range = np.array([x_max-x_min, y_max-y_min, z_max-z_min]).max() / 2.0
-    mid_x = (x_max+x_min) * 0.5
-    mid_y = (y_max+y_min) * 0.5
-    mid_z = (z_max+z_min) * 0.5
-    ax.set_xlim(mid_x - max_range, mid_x + max_range)
-    ax.set_ylim(mid_y - max_range, mid_y + max_range)
-    ax.set_zlim(mid_z - max_range, mid_z + max_range)
-
+    low, high = bounds
+    mid, max_range = (high + low) * 0.5, (high - low).max() / 2.0
     ax.set_xlabel('X (Droite)')
     ax.set_ylabel('Y (Avant)')
     ax.set_zlabel('Z (Haut)')
-    ax.set_title(f"Animation 3D - Personne {person_id}")
+    ax.set_title(f"Animation 3D - Personnes {', '.join(tracks)}")
     ax.view_init(elev=15., azim=-75) # Angle de vue
 
+    # Artistes créés une seule fois, puis mis à jour sur place à chaque image
+    artists = {}
+    for k, track_id in enumerate(tracks):
+        color = plt.cm.tab10(k % 10)
+        # Segments initiaux non vides (add_collection3d ne gère pas une collection vide)
+        bones = Line3DCollection(np.broadcast_to(mid, (len(POSE_CONNECTIONS), 2, 3)), colors=[color], linewidths=2, label=f"Personne {track_id}")
+        ax.add_collection3d(bones)
+        joints, = ax.plot([], [], [], 'o', color=color, markersize=3)
+        artists[track_id] = (bones, joints)
+    ax.set_xlim(mid[0] - max_range, mid[0] + max_range)
+    ax.set_ylim(mid[1] - max_range, mid[1] + max_range)
+    ax.set_zlim(mid[2] - max_range, mid[2] + max_range)
+    ax.legend(loc='upper right')
+    label = ax.text2D(0.02, 0.95, "", transform=ax.transAxes)
+    all_artists = [artist for pair in artists.values() for artist in pair] + [label]
+
+    def init():
+        for bones, joints in artists.values():
+            bones.set_segments([])
+            joints.set_data_3d([], [], [])
+        return all_artists
+
     def animate(frame_index):
-        ax.cla()
-        landmarks = frames_data[frame_index]
-        # Inversion Y/Z et direction pour la visualisation
-        pts = np.array([[lm['x'], -lm['z'], lm['y']] for lm in landmarks])
-
-        ax.scatter(pts[:, 0], pts[:, 1], pts[:, 2], c='blue')
-
-        for i, j in POSE_CONNECTIONS:
-            if i < len(pts) and j < len(pts):
-                ax.plot([pts[i, 0], pts[j, 0]], [pts[i, 1], pts[j, 1]], [pts[i, 2], pts[j, 2]], 'r-')
-        
-        ax.set_xlim(mid_x - max_range, mid_x + max_range)
-        ax.set_ylim(mid_y - max_range, mid_y + max_range)
-        ax.set_zlim(mid_z - max_range, mid_z + max_range)
-        ax.set_xlabel('X (Droite)')
-        ax.set_ylabel('Y (Avant)')
-        ax.set_zlabel('Z (Haut)')
-        ax.set_title(f"Animation 3D - Personne {person_id} (Image {frame_index})")
-
-    anim = FuncAnimation(fig, animate, frames=len(frames_data), interval=33)
-    plt.show()
+        for track_id, (bones, joints) in artists.items():
+            row = rows[track_id][frame_index]
+            pts = to_z_up(np.asarray(tracks[track_id]['landmarks'][row, pose_slice, :3], dtype=np.float64)) if row >= 0 else None
+            if pts is None or np.isnan(pts).any():
+                bones.set_segments([])
+                joints.set_data_3d([], [], [])
+                continue
+            bones.set_segments(np.stack([pts[CONNECTION_STARTS], pts[CONNECTION_ENDS]], axis=1))
+            joints.set_data_3d(pts[:, 0], pts[:, 1], pts[:, 2])
+        label.set_text(f"Image {frames[frame_index]}")
+        return all_artists
+
+    # Cadence des images stockées (celle de l'analyse si la vidéo a été sous-échantillonnée)
+    fps = (meta.get('sample_fps') or meta.get('fps') or DEFAULT_FPS) / stride
+    anim = FuncAnimation(fig, animate, frames=len(frames), init_func=init, interval=1000.0 / fps, blit=True)
+    if not output:
+        plt.show()
+        return anim
+
+    writer = PillowWriter(fps=fps) if output.lower().endswith('.gif') else FFMpegWriter(fps=fps)
+    anim.save(output, writer=writer, dpi=dpi)
+    plt.close(fig)
+    logging.info(f"Animation rendue dans: {output}")
+    return output
+
+def parse_size(text):
+    width, height = text.lower().split('x')
+    return int(width), int(height)
 
 if __name__ == '__main__':
-    parser = argparse.ArgumentParser(description="Visualise une animation de squelette 3D à partir d'un fichier JSON.")
-    parser.add_argument("--input_json", required=True, help="Fichier JSON d'entrée (données lissées).")
+    parser = argparse.ArgumentParser(description="Visualise une animation de squelette 3D à partir d'un fichier de landmarks.")
+    parser.add_argument("--input", "--input_json", dest="input", required=True, help="Fichier d'entrée (données lissées, .motion ou .json).")
+    parser.add_argument("--tracks", nargs="+", default=None, help="Pistes à afficher (par défaut: toutes).")
+    parser.add_argument("--output", default=None, help="Rend l'animation hors écran dans ce fichier (.mp4 via ffmpeg, ou .gif) au lieu de l'afficher.")
+    parser.add_argument("--size", type=parse_size, default=(960, 720), help="Résolution du rendu, LARGEURxHAUTEUR en pixels.")
+    parser.add_argument("--stride", type=int, default=1, help="N'affiche qu'une image sur N.")
     args = parser.parse_args()
-    visualize_animation(args.input_json)
+    if args.output and os.path.dirname(args.output): os.makedirs(os.path.dirname(args.output), exist_ok=True)
+    if visualize_animation(args.input, args.tracks, args.output, args.size, args.stride) is None:
+        raise SystemExit(1)